@@ -0,0 +1,393 @@
+"""
+Load test for the profile, leaderboard and event code queries against a real Postgres with a synthetic population.
+
+    uv run python -m benchmarks.db_load postgresql://localhost/postgres --profiles 100000
+    uv run python -m benchmarks.db_load --profiles 1000000 --concurrency 32 --explain -k rank
+
+The DSN defaults to BENCH_DATABASE_URL. Everything is created in its own schema (ibi_bench unless --schema is given),
+which is dropped and seeded again on every run unless --reuse is passed, so never point --schema at real data.
+benchmarks/schema.sql and then every file in migrations/ are applied, so the indexes match production.
+
+Each workload calls the bot's own DB helpers through an AsyncConnectionPool from --concurrency tasks at once and
+reports latency percentiles, which include waiting for a connection. With --explain, the first query of each shape
+that a workload ran is explained with ANALYZE and BUFFERS afterwards, inside a transaction that is rolled back.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import math
+import os
+import random
+import re
+import statistics
+import string
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+# Importing the bot needs these, nothing connects to Discord
+os.environ.setdefault("TOKEN", "benchmark")
+os.environ.setdefault("OWNER_ID", "0")
+os.environ.setdefault("JWT_TOKEN", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import psycopg  # noqa: E402
+from psycopg import AsyncConnection, AsyncCursor, sql  # noqa: E402
+from psycopg_pool import AsyncConnectionPool  # noqa: E402
+
+from benchmarks.harness import environment  # noqa: E402
+from bot.extensions.code import get_event, try_redeem_code  # noqa: E402
+from bot.extensions.profile_utils.db import fetch_profile_from_id, get_all_time, get_exp_rank, reset_term  # noqa: E402
+from bot.extensions.profiles import add_exp  # noqa: E402
+
+ROOT = Path(__file__).parent.parent
+SCHEMA = Path(__file__).parent / "schema.sql"
+MIGRATIONS = ROOT / "migrations"
+# Discord snowflakes are around this size, so ids take as much space as real ones
+FIRST_USER_ID = 100_000_000_000_000_000
+
+# Which workload is running, so queries can be recorded against it for EXPLAIN
+current_workload: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_workload", default=None)
+# (workload, query shape) -> the first query and params seen with that shape
+recorded: dict[tuple[str, str], tuple[Any, Any]] = {}
+
+
+def query_shape(query: Any) -> str:
+    """Query text with whitespace collapsed and numbers replaced, as some helpers format ids into the query"""
+    text = query if isinstance(query, str) else repr(query)
+    return re.sub(r"\b\d+\b", "N", " ".join(text.split()))
+
+
+class RecordingCursor(AsyncCursor):
+    async def execute(self, query: Any, params: Any = None, **kwargs: Any) -> "RecordingCursor":
+        workload = current_workload.get()
+        if workload is not None:
+            recorded.setdefault((workload, query_shape(query)), (query, params))
+        return await super().execute(query, params, **kwargs)
+
+
+@dataclass
+class Population:
+    profiles: int
+    events: int
+    seed: int
+
+    def user_id(self, rng: random.Random) -> int:
+        return FIRST_USER_ID + rng.randrange(self.profiles)
+
+    def event_code(self, index: int) -> str:
+        return f"B{index:03d}"
+
+
+def random_exp(rng: random.Random) -> tuple[int, int]:
+    """
+    Long tailed like a real server: a fifth of members only ever sent a few messages, the rest are spread over a
+    log-normal with a median around level 6 and a handful of regulars past level 50. Term exp is part of that.
+    """
+    if rng.random() < 0.2:
+        exp = rng.randint(15, 25) * rng.randint(0, 4)
+    else:
+        exp = min(int(rng.lognormvariate(7, 1.5)), 5_000_000)
+    return exp, int(exp * rng.betavariate(1, 4))
+
+
+def random_name(rng: random.Random) -> str:
+    return rng.choice(string.ascii_uppercase) + "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+
+
+def statements(text: str) -> list[str]:
+    """Splits a SQL file into statements, which is enough for our migrations as they only have semicolons inside
+    $$ quoted function bodies. Run one at a time so CREATE INDEX CONCURRENTLY works."""
+    without_comments = "\n".join(line for line in text.splitlines() if not line.lstrip().startswith("--"))
+    statements, current = [], ""
+    # Every other part is inside $$
+    for i, part in enumerate(without_comments.split("$$")):
+        if i % 2:
+            current += f"$${part}$$"
+            continue
+        first, *rest = part.split(";")
+        current += first
+        if rest:
+            statements += [current, *rest[:-1]]
+            current = rest[-1]
+    return [statement.strip() for statement in [*statements, current] if statement.strip()]
+
+
+async def provision(conninfo: str, schema: str, population: Population) -> None:
+    rng = random.Random(population.seed)
+    now = int(datetime.now().timestamp())
+    async with await AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        await conn.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema)))
+        await conn.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(schema)))
+        await conn.execute(sql.SQL("SET search_path TO {}, public").format(sql.Identifier(schema)))
+        for statement in statements(SCHEMA.read_text()):
+            await conn.execute(statement)  # type: ignore[arg-type]
+
+        started = time.perf_counter()
+        async with conn.transaction():
+            cur = conn.cursor()
+            async with cur.copy("COPY profiles (user_id, exp, term_exp, quote) FROM STDIN") as copy:
+                for i in range(population.profiles):
+                    await copy.write_row((FIRST_USER_ID + i, *random_exp(rng), "Hello!"))
+
+            # Most members verify, some were only in the previous system and some are in both
+            async with cur.copy("COPY users (id, first_name, last_name, zid, email, phone_number) FROM STDIN") as copy:
+                for i in range(population.profiles):
+                    if rng.random() < 0.6:
+                        unsw = rng.random() < 0.8
+                        zid = f"{rng.randrange(3_000_000, 5_600_000)}" if unsw else None
+                        email = None if unsw else f"member{i}@example.com"
+                        phone = None if unsw else f"04{rng.randrange(10**8):08d}"
+                        await copy.write_row((FIRST_USER_ID + i, random_name(rng), random_name(rng), zid, email, phone))
+            async with cur.copy("COPY old_users (id, first_name, last_name, zid) FROM STDIN") as copy:
+                for i in range(population.profiles):
+                    if rng.random() < 0.1:
+                        zid = f"{rng.randrange(3_000_000, 5_600_000)}"
+                        await copy.write_row((FIRST_USER_ID + i, random_name(rng), random_name(rng), zid))
+
+            # A fifth of the events have expired but not been purged yet
+            async with cur.copy("COPY events (event_code, expiry_date, xp_amount) FROM STDIN") as copy:
+                for i in range(population.events):
+                    expiry = now - 86_400 if i % 5 == 4 else now + 30 * 86_400
+                    await copy.write_row((population.event_code(i), expiry, rng.choice((250, 500, 750, 1000))))
+            async with cur.copy("COPY event_participants (event_code, user_id) FROM STDIN") as copy:
+                for i in range(population.events):
+                    attendees = min(rng.randint(20, 200), population.profiles)
+                    for index in rng.sample(range(population.profiles), attendees):
+                        await copy.write_row((population.event_code(i), FIRST_USER_ID + index))
+
+        for migration in sorted(MIGRATIONS.glob("*.sql")):
+            for statement in statements(migration.read_text()):
+                try:
+                    await conn.execute(statement)  # type: ignore[arg-type]
+                except (psycopg.errors.FeatureNotSupported, psycopg.errors.UndefinedObject) as e:
+                    # e.g. pg_trgm not being installed locally, only the indexes needing it are missing
+                    print(f"Skipped from {migration.name}: {statement.splitlines()[0]} ({e.diag.message_primary})")
+        await conn.execute("ANALYZE")
+        seconds = time.perf_counter() - started
+        print(f"Seeded {population.profiles} profiles and {population.events} events in {seconds:.1f}s")
+
+
+class FakeRest:
+    """Level up announcements are the only REST calls add_exp makes"""
+
+    async def create_message(self, *_: Any, **__: Any) -> None:
+        pass
+
+
+type Operation = Callable[[random.Random], Awaitable[object]]
+
+
+def operations(pool: AsyncConnectionPool, population: Population) -> dict[str, Operation]:
+    now = int(datetime.now().timestamp())
+    rest = FakeRest()
+
+    async def profile(rng: random.Random) -> None:
+        async with pool.connection() as conn:
+            await fetch_profile_from_id(conn, population.user_id(rng))
+
+    async def redeem(rng: random.Random) -> None:
+        """
+        The same calls /code redeem makes. Some codes are expired, made up or already redeemed by the user. The change
+        feed isn't running, so every event lookup reaches the database as it would with EVENT_CACHE_SIZE=0.
+        """
+        user_id = population.user_id(rng)
+        user = SimpleNamespace(id=user_id, mention=f"<@{user_id}>")
+        code = population.event_code(rng.randrange(population.events + population.events // 10))
+        event = await get_event(pool, code)
+        if event is None:
+            return
+        xp_amount, expiry_date = event
+        if expiry_date <= now:
+            return
+        if await try_redeem_code(pool, user_id=user_id, code=code):
+            await add_exp(rest, pool, user, xp_amount, source="event", event_code=code)  # type: ignore[arg-type]
+
+    return {
+        "fetch_profile_from_id": profile,
+        "get_all_time[alltime]": lambda _: get_all_time(pool, False),
+        "get_all_time[term]": lambda _: get_all_time(pool, True),
+        "get_exp_rank[alltime]": lambda rng: get_exp_rank(pool, population.user_id(rng), False),
+        "get_exp_rank[term]": lambda rng: get_exp_rank(pool, population.user_id(rng), True),
+        "redeem": redeem,
+    }
+
+
+# Roughly how often each is called relative to the others on a busy day
+MIXED_WEIGHTS = {
+    "fetch_profile_from_id": 4,
+    "get_all_time[alltime]": 1,
+    "get_all_time[term]": 1,
+    "get_exp_rank[alltime]": 1,
+    "get_exp_rank[term]": 1,
+    "redeem": 2,
+}
+
+
+@dataclass
+class Stats:
+    name: str
+    requests: int
+    errors: int
+    seconds: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.seconds if self.seconds else 0.0
+
+
+def summarise(name: str, latencies: list[float], errors: int, seconds: float) -> Stats:
+    ms = [latency * 1000 for latency in latencies] or [math.nan]
+    if len(ms) > 1:
+        percentiles = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+    else:
+        p50 = p90 = p99 = ms[0]
+    return Stats(name, len(latencies), errors, seconds, p50, p90, p99, max(ms))
+
+
+async def run(
+    name: str,
+    ops: dict[str, Operation],
+    weights: dict[str, int],
+    requests: int,
+    concurrency: int,
+    rng: random.Random,
+) -> list[Stats]:
+    """Runs ``requests`` operations picked by weight from ``concurrency`` tasks, with stats for each operation"""
+    names = list(weights)
+    picks = iter(rng.choices(names, weights=[weights[op] for op in names], k=requests))
+    latencies: defaultdict[str, list[float]] = defaultdict(list)
+    errors: defaultdict[str, int] = defaultdict(int)
+
+    async def worker() -> None:
+        current_workload.set(name)
+        # Tasks share the iterator, so together they make exactly ``requests`` calls
+        for op in picks:
+            start = time.perf_counter()
+            try:
+                await ops[op](rng)
+            except Exception as e:
+                errors[op] += 1
+                if errors[op] == 1:
+                    print(f"{name}: {op} failed: {e!r}")
+            latencies[op].append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    prefix = "" if len(names) == 1 else f"{name}/"
+    return [summarise(f"{prefix}{op}", latencies[op], errors[op], seconds) for op in names if latencies[op]]
+
+
+async def explain(pool: AsyncConnectionPool) -> None:
+    for (workload, _), (query, params) in recorded.items():
+        print(f"\n== {workload} ==\n{query_shape(query)}")
+        for options in ("ANALYZE, BUFFERS", "COSTS"):
+            prefix = sql.SQL(f"EXPLAIN ({options}) ")
+            statement = prefix + (sql.SQL(query) if isinstance(query, str) else query)
+            async with pool.connection() as conn:
+                try:
+                    async with conn.transaction(force_rollback=True):
+                        cur = await conn.execute(statement, params)
+                        print("\n".join(row[0] for row in await cur.fetchall()))
+                    break
+                except psycopg.Error as e:
+                    # ANALYZE runs the query, which fails for inserts that were already made
+                    print(f"EXPLAIN ({options}) failed: {e}".strip())
+
+
+def print_table(results: list[Stats]) -> None:
+    width = max(len(result.name) for result in results)
+    print(
+        f"\n{'workload':<{width}}  {'requests':>8}  {'errors':>6}  {'req/s':>8}"
+        f"  {'p50':>10}  {'p90':>10}  {'p99':>10}  {'max':>10}"
+    )
+    for r in results:
+        print(
+            f"{r.name:<{width}}  {r.requests:>8}  {r.errors:>6}  {r.throughput:>8.1f}"
+            f"  {r.p50_ms:>8.2f}ms  {r.p90_ms:>8.2f}ms  {r.p99_ms:>8.2f}ms  {r.max_ms:>8.2f}ms"
+        )
+
+
+async def main_async(args: argparse.Namespace) -> list[Stats]:
+    population = Population(args.profiles, args.events, args.seed)
+    if not args.reuse:
+        await provision(args.dsn, args.schema, population)
+
+    pool = AsyncConnectionPool(
+        args.dsn,
+        min_size=args.concurrency,
+        max_size=args.concurrency,
+        kwargs={"options": f"-c search_path={args.schema},public", "cursor_factory": RecordingCursor},
+        open=False,
+    )
+    await pool.open(wait=True)
+    rng = random.Random(args.seed)
+    ops = operations(pool, population)
+    results = []
+    try:
+        for name in ops:
+            if args.filter in name:
+                results += await run(name, ops, {name: 1}, args.requests, args.concurrency, rng)
+        if args.filter in "mixed":
+            results += await run("mixed", ops, MIXED_WEIGHTS, args.requests, args.concurrency, rng)
+        # Last, as it leaves every term_exp at 0. Run alone as it locks every row.
+        if args.filter in "reset_term" and args.resets:
+            results += await run(
+                "reset_term", {"reset_term": lambda _: reset_term(pool)}, {"reset_term": 1}, args.resets, 1, rng
+            )
+
+        print_table(results)
+        if args.explain:
+            await explain(pool)
+    finally:
+        await pool.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dsn", nargs="?", default=os.getenv("BENCH_DATABASE_URL"), help="Postgres to run against")
+    parser.add_argument("--schema", default="ibi_bench", help="schema to create everything in, dropped first")
+    parser.add_argument("--profiles", type=int, default=10_000, help="profiles to seed")
+    parser.add_argument("--events", type=int, default=50, help="event codes to seed")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the population and the requests made")
+    parser.add_argument("--reuse", action="store_true", help="keep the population seeded by the last run")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per workload")
+    parser.add_argument("--resets", type=int, default=3, help="times to run reset_term, one at a time")
+    parser.add_argument("--explain", action="store_true", help="print query plans after the workloads")
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    parser.add_argument("-k", dest="filter", default="", help="only run workloads containing this")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("pass a DSN or set BENCH_DATABASE_URL")
+    if args.schema == "public":
+        parser.error("the schema is dropped on every run, use a dedicated one")
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        population = {"profiles": args.profiles, "events": args.events, "seed": args.seed}
+        report = {
+            "environment": environment(),
+            "population": population,
+            "concurrency": args.concurrency,
+            "results": [{**asdict(result), "throughput": result.throughput} for result in results],
+        }
+        args.json.write_text(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+"""
+Drives the bot's real listeners with synthetic gateway traffic, backed by a local Postgres and a fake Discord API.
+
+    uv run python -m benchmarks.gateway_sim postgresql://localhost/scratch --rate 1000 --users 5000 --duration 30
+    uv run python -m benchmarks.gateway_sim --redeems 500 --verifications 200 --rest-latency 0.1 --rate-limit 0.05
+
+Messages arrive at --rate from --users members for --duration seconds, with a few members sending most of them.
+A third of the way in a burst of /code redeem commands arrives, and halfway a surge of verifications: a click on the
+verification button, then a submit of the modal the bot responded with. Events are built from gateway payloads by
+hikari's event factory and dispatched to every listener, as they would be from the gateway.
+
+REST calls go through hikari's REST client down to its HTTP session, which is answered locally after around
+--rest-latency seconds. --rate-limit of the requests are answered with a 429 asking to retry after --retry-after
+seconds. hikari waits that out and retries, or raises RateLimitTooLongError if it is over --max-rate-limit. Mail is
+recorded instead of sent. The database is seeded like benchmarks.db_load, in its own schema.
+
+Reports for each kind of event the throughput, the latency from dispatch to its DB writes being committed (for
+messages, the exp queue committing the XP, for interactions, every listener having finished), the latency until the
+interaction was acknowledged and the REST calls made per event.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import http
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any
+
+# Importing the bot needs these, nothing connects to Discord
+os.environ.setdefault("TOKEN", "benchmark")
+os.environ.setdefault("OWNER_ID", "0")
+os.environ.setdefault("JWT_TOKEN", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("GUILD_ID", "1000")
+os.environ.setdefault("VERIFICATION_BASE_URL", "http://localhost:8000")
+os.environ["SERVER_MODE"] = "standalone"
+
+import hikari  # noqa: E402
+
+from benchmarks.db_load import FIRST_USER_ID, Population, provision  # noqa: E402
+from bot.app import bot as app  # noqa: E402
+from bot.app import client, loop_monitor, shutdown  # noqa: E402
+from bot.extensions import profiles, verification  # noqa: E402
+
+GUILD_ID = int(os.environ["GUILD_ID"])
+CHANNEL_ID = 2000
+APPLICATION_ID = 3000
+BOT_USER_ID = 4000
+
+# Kind of event the current task is handling and when it was dispatched, for attributing REST calls and errors
+current_kind: contextvars.ContextVar[str] = contextvars.ContextVar("current_kind", default="background")
+dispatched_at: contextvars.ContextVar[float | None] = contextvars.ContextVar("dispatched_at", default=None)
+# Route and JSON body of the REST call being made, which FakeDiscord answers
+current_request: contextvars.ContextVar[tuple[Any, Any]] = contextvars.ContextVar("current_request")
+snowflakes = itertools.count(10**15)
+shard: Any = SimpleNamespace(id=0)
+
+
+def timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def user_payload(user_id: int) -> dict:
+    return {"id": str(user_id), "username": f"member{user_id}", "discriminator": "0", "avatar": None}
+
+
+def member_payload(user_id: int) -> dict:
+    return {"user": user_payload(user_id), "roles": [], "joined_at": timestamp(), "deaf": False, "mute": False}
+
+
+def message_payload(author_id: int, content: str) -> dict:
+    return {
+        "id": str(next(snowflakes)),
+        "channel_id": str(CHANNEL_ID),
+        "guild_id": str(GUILD_ID),
+        "author": user_payload(author_id),
+        "member": {"roles": [], "joined_at": timestamp(), "deaf": False, "mute": False},
+        "content": content,
+        "timestamp": timestamp(),
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+        "flags": 0,
+    }
+
+
+def interaction_payload(interaction_type: int, user_id: int, data: dict, **extra: Any) -> dict:
+    return {
+        "id": str(next(snowflakes)),
+        "application_id": str(APPLICATION_ID),
+        "type": interaction_type,
+        "guild_id": str(GUILD_ID),
+        "channel_id": str(CHANNEL_ID),
+        "channel": {"id": str(CHANNEL_ID), "type": 0, "name": "general", "permissions": "0"},
+        "member": {**member_payload(user_id), "permissions": "0"},
+        "token": "token",
+        "version": 1,
+        "locale": "en-US",
+        "guild_locale": "en-US",
+        "app_permissions": "0",
+        "entitlements": [],
+        "authorizing_integration_owners": {},
+        "context": 0,
+        "data": data,
+        **extra,
+    }
+
+
+@dataclass
+class KindStats:
+    dispatched: int = 0
+    completed: int = 0
+    errors: int = 0
+    # Seconds from dispatch to the DB commit, and to the interaction being acknowledged
+    latencies: list[float] = field(default_factory=list)
+    acks: list[float] = field(default_factory=list)
+    rest_calls: Counter[str] = field(default_factory=Counter)
+    rate_limited: int = 0
+
+
+stats: defaultdict[str, KindStats] = defaultdict(KindStats)
+
+
+def percentiles(values: list[float]) -> list[str]:
+    """p50, p90, p99 and max in milliseconds, formatted for the report"""
+    if not values:
+        return [f"{'-':>9}"] * 4
+    ms = sorted(value * 1000 for value in values)
+    if len(ms) > 1:
+        cuts = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p90, p99 = cuts[49], cuts[89], cuts[98]
+    else:
+        p50 = p90 = p99 = ms[0]
+    return [f"{value:>7.1f}ms" for value in (p50, p90, p99, ms[-1])]
+
+
+class FakeResponse:
+    """The parts of an aiohttp response hikari's REST client reads"""
+
+    def __init__(self, status: int, body: Any = None, headers: dict[str, str] | None = None) -> None:
+        self.status = status
+        self.reason = http.HTTPStatus(status).phrase
+        self.headers = headers or {}
+        self.content_type = "application/json" if body is not None else "text/plain"
+        self.real_url = "https://discord.com/api"
+        self._body = json.dumps(body).encode() if body is not None else b""
+
+    async def read(self) -> bytes:
+        return self._body
+
+
+class FakeDiscord:
+    """
+    Stands in for the REST client's HTTP session, answering its requests after a delay. Some are answered with a 429
+    first, which hikari's REST client handles as it would Discord's.
+    """
+
+    def __init__(self, rng: random.Random, latency: float, rate_limit: float, retry_after: float) -> None:
+        self.rng = rng
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        # Interaction id -> the modal the bot responded to it with
+        self.modals: dict[int, dict] = {}
+
+    def install(self, bot: hikari.GatewayBot, max_rate_limit: float) -> None:
+        rest: Any = bot.rest
+        # The REST client has slots, so the method is wrapped on the class. It runs once per call, with the route
+        # and JSON body the session is only given as a URL and bytes, and around every retry of the call.
+        perform_request = type(rest)._perform_request
+
+        async def route_request(self: Any, *, compiled_route: Any, **kwargs: Any) -> Any:
+            route = compiled_route.route
+            stats[current_kind.get()].rest_calls[f"{route.method} {route.path_template}"] += 1
+            current_request.set((compiled_route, kwargs.get("json")))
+            return await perform_request(self, compiled_route=compiled_route, **kwargs)
+
+        type(rest)._perform_request = route_request
+        # Rate limits longer than this raise RateLimitTooLongError instead of being waited out
+        rest._bucket_manager._max_rate_limit = max_rate_limit
+        rest._client_session_owner = False
+        rest._client_session = self
+        rest.start()
+
+    async def request(self, *_: Any, **__: Any) -> FakeResponse:
+        compiled_route, body = current_request.get()
+        kind = stats[current_kind.get()]
+        await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if self.rng.random() < self.rate_limit:
+            kind.rate_limited += 1
+            # A shared rate limit, which hikari waits out without changing its buckets
+            return FakeResponse(
+                429,
+                {"message": "You are being rate limited.", "retry_after": self.retry_after, "global": False},
+                {"X-RateLimit-Scope": "shared"},
+            )
+
+        route = compiled_route.route
+        parts = compiled_route.compiled_path.split("/")
+        if route.path_template.endswith("/callback"):
+            started = dispatched_at.get()
+            if started is not None:
+                kind.acks.append(time.perf_counter() - started)
+            if body and body.get("type") == hikari.ResponseType.MODAL:
+                self.modals[int(parts[2])] = body["data"]
+            return FakeResponse(204)
+        # Messages, and interaction responses sent through the interaction's webhook
+        if route.method in ("POST", "PATCH") and ("/messages" in route.path_template or parts[1] == "webhooks"):
+            return FakeResponse(200, message_payload(BOT_USER_ID, (body or {}).get("content") or ""))
+        if route.path_template == "/guilds/{guild}/members/{user}" and route.method == "GET":
+            return FakeResponse(200, member_payload(int(parts[4])))
+        if route.path_template == "/users/{user}" and parts[2].isdigit():
+            return FakeResponse(200, user_payload(int(parts[2])))
+        return FakeResponse(204)
+
+
+class FakeMail:
+    """Mail transport that only records what would have been sent"""
+
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def send(self, mail_body: dict) -> None:
+        self.sent += 1
+
+
+class ErrorCounter(logging.Handler):
+    """Counts errors logged while handling each kind of event, as hikari and lightbulb log listener failures"""
+
+    def __init__(self) -> None:
+        super().__init__(logging.ERROR)
+        self.first: dict[str, str] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        kind = current_kind.get()
+        stats[kind].errors += 1
+        if kind not in self.first:
+            exception = record.exc_info[1] if record.exc_info else None
+            # Lightbulb wraps what the command raised
+            while exception is not None and exception.__cause__ is not None:
+                exception = exception.__cause__
+            self.first[kind] = record.getMessage() + (f": {exception!r}" if exception else "")
+
+
+def dispatch(kind: str, event: hikari.Event) -> asyncio.Future:
+    """Dispatches an event with its kind and dispatch time in the context its listeners inherit"""
+
+    def start() -> asyncio.Future:
+        current_kind.set(kind)
+        dispatched_at.set(time.perf_counter())
+        stats[kind].dispatched += 1
+        return app.event_manager.dispatch(event, return_tasks=True)
+
+    return contextvars.copy_context().run(start)
+
+
+def trace_exp_queue() -> None:
+    """Records the dispatch time of every message whose XP is queued, and the latency once the queue commits it"""
+    queue = profiles.exp_queue
+    put_nowait, handler = queue.put_nowait, queue.handler
+    waiting: defaultdict[Any, list[float]] = defaultdict(list)
+
+    def traced_put_nowait(key: Any, item: Any) -> Any:
+        result = put_nowait(key, item)
+        started = dispatched_at.get()
+        if result != "dropped" and started is not None:
+            waiting[key].append(started)
+        return result
+
+    async def traced_handler(key: Any, item: Any) -> None:
+        # Everything waiting for the key was merged into this item
+        started = waiting.pop(key, [])
+        current_kind.set("message")
+        await handler(key, item)
+        now = time.perf_counter()
+        stats["message"].completed += len(started)
+        stats["message"].latencies.extend(now - start for start in started)
+
+    queue.put_nowait = traced_put_nowait  # type: ignore[method-assign]
+    queue.handler = traced_handler
+
+
+async def send_messages(rate: float, users: int, duration: float, rng: random.Random) -> float:
+    """Sends messages at ``rate`` per second, returning the rate actually achieved"""
+    # A few members send most messages
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(users)))
+    sent = 0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < duration:
+        due = int(rate * elapsed) - sent
+        for index in rng.choices(range(users), cum_weights=cum_weights, k=due):
+            payload = message_payload(FIRST_USER_ID + index, "hello")
+            dispatch("message", app.event_factory.deserialize_message_create_event(shard, payload))
+        sent += due
+        await asyncio.sleep(0.01)
+    return sent / (time.perf_counter() - started)
+
+
+async def redeem_burst(count: int, spread: float, population: Population, rng: random.Random) -> None:
+    async def redeem(user_id: int, code: str) -> None:
+        option = {"name": "code", "type": int(hikari.OptionType.STRING), "value": code}
+        subcommand = {"name": "redeem", "type": int(hikari.OptionType.SUB_COMMAND), "options": [option]}
+        data = {"id": str(APPLICATION_ID), "name": "code", "type": 1, "options": [subcommand]}
+        payload = interaction_payload(int(hikari.InteractionType.APPLICATION_COMMAND), user_id, data)
+        await complete("redeem", app.event_factory.deserialize_interaction_create_event(shard, payload))
+
+    # Everyone at the event redeems the same few codes within a short time
+    codes = [population.event_code(i) for i in rng.sample(range(population.events), min(3, population.events))]
+    await gather_spread([redeem(population.user_id(rng), rng.choice(codes)) for _ in range(count)], spread, rng)
+
+
+async def verification_surge(count: int, spread: float, discord: FakeDiscord, rng: random.Random) -> None:
+    async def verify(user_id: int) -> None:
+        lang, form = rng.choice(("en", "cn")), "unsw" if rng.random() < 0.8 else "non-unsw"
+        data = {"custom_id": f"verify:button:{lang}:{form}", "component_type": int(hikari.ComponentType.BUTTON)}
+        message = message_payload(BOT_USER_ID, "")
+        payload = interaction_payload(int(hikari.InteractionType.MESSAGE_COMPONENT), user_id, data, message=message)
+        await complete("verify_click", app.event_factory.deserialize_interaction_create_event(shard, payload))
+
+        modal = discord.modals.pop(int(payload["id"]), None)
+        if modal is None:
+            return
+        # Members take a while to fill the form in
+        await asyncio.sleep(rng.uniform(0, spread))
+        values = {
+            "first_name": "Ibi",
+            "last_name": "Chan",
+            "zid": f"z{rng.randrange(3_000_000, 5_600_000)}",
+            "email": f"member{user_id}@example.com",
+            "phone": "0412 345 678",
+        }
+        labels = {text: name for name, text in verification.translations[lang]["fields"].items()}
+        rows = [
+            {
+                "type": 1,
+                "id": index * 2 + 1,
+                "components": [
+                    {
+                        "type": 4,
+                        "id": index * 2 + 2,
+                        "custom_id": text_input["custom_id"],
+                        "value": values[labels[text_input["label"]]],
+                    }
+                    for text_input in row["components"]
+                ],
+            }
+            for index, row in enumerate(modal["components"])
+        ]
+        data = {"custom_id": modal["custom_id"], "components": rows}
+        payload = interaction_payload(int(hikari.InteractionType.MODAL_SUBMIT), user_id, data)
+        await complete("verify_submit", app.event_factory.deserialize_interaction_create_event(shard, payload))
+
+    await gather_spread([verify(FIRST_USER_ID + rng.randrange(10**6)) for _ in range(count)], spread, rng)
+
+
+async def complete(kind: str, event: hikari.Event) -> None:
+    """Dispatches an interaction and records how long until every listener has finished"""
+    started = time.perf_counter()
+    await dispatch(kind, event)
+    stats[kind].completed += 1
+    stats[kind].latencies.append(time.perf_counter() - started)
+
+
+async def gather_spread(coroutines: list, spread: float, rng: random.Random) -> None:
+    async def later(coroutine: Any) -> None:
+        await asyncio.sleep(rng.uniform(0, spread))
+        await coroutine
+
+    await asyncio.gather(*(later(coroutine) for coroutine in coroutines))
+
+
+async def at(delay: float, func: Callable[[], Any]) -> None:
+    await asyncio.sleep(delay)
+    await func()
+
+
+def report(wall: float, achieved_rate: float, mail: FakeMail, errors: ErrorCounter) -> None:
+    width = max(len(kind) for kind in stats)
+    print(f"\nMessages sent at {achieved_rate:.0f}/s over {wall:.1f}s, {mail.sent} verification emails recorded")
+    print(
+        f"{'event':<{width}}  {'sent':>7}  {'done':>7}  {'errors':>6}  {'done/s':>7}  {'rest/ev':>7}  {'429s':>5}"
+        f"  {'p50':>9}  {'p90':>9}  {'p99':>9}  {'max':>9}  {'ack p50':>9}  {'ack p99':>9}"
+    )
+    for kind, kind_stats in sorted(stats.items()):
+        rest = sum(kind_stats.rest_calls.values())
+        per_event = rest / kind_stats.dispatched if kind_stats.dispatched else math.nan
+        acks = percentiles(kind_stats.acks)
+        print(
+            f"{kind:<{width}}  {kind_stats.dispatched:>7}  {kind_stats.completed:>7}  {kind_stats.errors:>6}"
+            f"  {kind_stats.completed / wall:>7.1f}  {per_event:>7.2f}  {kind_stats.rate_limited:>5}"
+            f"  {'  '.join(percentiles(kind_stats.latencies))}  {acks[0]}  {acks[2]}"
+        )
+
+    print("\nREST calls:")
+    for kind, kind_stats in sorted(stats.items()):
+        for route, count in kind_stats.rest_calls.most_common():
+            print(f"  {kind:<{width}}  {count:>7}  {route}")
+    print(f"\nexp queue: {profiles.exp_queue.stats()}")
+    print(f"event loop: {loop_monitor.stats()}")
+    print("shutdown:")
+    for step in shutdown.reports:
+        print(
+            f"  {step.phase:<6}  {step.name:<20}  {step.outcome.flushed:>6} flushed  {step.outcome.dropped:>6} dropped"
+            f"  {step.seconds:>6.2f}s{f'  {step.error}' if step.error else ''}"
+        )
+    for kind, message in errors.first.items():
+        print(f"First error in {kind}: {message}")
+
+
+async def simulate(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    population = Population(args.profiles, args.events, args.seed)
+    if not args.reuse:
+        await provision(args.dsn, args.schema, population)
+    os.environ["DATABASE_URL"] = args.dsn
+    # The bot's pools don't know about the schema, libpq applies this to every connection
+    os.environ["PGOPTIONS"] = f"-c search_path={args.schema},public"
+
+    discord = FakeDiscord(rng, args.rest_latency, args.rate_limit, args.retry_after)
+    discord.install(app, args.max_rate_limit)
+    mail = FakeMail()
+    verification.email_queue.transport = mail
+    profiles.cooldown = timedelta(seconds=args.cooldown)
+    trace_exp_queue()
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    # hikari logs every 429 as an error, they are counted as rate limited instead
+    logging.getLogger("hikari.rest").addFilter(lambda record: not record.getMessage().startswith("rate limited"))
+
+    # Commands are registered locally only, there is no Discord to sync them with
+    client.sync_commands = False
+    await dispatch("startup", hikari.StartingEvent(app=app))
+    await dispatch("startup", hikari.StartedEvent(app=app))
+
+    started = time.perf_counter()
+    _, achieved_rate, _ = await asyncio.gather(
+        at(args.duration / 3, lambda: redeem_burst(args.redeems, args.burst_seconds, population, rng)),
+        send_messages(args.rate, args.users, args.duration, rng),
+        at(args.duration / 2, lambda: verification_surge(args.verifications, args.burst_seconds, discord, rng)),
+    )
+    # Shutdown happens as it would when the bot stops, and XP it drains counts towards the run
+    shutdown.deadline = args.drain
+    await dispatch("shutdown", hikari.StoppingEvent(app=app))
+    wall = time.perf_counter() - started
+    report(wall, achieved_rate, mail, errors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dsn", nargs="?", default=os.getenv("BENCH_DATABASE_URL"), help="Postgres to run against")
+    parser.add_argument("--schema", default="ibi_bench", help="schema to create everything in, dropped first")
+    parser.add_argument("--profiles", type=int, default=10_000, help="profiles to seed")
+    parser.add_argument("--events", type=int, default=50, help="event codes to seed")
+    parser.add_argument("--reuse", action="store_true", help="keep the population seeded by the last run")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the population and the traffic")
+    parser.add_argument("--rate", type=float, default=200, help="messages per second")
+    parser.add_argument("--users", type=int, default=5000, help="members sending messages")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to send messages for")
+    parser.add_argument("--cooldown", type=float, default=60, help="seconds between XP grants for a member")
+    parser.add_argument("--redeems", type=int, default=200, help="/code redeem commands in the burst")
+    parser.add_argument("--verifications", type=int, default=100, help="verifications in the surge")
+    parser.add_argument("--burst-seconds", type=float, default=2, help="seconds the burst and surge are spread over")
+    parser.add_argument("--rest-latency", type=float, default=0.05, help="average seconds per REST request")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of REST requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds a 429 makes a request wait")
+    parser.add_argument(
+        "--max-rate-limit", type=float, default=300, help="longest 429 hikari waits out instead of raising"
+    )
+    parser.add_argument("--drain", type=float, default=30, help="seconds shutdown waits for queued work")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("pass a DSN or set BENCH_DATABASE_URL")
+    if args.schema == "public":
+        parser.error("the schema is dropped on every run, use a dedicated one")
+    asyncio.run(simulate(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+# How much slower than the baseline a benchmark may get before it counts as a regression
+DEFAULT_THRESHOLD = 1.25
+
+
+@dataclass
+class Result:
+    name: str
+    # Median and fastest time per operation over the repeats, in microseconds
+    median_us: float
+    min_us: float
+    # Operations timed in each repeat
+    number: int
+    repeat: int
+
+
+def measure(name: str, func: Callable[[], object], *, repeat: int = 7, min_time: float = 0.2) -> Result:
+    """Times a synchronous function, running it enough times per repeat to take at least ``min_time`` seconds"""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    times = [t / number * 1e6 for t in timer.repeat(repeat, number)]
+    return Result(name, statistics.median(times), min(times), number, repeat)
+
+
+async def measure_async(
+    name: str, func: Callable[[], Awaitable[object]], *, repeat: int = 7, min_time: float = 0.2
+) -> Result:
+    """Like measure, for coroutine functions. All repeats run in the calling event loop."""
+
+    async def run(number: int) -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        return time.perf_counter() - start
+
+    number = 1
+    while await run(number) < min_time:
+        number *= 2
+    times = [await run(number) / number * 1e6 for _ in range(repeat)]
+    return Result(name, statistics.median(times), min(times), number, repeat)
+
+
+def environment() -> dict[str, str]:
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "recorded": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def load_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {"environment": {}, "benchmarks": {}}
+    return json.loads(path.read_text())
+
+
+def save_baseline(path: Path, results: list[Result], previous: dict) -> None:
+    """Records results as the new baseline, keeping any thresholds that were tuned by hand and benchmarks not run"""
+    benchmarks = dict(previous["benchmarks"])
+    for result in results:
+        threshold = previous["benchmarks"].get(result.name, {}).get("threshold", DEFAULT_THRESHOLD)
+        benchmarks[result.name] = {**asdict(result), "threshold": threshold}
+        del benchmarks[result.name]["name"]
+    path.write_text(json.dumps({"environment": environment(), "benchmarks": benchmarks}, indent=2) + "\n")
+
+
+def compare(results: list[Result], baseline: dict) -> list[str]:
+    """Prints a table of results against the baseline and returns the names of regressed benchmarks"""
+    regressions = []
+    width = max(len(result.name) for result in results)
+    print(f"{'benchmark':<{width}}  {'median':>12}  {'min':>12}  {'baseline':>12}  {'ratio':>6}")
+    for result in results:
+        line = f"{result.name:<{width}}  {result.median_us:>10.2f}us  {result.min_us:>10.2f}us"
+        entry = baseline["benchmarks"].get(result.name)
+        if entry is None:
+            print(f"{line}  {'-':>12}  {'-':>6}")
+            continue
+        ratio = result.median_us / entry["median_us"]
+        flag = ""
+        if ratio > entry.get("threshold", DEFAULT_THRESHOLD):
+            regressions.append(result.name)
+            flag = "  REGRESSED"
+        print(f"{line}  {entry['median_us']:>10.2f}us  {ratio:>6.2f}{flag}")
+    return regressions
@@ -0,0 +1,191 @@
+"""
+Microbenchmarks for the XP, level and rendering hot paths. Runs offline: avatar downloads, the DB and Discord are faked.
+
+    uv run python -m benchmarks.micro            # compare against benchmarks/baseline.json
+    uv run python -m benchmarks.micro --save     # record the current results as the baseline
+    uv run python -m benchmarks.micro -k level   # only benchmarks with "level" in their name
+
+Exits with status 1 if any benchmark is slower than its baseline by more than its threshold. Baselines are only
+comparable on the machine they were recorded on, so record one before changing anything.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+from collections.abc import Callable
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+
+# Importing the bot needs these, nothing connects anywhere
+os.environ.setdefault("TOKEN", "benchmark")
+os.environ.setdefault("OWNER_ID", "0")
+os.environ.setdefault("JWT_TOKEN", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from PIL import Image  # noqa: E402
+
+from benchmarks.harness import Result, compare, load_baseline, measure, measure_async, save_baseline  # noqa: E402
+from bot.extensions import leaderboard  # noqa: E402
+from bot.extensions.profile_utils import color  # noqa: E402
+from bot.extensions.profile_utils.db import exp_for_level, get_level_info  # noqa: E402
+from bot.extensions.profile_utils.ledger import LedgerWriter  # noqa: E402
+from bot.extensions.verification_utils.users import UserInfo  # noqa: E402
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+
+def avatar_fixtures() -> dict[str, bytes]:
+    """Generated so no binary fixtures are needed, seeded so every run scores the same pixels"""
+    rng = random.Random(0)
+    images = {
+        "solid": Image.new("RGB", (128, 128), (93, 151, 243)),
+        "gradient": Image.linear_gradient("L").resize((128, 128)).convert("RGB"),
+        "noise": Image.frombytes("RGB", (128, 128), rng.randbytes(128 * 128 * 3)),
+    }
+    fixtures = {}
+    for name, image in images.items():
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+        fixtures[name] = buffer.getvalue()
+    return fixtures
+
+
+class FakeResponse:
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class FakeCursor:
+    """Answers the two leaderboard queries with fixed rows"""
+
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+        self.query = ""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        pass
+
+    async def execute(self, query: str, *_) -> None:
+        self.query = query
+
+    async def fetchall(self):
+        if "RANK()" in self.query:
+            return [(42, 1234)]
+        # gen_leaderboard edits the rows it gets
+        return [dict(row) for row in self.rows]
+
+
+class FakeConnection:
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        pass
+
+    def cursor(self, **_) -> FakeCursor:
+        return FakeCursor(self.rows)
+
+    async def commit(self) -> None:
+        pass
+
+
+class FakePool:
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+
+    def connection(self) -> FakeConnection:
+        return FakeConnection(self.rows)
+
+
+class FakeRest:
+    async def fetch_user(self, user_id: int) -> SimpleNamespace:
+        return SimpleNamespace(username=f"user{user_id}")
+
+
+def sync_benchmarks() -> list[tuple[str, Callable[[], object]]]:
+    levels = range(0, 1000)
+    # Spread over a wide range so both the exponential and binary search steps of get_level_info are exercised
+    exps = [int(10 ** (i / 100)) for i in range(800)]
+    fixtures = avatar_fixtures()
+    url = SimpleNamespace(url="https://cdn.discordapp.com/avatars/0/0.png")
+
+    def dominant_color(content: bytes):
+        def run() -> None:
+            color.requests.get = lambda *_, **__: FakeResponse(content)  # type: ignore[assignment]
+            color.get_dominant_color(url)  # type: ignore[arg-type]
+
+        return run
+
+    def progress_bar() -> None:
+        image = color.make_progress_bar(1234, 2000, (93, 151, 243), (197, 216, 247))
+        image.save(BytesIO(), format="PNG")
+
+    def ledger_record() -> None:
+        writer = LedgerWriter()
+        for user_id in range(1000):
+            writer.record(user_id, 20, "message")
+
+    def validate_unsw() -> None:
+        UserInfo("en", " Ibi ", " Chan ", zid="5123456", id=1).validate()
+
+    def validate_non_unsw() -> None:
+        UserInfo("en", "Ibi", "Chan", email=" ibi@example.com ", phone="0412 345 678", id=1).validate()
+
+    benchmarks: list[tuple[str, Callable[[], object]]] = [
+        ("exp_for_level[0..1000)", lambda: [exp_for_level(level) for level in levels]),
+        ("get_level_info[800 exps up to 1e8]", lambda: [get_level_info(exp) for exp in exps]),
+        *((f"get_dominant_color[{name}]", dominant_color(content)) for name, content in fixtures.items()),
+        ("make_progress_bar+png", progress_bar),
+        # Paid by every XP grant on top of the UPDATE
+        ("LedgerWriter.record[1000]", ledger_record),
+        ("UserInfo.validate[unsw]", validate_unsw),
+        ("UserInfo.validate[non-unsw]", validate_non_unsw),
+    ]
+    return benchmarks
+
+
+async def async_benchmarks(name_filter: str) -> list[Result]:
+    rows = [{"user_id": i, "exp": 100_000 - i * 1000, "term_exp": 10_000 - i * 100} for i in range(10)]
+    pool = FakePool(rows)
+    ctx = SimpleNamespace(client=SimpleNamespace(rest=FakeRest()), member=SimpleNamespace(id=1, username="user1"))
+    return [
+        await measure_async(name, lambda term=term: leaderboard.gen_leaderboard(pool, ctx, term))  # type: ignore[arg-type]
+        for name, term in (("gen_leaderboard[alltime]", False), ("gen_leaderboard[term]", True))
+        if name_filter in name
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", action="store_true", help="record the results as the new baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE, help="baseline file to compare against")
+    parser.add_argument("-k", dest="filter", default="", help="only run benchmarks containing this")
+    args = parser.parse_args()
+
+    results = [measure(name, func) for name, func in sync_benchmarks() if args.filter in name]
+    results += asyncio.run(async_benchmarks(args.filter))
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline)
+    if args.save:
+        save_baseline(args.baseline, results, baseline)
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+-- Tables the bot uses, as far as the code relies on them, for benchmarking against a throwaway database.
+-- Run in its own schema by benchmarks/db_load.py, migrations/ are applied on top.
+CREATE TABLE profiles (
+    user_id BIGINT PRIMARY KEY,
+    exp INT NOT NULL DEFAULT 0,
+    term_exp INT NOT NULL DEFAULT 0,
+    background_image TEXT NOT NULL DEFAULT '',
+    quote VARCHAR(100) NOT NULL DEFAULT 'Hello!',
+    mal_profile TEXT,
+    anilist_profile TEXT
+);
+
+CREATE TABLE events (
+    event_code TEXT PRIMARY KEY,
+    expiry_date BIGINT NOT NULL,
+    xp_amount INT NOT NULL
+);
+
+CREATE TABLE event_participants (
+    event_code TEXT NOT NULL REFERENCES events (event_code) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    PRIMARY KEY (event_code, user_id)
+);
+
+CREATE TABLE users (
+    id BIGINT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    zid TEXT,
+    email TEXT,
+    phone_number TEXT
+);
+
+CREATE TABLE old_users (
+    id BIGINT,
+    first_name TEXT,
+    last_name TEXT,
+    zid TEXT,
+    email TEXT,
+    phone_number TEXT
+);
@@ -0,0 +1,5 @@
+-- When a user last completed verification, used to filter /verify log exports.
+-- Existing rows are left as NULL since we don't know when they verified.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS verified_at TIMESTAMPTZ;
+ALTER TABLE users ALTER COLUMN verified_at SET DEFAULT now();
+CREATE INDEX IF NOT EXISTS users_verified_at_idx ON users (verified_at);
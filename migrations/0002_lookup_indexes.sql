@@ -0,0 +1,17 @@
+-- Indexes behind /verify lookup, which searches users and old_users together by any of these keys.
+-- Built concurrently so verification isn't blocked, so run this file outside a transaction.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_zid_idx ON users (lower(zid));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_idx ON users (lower(email));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_phone_number_idx ON users (phone_number);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_name_trgm_idx
+    ON users USING gin ((first_name || ' ' || last_name) gin_trgm_ops);
+
+-- old_users was imported from the previous system and may not have a primary key
+CREATE INDEX CONCURRENTLY IF NOT EXISTS old_users_id_idx ON old_users (id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS old_users_zid_idx ON old_users (lower(zid));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS old_users_email_idx ON old_users (lower(email));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS old_users_phone_number_idx ON old_users (phone_number);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS old_users_name_trgm_idx
+    ON old_users USING gin ((first_name || ' ' || last_name) gin_trgm_ops);
@@ -0,0 +1,13 @@
+-- Role assignment handed from the web server to the bot. Rows are deleted once done; failed rows are kept
+-- for inspection with their last error.
+CREATE TABLE IF NOT EXISTS verification_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    lang TEXT NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    failed BOOLEAN NOT NULL DEFAULT FALSE,
+    last_error TEXT,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS verification_jobs_pending_idx ON verification_jobs (run_after) WHERE NOT failed;
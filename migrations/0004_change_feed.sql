@@ -0,0 +1,50 @@
+-- Tells every process LISTENing on table_changes which rows of profiles and events changed, whoever changed them,
+-- so they can drop what they cached. The payload is {"table": ..., "op": ..., "key": ...}, with a null key when the
+-- whole table changed. Notifications are only delivered once the transaction commits.
+CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_LEVEL = 'STATEMENT' THEN
+        PERFORM pg_notify('table_changes', json_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'key', NULL)::text);
+        RETURN NULL;
+    END IF;
+    -- TG_ARGV[0] is the key column
+    PERFORM pg_notify(
+        'table_changes',
+        json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'key', to_jsonb(CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END) ->> TG_ARGV[0]
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS events_notify_change ON events;
+CREATE TRIGGER events_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON events
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change('event_code');
+DROP TRIGGER IF EXISTS events_notify_truncate ON events;
+CREATE TRIGGER events_notify_truncate
+    AFTER TRUNCATE ON events
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change();
+
+-- Exp changes with every message and nothing caches it, and NOTIFY serialises commits, so updates that only change
+-- exp and term_exp aren't sent
+DROP TRIGGER IF EXISTS profiles_notify_change ON profiles;
+CREATE TRIGGER profiles_notify_change
+    AFTER INSERT OR DELETE ON profiles
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change('user_id');
+DROP TRIGGER IF EXISTS profiles_notify_update ON profiles;
+CREATE TRIGGER profiles_notify_update
+    AFTER UPDATE ON profiles
+    FOR EACH ROW
+    WHEN (
+        (OLD.user_id, OLD.background_image, OLD.quote, OLD.mal_profile, OLD.anilist_profile)
+        IS DISTINCT FROM (NEW.user_id, NEW.background_image, NEW.quote, NEW.mal_profile, NEW.anilist_profile)
+    )
+    EXECUTE FUNCTION notify_table_change('user_id');
+DROP TRIGGER IF EXISTS profiles_notify_truncate ON profiles;
+CREATE TRIGGER profiles_notify_truncate
+    AFTER TRUNCATE ON profiles
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change();
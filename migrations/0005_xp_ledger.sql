@@ -0,0 +1,51 @@
+-- Every XP grant, appended in batches by the bot. profiles.exp is the sum of a user's rows and profiles.term_exp the
+-- sum of those since the last term reset, which the bot can verify and rebuild them from.
+CREATE TABLE IF NOT EXISTS xp_ledger (
+    user_id BIGINT NOT NULL,
+    amount INT NOT NULL,
+    -- import rows are the totals from before the ledger existed
+    source TEXT NOT NULL CHECK (source IN ('message', 'event', 'manual', 'import')),
+    event_code TEXT,
+    created_at TIMESTAMPTZ NOT NULL
+) PARTITION BY RANGE (created_at);
+-- For ledgers made when event_code was VARCHAR(16), events.event_code is TEXT. Doesn't rewrite the table.
+ALTER TABLE xp_ledger ALTER COLUMN event_code TYPE TEXT;
+CREATE INDEX IF NOT EXISTS xp_ledger_user_idx ON xp_ledger (user_id, created_at);
+-- Catches rows outside the monthly partitions instead of failing the batch
+CREATE TABLE IF NOT EXISTS xp_ledger_default PARTITION OF xp_ledger DEFAULT;
+
+-- Creates the partition for the month containing the given day, the bot keeps the next one ready
+CREATE OR REPLACE FUNCTION xp_ledger_add_partition(day DATE) RETURNS void AS $$
+DECLARE
+    month_start DATE := date_trunc('month', day);
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF xp_ledger FOR VALUES FROM (%L) TO (%L)',
+        'xp_ledger_' || to_char(month_start, 'YYYY_MM'),
+        month_start,
+        month_start + interval '1 month'
+    );
+END;
+$$ LANGUAGE plpgsql;
+SELECT xp_ledger_add_partition(current_date);
+SELECT xp_ledger_add_partition((current_date + interval '1 month')::date);
+
+CREATE TABLE IF NOT EXISTS term_resets (
+    reset_at TIMESTAMPTZ PRIMARY KEY
+);
+
+-- Opening balances, from before this term then this term, either side of a term reset. One statement so they all
+-- get the same now(), and skipped if the ledger has been started before.
+WITH opening AS (
+    SELECT now() AS at WHERE NOT EXISTS (SELECT 1 FROM term_resets)
+), reset AS (
+    INSERT INTO term_resets (reset_at) SELECT at - interval '1 microsecond' FROM opening
+)
+INSERT INTO xp_ledger (user_id, amount, source, created_at)
+SELECT user_id, balance.amount, 'import', balance.created_at
+FROM opening
+CROSS JOIN profiles
+CROSS JOIN LATERAL (
+    VALUES (exp - term_exp, at - interval '1 millisecond'), (term_exp, at)
+) AS balance (amount, created_at)
+WHERE balance.amount <> 0;
@@ -0,0 +1,28 @@
+-- Levels in SQL, so profiles can be filtered, indexed and counted by level. These must match exp_for_level and
+-- get_level_info in src/bot/extensions/profile_utils/db.py, which the bot checks on start.
+CREATE OR REPLACE FUNCTION xp_for_level(level BIGINT) RETURNS BIGINT AS $$
+    SELECT 100 * level + 55 * (level * (level - 1) / 2) + 10 * (level * (level - 1) * (level - 2) / 6)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Pins the schema xp_for_level was made in, as restores run with an empty search_path
+CREATE OR REPLACE FUNCTION xp_level(exp BIGINT) RETURNS INT SET search_path FROM CURRENT AS $$
+DECLARE
+    -- exp grows with the cube of the level, so this is within a few levels
+    level BIGINT := floor(cbrt(greatest(exp, 0) * 0.6));
+BEGIN
+    IF exp <= 0 THEN
+        RETURN 0;
+    END IF;
+    WHILE level > 0 AND xp_for_level(level) > exp LOOP
+        level := level - 1;
+    END LOOP;
+    WHILE xp_for_level(level + 1) <= exp LOOP
+        level := level + 1;
+    END LOOP;
+    RETURN level;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+-- Rewrites profiles once to fill it in. Changing the formula means dropping and adding the column again.
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS level INT GENERATED ALWAYS AS (xp_level(exp)) STORED;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS profiles_level_idx ON profiles (level);
@@ -1,3 +1,3 @@
-from bot import bot
+from bot.app import bot
 
 bot.run()
@@ -0,0 +1,182 @@
+import asyncio
+import functools
+import os
+from pathlib import Path
+
+import hikari
+import lightbulb
+import miru
+from dotenv import load_dotenv
+from psycopg_pool import AsyncConnectionPool
+
+from bot import extensions
+from bot.utils import metrics
+from bot.utils.assets import AssetRegistry
+from bot.utils.caches import register_size
+from bot.utils.change_feed import ChangeFeed
+from bot.utils.gateway_cache import gateway_config_from_env
+from bot.utils.interactions import InteractionRouter
+from bot.utils.logs import configure_logging
+from bot.utils.loop_monitor import LoopLagMonitor
+from bot.utils.pools import open_pool, pool_from_env
+from bot.utils.priority import InteractionTracker
+from bot.utils.shutdown import Outcome, ShutdownCoordinator
+from bot.utils.snapshots import Snapshots
+
+load_dotenv()
+configure_logging()
+
+token = os.getenv("TOKEN")
+if not token:
+    raise ValueError("Set TOKEN in .env file")
+# Only what the extensions use is cached, see CACHE_PROFILE in bot/utils/gateway_cache.py
+intents, cache_settings = gateway_config_from_env()
+# Logging is configured above instead, see bot/utils/logs.py
+bot = hikari.GatewayBot(token, logs=None, intents=intents, cache_settings=cache_settings)
+# Background work waits for interactions in flight so they are acknowledged within Discord's 3 seconds
+interactions = InteractionTracker(
+    max_delay=float(os.getenv("BACKGROUND_MAX_DELAY", "5")),
+    shed_threshold=int(os.getenv("SHED_THRESHOLD", "10")),
+)
+client = lightbulb.client_from_app(bot, hooks=[*interactions.hooks(), *metrics.command_hooks()])
+metrics.instrument_bot(bot)
+client.di.registry_for(lightbulb.di.Contexts.DEFAULT).register_value(InteractionTracker, interactions)
+
+miru_client = miru.Client(bot, ignore_unknown_interactions=True)
+client.di.registry_for(lightbulb.di.Contexts.DEFAULT).register_value(miru.Client, miru_client)
+
+# Extensions register their component handlers with this instead of listening to every interaction themselves
+interaction_router = InteractionRouter()
+
+
+@bot.listen(hikari.ComponentInteractionCreateEvent)
+async def on_component_interaction(event: hikari.ComponentInteractionCreateEvent) -> None:
+    async with interactions.track():
+        await interaction_router.dispatch(event)
+
+
+# Loaded from the package rather than the working directory, and shared by everything that sends images
+assets = AssetRegistry()
+assets.load("bot", "images")
+client.di.registry_for(lightbulb.di.Contexts.DEFAULT).register_value(AssetRegistry, assets)
+
+loop_monitor = LoopLagMonitor(
+    interval=float(os.getenv("LOOP_LAG_INTERVAL", "0.1")),
+    threshold=float(os.getenv("LOOP_LAG_THRESHOLD", "0.25")),
+)
+client.di.registry_for(lightbulb.di.Contexts.DEFAULT).register_value(LoopLagMonitor, loop_monitor)
+register_size("loop_lag_stacks", lambda: len(loop_monitor.stacks))
+
+# Extensions register their queues and buffers with this so they are drained and saved before the pools close
+shutdown = ShutdownCoordinator(
+    deadline=float(os.getenv("SHUTDOWN_DEADLINE", "20")),
+    grace=float(os.getenv("SHUTDOWN_GRACE", "5")),
+)
+client.di.registry_for(lightbulb.di.Contexts.DEFAULT).register_value(ShutdownCoordinator, shutdown)
+
+# Extensions subscribe to this to drop cached rows when anyone changes them in the database
+change_feed = ChangeFeed()
+client.di.registry_for(lightbulb.di.Contexts.DEFAULT).register_value(ChangeFeed, change_feed)
+
+# Extensions register caches worth keeping across restarts with this, only saved if SNAPSHOT_PATH is set
+snapshot_path = os.getenv("SNAPSHOT_PATH")
+snapshots = Snapshots(
+    Path(snapshot_path) if snapshot_path else None,
+    interval=float(os.getenv("SNAPSHOT_INTERVAL", "300")),
+    max_age=float(os.getenv("SNAPSHOT_MAX_AGE", "3600")),
+)
+
+owner_id = os.getenv("OWNER_ID")
+if not owner_id:
+    raise ValueError("Set OWNER_ID in .env file")
+type OwnerMention = str
+client.di.registry_for(lightbulb.di.Contexts.DEFAULT).register_value(OwnerMention, f"<@{owner_id}>")  # type: ignore[reportArgumentType]
+
+
+@lightbulb.hook(lightbulb.ExecutionSteps.CHECKS, skip_when_failed=True, name="owner_only")
+def owner_only(_: lightbulb.ExecutionPipeline, ctx: lightbulb.Context) -> None:
+    """Like lightbulb.prefab.owner_only, but for OWNER_ID instead of the owner of the Discord application"""
+    if str(ctx.user.id) != owner_id:
+        raise lightbulb.prefab.NotOwner
+
+
+# Separate pool for background writes, so they can't take every connection from commands
+type BackgroundPool = AsyncConnectionPool
+# Read only pool for long reads (leaderboards, exports, lookups), on a replica if DATABASE_READ_URL is set
+type ReadPool = AsyncConnectionPool
+
+
+@client.error_handler
+async def handler(exc: lightbulb.exceptions.ExecutionPipelineFailedException) -> bool:
+    if isinstance(exc.__cause__, lightbulb.prefab.checks.MissingRequiredPermission):
+        await exc.context.respond("You lack the permissions to do that.", ephemeral=True)
+        return True
+    elif isinstance(exc.__cause__, lightbulb.prefab.NotOwner):
+        await exc.context.respond("Only the bot owner can do that.", ephemeral=True)
+        return True
+    else:
+        return False
+
+
+@bot.listen(hikari.StartingEvent)
+async def on_starting(_: hikari.StartingEvent) -> None:
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        raise ValueError("Set DATABASE_URL in .env file")
+    loop_monitor.start()
+    change_feed.start(db_url)
+    registry = client.di.registry_for(lightbulb.di.Contexts.DEFAULT)
+    # Teardowns are called with the value, and closing a pool twice does nothing
+    pool = pool_from_env(db_url, "DB_POOL")
+    registry.register_value(AsyncConnectionPool, pool, teardown=AsyncConnectionPool.close)
+    background_pool = pool_from_env(db_url, "BACKGROUND_POOL", min_size=1, max_size=2)
+    registry.register_value(BackgroundPool, background_pool, teardown=AsyncConnectionPool.close)  # type: ignore[reportArgumentType]
+    read_pool = pool_from_env(
+        os.getenv("DATABASE_READ_URL") or db_url, "READ_POOL", min_size=1, max_size=4, read_only=True
+    )
+    registry.register_value(ReadPool, read_pool, teardown=AsyncConnectionPool.close)  # type: ignore[reportArgumentType]
+    for name, named_pool in (("main", pool), ("background", background_pool), ("read", read_pool)):
+        metrics.track_pool(name, named_pool)
+        shutdown.on("close", f"{name} pool", functools.partial(close_pool, named_pool))
+
+    # The server can take requests as soon as it starts, so the pools are opened first
+    await asyncio.gather(open_pool(pool), open_pool(background_pool), open_pool(read_pool))
+    # None of these depend on each other
+    startup = [client.load_extensions_from_package(extensions)]
+    # In standalone mode the server is run in its own processes with `uv run server`
+    if os.getenv("SERVER_MODE", "embedded") == "embedded":
+        from server import run_server
+
+        startup.append(run_server(client, pool, shutdown))
+    await asyncio.gather(*startup)
+    # Extensions have registered their caches by now, and no events are received until this listener returns
+    snapshots.restore()
+    snapshots.start()
+    await client.start()
+
+
+async def close_pool(pool: AsyncConnectionPool, timeout: float) -> None:
+    await pool.close(timeout)
+
+
+async def save_snapshot(_: float) -> Outcome:
+    await snapshots.stop()
+    return Outcome(flushed=await snapshots.save())
+
+
+async def stop_change_feed(_: float) -> None:
+    await change_feed.stop()
+
+
+# After draining, so the snapshot has the cooldowns of the last messages handled
+shutdown.on("flush", "snapshot", save_snapshot)
+shutdown.on("close", "change feed", stop_change_feed)
+
+
+@bot.listen(hikari.StoppingEvent)
+async def on_stopping(_: hikari.StoppingEvent) -> None:
+    # Gateway events still arrive until every StoppingEvent listener is done, the extensions' queues drop them
+    await shutdown.run()
+    await loop_monitor.stop()
+    # Then lightbulb does dependency cleanup
+    await client.stop()
@@ -0,0 +1,124 @@
+import asyncio
+
+import hikari
+import lightbulb
+from psycopg_pool import AsyncConnectionPool
+
+from bot.app import owner_only
+from bot.extensions.profile_utils.ledger import rebuild_totals, verify_totals
+from bot.extensions.profiles import xp_ledger
+from bot.utils.allocations import allocation_tracer
+from bot.utils.gateway_cache import cache_report, format_bytes, resident_memory
+from bot.utils.loop_monitor import LoopLagMonitor
+
+loader = lightbulb.Loader()
+
+admin = lightbulb.Group("admin", "commands for diagnosing the bot")
+
+
+@admin.register
+class Lag(
+    lightbulb.SlashCommand,
+    name="lag",
+    description="show where the event loop has been blocked",
+    hooks=[owner_only],
+):
+    top = lightbulb.integer("top", "how many of the most common stacks to show", default=5, min_value=1, max_value=25)
+
+    @lightbulb.invoke
+    async def invoke(self, ctx: lightbulb.Context, loop_monitor: LoopLagMonitor) -> None:
+        report = loop_monitor.report(self.top)
+        if len(report) > 1900:
+            await ctx.respond(attachment=hikari.Bytes(report.encode(), "loop_lag.txt"), ephemeral=True)
+        else:
+            await ctx.respond(f"```\n{report}\n```", ephemeral=True)
+
+
+@admin.register
+class Memory(
+    lightbulb.SlashCommand,
+    name="memory",
+    description="show how much memory each part of the gateway cache takes",
+    hooks=[owner_only],
+):
+    @lightbulb.invoke
+    async def invoke(self, ctx: lightbulb.Context, bot: hikari.GatewayBot) -> None:
+        rss = resident_memory()
+        lines = [
+            f"Resident memory: {format_bytes(rss) if rss is not None else 'unknown'}",
+            f"Intents: {bot.intents!r}",
+            f"Cached: {bot.cache.settings.components!r}",
+            "",
+            f"{'component':<14} {'entries':>8} {'~size':>10}",
+        ]
+        # Sizes are estimated from a sample of each component's entries
+        for name, entries, size in cache_report(bot.cache):
+            lines.append(f"{name:<14} {entries:>8} {format_bytes(size):>10}")
+        await ctx.respond("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+
+@admin.register
+class Allocations(
+    lightbulb.SlashCommand,
+    name="allocations",
+    description="trace memory allocations and show the largest sites and cache sizes",
+    hooks=[owner_only],
+):
+    action = lightbulb.string(
+        "action",
+        "start or stop tracing, or report what has been allocated since the last report",
+        choices=[lightbulb.Choice(action, action) for action in ("report", "start", "stop")],
+        default="report",
+    )
+    top = lightbulb.integer("top", "how many allocation sites to show", default=10, min_value=1, max_value=50)
+    frames = lightbulb.integer(
+        "frames", "frames of each allocation's stack to record", default=1, min_value=1, max_value=50
+    )
+
+    @lightbulb.invoke
+    async def invoke(self, ctx: lightbulb.Context) -> None:
+        if self.action == "start":
+            allocation_tracer.start(self.frames)
+            await ctx.respond("Tracing allocations, remember to stop once done.", ephemeral=True)
+            return
+        if self.action == "stop":
+            allocation_tracer.stop()
+            await ctx.respond("Stopped tracing allocations.", ephemeral=True)
+            return
+
+        group_by = "traceback" if self.frames > 1 else "lineno"
+        report = await asyncio.to_thread(allocation_tracer.report, self.top, group_by)
+        await ctx.respond(attachment=hikari.Bytes(report.encode(), "allocations.txt"), ephemeral=True)
+
+
+@admin.register
+class Ledger(
+    lightbulb.SlashCommand,
+    name="ledger",
+    description="check profiles' XP totals against the XP ledger, or rebuild them from it",
+    hooks=[owner_only],
+):
+    action = lightbulb.string(
+        "action",
+        "verify only reports differences, rebuild overwrites the totals",
+        choices=[lightbulb.Choice(action, action) for action in ("verify", "rebuild")],
+        default="verify",
+    )
+
+    @lightbulb.invoke
+    async def invoke(self, ctx: lightbulb.Context, pool: AsyncConnectionPool) -> None:
+        await ctx.defer(ephemeral=True)
+        if self.action == "rebuild":
+            changed = await rebuild_totals(pool, xp_ledger)
+            await ctx.respond(f"Rebuilt the XP totals of {changed} profiles from the ledger.", ephemeral=True)
+            return
+
+        drifted, worst = await verify_totals(pool, xp_ledger)
+        lines = [f"{drifted} profiles' totals don't match the ledger. Ledger: {xp_ledger.stats()}"]
+        if worst:
+            lines.append(f"{'user':<20} {'exp':>10} {'ledger':>10} {'term':>10} {'ledger':>10}")
+            lines.extend(f"{row[0]:<20} {row[1]:>10} {row[2]:>10} {row[3]:>10} {row[4]:>10}" for row in worst)
+        await ctx.respond("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+
+loader.command(admin)
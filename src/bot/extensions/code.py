@@ -9,7 +9,11 @@ import lightbulb
 from psycopg.errors import UniqueViolation
 from psycopg_pool import AsyncConnectionPool
 
+from bot.app import BackgroundPool, change_feed
 from bot.extensions.profiles import add_exp
+from bot.utils.caches import LRUCache, register_cache
+from bot.utils.change_feed import Change
+from bot.utils.metrics import timed
 
 loader = lightbulb.Loader()
 code = lightbulb.Group("code", "commands related to event codes")
@@ -21,40 +25,45 @@ def generate_code() -> str:
     return random_string
 
 
-async def get_code_xp_amount(pool, event_code) -> int | None:
-    async with pool.connection() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                """
-                SELECT xp_amount
-                from events
-                where event_code = %s
-                """,
-                (event_code,),
-            )
+# (xp amount, expiry date) of codes that exist, kept until the change feed says the event changed
+events: LRUCache[str, tuple[int, int]] = register_cache("events", LRUCache(int(os.getenv("EVENT_CACHE_SIZE", "1000"))))
+
+
+def on_event_change(change: Change) -> None:
+    if change.key is None:
+        events.clear()
+    else:
+        events.pop(change.key)
 
-            res = await cur.fetchone()
 
-            return res[0] if res else None
+change_feed.subscribe("events", on_event_change)
 
 
-async def code_not_expired(pool, code, date):
+@timed
+async def get_event(pool, event_code) -> tuple[int, int] | None:
+    """(xp amount, expiry date) of an event code, from the cache if it has been looked up before"""
+    if (cached := events.get(event_code)) is not None:
+        return cached
+    version = change_feed.version("events")
     async with pool.connection() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 """
-                SELECT 1
-                from events
-                where event_code = %s and expiry_date > %s
+                SELECT xp_amount, expiry_date
+                FROM events
+                WHERE event_code = %s
                 """,
-                (code, date),
+                (event_code,),
             )
-
             res = await cur.fetchone()
-
-            return bool(res)
+    if res is None:
+        return None
+    if change_feed.connected and change_feed.version("events") == version:
+        events[event_code] = (res[0], res[1])
+    return res[0], res[1]
 
 
+@timed
 async def try_redeem_code(pool, user_id, code):
     async with pool.connection() as conn:
         async with conn.cursor() as cur:
@@ -66,7 +75,7 @@ async def try_redeem_code(pool, user_id, code):
                     """,
                     (code, user_id),
                 )
-                conn.commit()
+                await conn.commit()
                 return True
             except UniqueViolation:
                 return False
@@ -89,19 +98,20 @@ class Redeem(lightbulb.SlashCommand, name="redeem", description="enter an event
         command_sent_time = int(datetime.now().timestamp())
 
         # check that the code exists
-        xp_amount = await get_code_xp_amount(pool, self.code)
-        if xp_amount is None:
+        event = await get_event(pool, self.code)
+        if event is None:
             await ctx.respond(f"Invalid code: `{self.code}`.")
             return
+        xp_amount, expiry_date = event
 
         # check that the code has not expired
-        if not await code_not_expired(pool, self.code, command_sent_time):
+        if expiry_date <= command_sent_time:
             await ctx.respond(f"Code: `{self.code}` has expired.")
             return
 
         # check that the player has not already submited the code
         if await try_redeem_code(pool, user_id=user.id, code=self.code):
-            await add_exp(client.rest, pool, user, xp_amount)
+            await add_exp(client.rest, pool, user, xp_amount, source="event", event_code=self.code)
             await ctx.respond(
                 f"Thank you {user.mention} for coming to our event! We hope to see you again soon!",
             )
@@ -114,7 +124,7 @@ loader.command(code)
 
 
 @loader.task(lightbulb.uniformtrigger(hours=24))
-async def purge_expired_events(pool: AsyncConnectionPool):
+async def purge_expired_events(pool: BackgroundPool):
     async with pool.connection() as conn:
         async with conn.cursor() as cur:
             # DELETE ON CASCADE is on for event_participants so it handles that automatically
@@ -1,14 +1,79 @@
+import logging
+import os
+import time
+
 import hikari
 import lightbulb
 from psycopg_pool import AsyncConnectionPool
 
-from .profile_utils.db import get_all_time, reset_term, get_exp_rank, get_level_info
+from bot.app import BackgroundPool, ReadPool, snapshots
+from bot.utils.caches import LRUCache, register_cache
+
+from .profile_utils.db import (
+    check_level_function,
+    get_all_time,
+    get_exp_rank,
+    get_level_info,
+    get_level_stats,
+    reset_term,
+)
+
+logger = logging.getLogger(__name__)
 
 loader = lightbulb.Loader()
 
 leaderboard = lightbulb.Group("leaderboard", "commands related to exp leaderboards")
 
-async def gen_leaderboard(pool: AsyncConnectionPool, ctx: lightbulb.Context, term_leaderboard: bool):
+# Names fetched for users the gateway cache doesn't have, like members who left, with the unix time they were fetched
+usernames: LRUCache[int, tuple[str, float]] = register_cache(
+    "leaderboard_usernames", LRUCache(int(os.getenv("USERNAME_CACHE_SIZE", "1000")))
+)
+username_ttl = float(os.getenv("USERNAME_CACHE_TTL", str(24 * 60 * 60)))
+
+
+async def fetch_username(rest: hikari.api.RESTClient, user_id: int) -> str:
+    cached = usernames.get(user_id)
+    if cached is not None and cached[1] > time.time() - username_ttl:
+        return cached[0]
+    username = (await rest.fetch_user(user_id)).username
+    usernames[user_id] = (username, time.time())
+    return username
+
+
+def dump_usernames() -> list:
+    expired = time.time() - username_ttl
+    return [[user_id, username, fetched] for user_id, (username, fetched) in usernames.items() if fetched > expired]
+
+
+def load_usernames(entries: list) -> int:
+    for user_id, username, fetched in entries:
+        usernames[user_id] = (username, fetched)
+    return len(entries)
+
+
+snapshots.register("leaderboard_usernames", 1, dump_usernames, load_usernames)
+
+
+@loader.listener(hikari.StartedEvent)
+async def check_stored_levels(_: hikari.StartedEvent, pool: BackgroundPool) -> None:
+    """The stored level column is computed by SQL, so make sure it still agrees with get_level_info"""
+    mismatches = await check_level_function(pool)
+    if mismatches:
+        logger.error(
+            "xp_level in the database disagrees with get_level_info for %d exp values, e.g. (exp, sql, python) %s. "
+            "Update migrations/0006_profile_level.sql to match and recreate the level column",
+            len(mismatches),
+            mismatches[:5],
+        )
+
+
+async def gen_leaderboard(
+    pool: AsyncConnectionPool,
+    ctx: lightbulb.Context,
+    term_leaderboard: bool,
+    cache: hikari.api.Cache | None = None,
+):
+    """Names are taken from the gateway cache where it has them, and fetched and kept for a while otherwise"""
     response = await get_all_time(pool, term_leaderboard)
 
     if term_leaderboard:
@@ -25,8 +90,11 @@ async def gen_leaderboard(pool: AsyncConnectionPool, ctx: lightbulb.Context, ter
     rank = 1
     for row in response:
         row_id = row['user_id']
-        row_user = await ctx.client.rest.fetch_user(row_id)
-        row["username"] = row_user.username
+        row_user = cache.get_user(row_id) if cache is not None else None
+        if row_user is not None:
+            row["username"] = row_user.username
+        else:
+            row["username"] = await fetch_username(ctx.client.rest, row_id)
 
         if len(row["username"]) > max_username_len:
             max_username_len = len(row["username"])
@@ -101,8 +169,7 @@ async def gen_leaderboard(pool: AsyncConnectionPool, ctx: lightbulb.Context, ter
     user_id = user.id
     user_data = await get_exp_rank(pool, user_id, term_leaderboard)
     user_rank, user_exp = user_data[0]
-    user_temp = await ctx.client.rest.fetch_user(user_id)
-    user_name = user_temp.username
+    user_name = user.username
 
     user_level = get_level_info(user_exp)[0]
 
@@ -143,11 +210,11 @@ class AllTime(
     description = "view the 10 users with the most all-time exp"
 ):
     @lightbulb.invoke
-    async def invoke(self, ctx: lightbulb.Context, pool: AsyncConnectionPool) -> None:
+    async def invoke(self, ctx: lightbulb.Context, pool: ReadPool, bot: hikari.GatewayBot) -> None:
         # defer response in case database query takes a while
         await ctx.defer()
 
-        embed = await gen_leaderboard(pool, ctx, False)
+        embed = await gen_leaderboard(pool, ctx, False, bot.cache)
 
         await ctx.respond(embed=embed)
 
@@ -161,11 +228,11 @@ class Term(
     description = "view the 10 users with the most exp this term"
 ):
     @lightbulb.invoke
-    async def invoke(self, ctx: lightbulb.Context, pool: AsyncConnectionPool) -> None:
+    async def invoke(self, ctx: lightbulb.Context, pool: ReadPool, bot: hikari.GatewayBot) -> None:
         # defer response in case database query takes a while
         await ctx.defer()
 
-        embed = await gen_leaderboard(pool, ctx, True)
+        embed = await gen_leaderboard(pool, ctx, True, bot.cache)
 
         await ctx.respond(embed=embed)
 
@@ -192,4 +259,49 @@ class Reset(
 
         await ctx.respond(embed=embed)
 
+
+# command 4:
+# /leaderboard stats
+# level distribution of every member - anyone can run the command
+@leaderboard.register
+class Stats(
+    lightbulb.SlashCommand,
+    name="stats",
+    description="view how many members are at each level",
+):
+    @lightbulb.invoke
+    async def invoke(self, ctx: lightbulb.Context, pool: ReadPool) -> None:
+        await ctx.defer()
+
+        stats = await get_level_stats(pool)
+
+        # bars are scaled to the biggest bucket
+        most = max((count for _, count in stats.histogram), default=0)
+        lines = []
+        for level, count in stats.histogram:
+            if stats.bucket_width == 1:
+                label = f"{level}"
+            else:
+                label = f"{level}-{level + stats.bucket_width - 1}"
+            bar = "█" * round(20 * count / most) if most else ""
+            lines.append(f"{label:>7} {bar} {count}")
+        histogram = "\n".join(lines) or "No members yet"
+
+        percentiles = "\n".join(f"{int(fraction * 100)}th: Level {level}" for fraction, level in stats.percentiles)
+
+        embed = hikari.Embed(
+            title="📊 Level Stats 📊",
+            description=(
+                f"**{stats.members}** members, **{stats.active}** with XP, "
+                f"**{stats.level_10_plus}** at level 10 or higher.\n"
+                f"```\n{histogram}\n```"
+            ),
+            color=0xA03DA9,
+        )
+        embed.add_field(name="Percentiles (members with XP)", value=percentiles, inline=True)
+        embed.add_field(name="Highest level", value=f"{stats.max_level}", inline=True)
+
+        await ctx.respond(embed=embed)
+
+
 loader.command(leaderboard)
\ No newline at end of file
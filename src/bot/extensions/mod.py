@@ -3,6 +3,7 @@ import lightbulb
 from psycopg_pool import AsyncConnectionPool
 
 from bot.extensions.profile_utils.db import get_profile
+from bot.extensions.profiles import add_exp
 
 loader = lightbulb.Loader()
 
@@ -46,4 +47,21 @@ class Reset(
             await ctx.respond(f"{self.user.mention}'s {self.field} field has been reset!")
 
 
+@mod.register
+class Xp(
+    lightbulb.SlashCommand,
+    name="xp",
+    description="give or take away a user's XP, recorded in the XP ledger",
+    hooks=[lightbulb.prefab.has_permissions(hikari.Permissions.MODERATE_MEMBERS)],
+):
+    user = lightbulb.user("user", "the user")
+    amount = lightbulb.integer("amount", "XP to add, negative to take away", min_value=-100_000, max_value=100_000)
+
+    @lightbulb.invoke
+    async def invoke(self, ctx: lightbulb.Context, pool: AsyncConnectionPool, client: lightbulb.Client) -> None:
+        await ctx.defer(ephemeral=True)
+        await add_exp(client.rest, pool, self.user, self.amount, source="manual")
+        await ctx.respond(f"Gave {self.user.mention} {self.amount} XP.")
+
+
 loader.command(mod)
@@ -1,10 +1,16 @@
+import logging
 import math
+import os
 from io import BytesIO
 
 import hikari
 import requests
 from PIL import Image, ImageDraw
 
+from bot.utils.caches import LRUCache, register_cache
+
+logger = logging.getLogger(__name__)
+
 type RGB = tuple[int, int, int]
 
 # fg color to bg color
@@ -38,19 +44,24 @@ def rgb_to_yuv(color: RGB) -> tuple[float, float, float]:
 
 fg_rgb_to_yuv = {color: rgb_to_yuv(color) for color in fg_to_bg}
 
+# Avatar URLs change with the avatar, so a URL's dominant color never does
+avatar_colors: LRUCache[str, RGB] = register_cache(
+    "avatar_colors", LRUCache(int(os.getenv("AVATAR_COLOR_CACHE_SIZE", "10000")))
+)
+
 
 def get_dominant_color(url: hikari.URL) -> RGB | None:
     try:
         res = requests.get(url.url, timeout=10)
         res.raise_for_status()
     except requests.Timeout:
-        print(f"Image request for {url} timed out")
+        logger.warning("Image request for %s timed out", url)
         return None
     except requests.HTTPError as e:
-        print(f"Image request for {url} gave HTTPError: {e}")
+        logger.warning("Image request for %s gave HTTPError: %s", url, e)
         return None
     except requests.RequestException as e:
-        print(f"Image request for {url} gave RequestException: {e}")
+        logger.warning("Image request for %s gave RequestException: %s", url, e)
         return None
 
     img = Image.open(BytesIO(res.content))
@@ -89,9 +100,12 @@ def get_dominant_color(url: hikari.URL) -> RGB | None:
 
 
 def get_colors(url: hikari.URL) -> tuple[RGB, RGB]:
-    dominant_color = get_dominant_color(url)
+    dominant_color = avatar_colors.get(url.url)
     if dominant_color is None:
-        return next(iter(fg_to_bg.items()))
+        dominant_color = get_dominant_color(url)
+        if dominant_color is None:
+            return next(iter(fg_to_bg.items()))
+        avatar_colors[url.url] = dominant_color
     return dominant_color, fg_to_bg[dominant_color]
 
 
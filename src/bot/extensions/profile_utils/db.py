@@ -1,3 +1,4 @@
+import logging
 import math
 import random
 from collections import defaultdict
@@ -10,11 +11,16 @@ from psycopg import AsyncConnection, sql
 from psycopg.rows import DictRow, dict_row
 from psycopg_pool import AsyncConnectionPool
 
+from bot.utils.caches import register_cache
+from bot.utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
 LEVEL_ONE_XP_REQ = 100
 FIRST_XP_INC = 55
 XP_INC_DELTA = 10
 
-cooldowns: defaultdict[hikari.User, datetime] = defaultdict(lambda: datetime.min)
+cooldowns: defaultdict[hikari.Snowflake, datetime] = register_cache("cooldowns", defaultdict(lambda: datetime.min))
 # Cooldown for xp
 cooldown = timedelta(minutes=1)
 
@@ -71,6 +77,7 @@ class Profile:
             rank=row["rank"],
         )
 
+    @timed
     async def add_exp(self, pool: AsyncConnectionPool, amount: int) -> None:
         """Add exp to the profile
 
@@ -90,9 +97,9 @@ class Profile:
                     (amount, amount, self.user_id),
                 )
 
+    @timed
     async def set_quote(self, pool: AsyncConnectionPool, new_quote: str) -> None:
-        print(f"new quote = {new_quote}")
-        print(f"{self.user_id}")
+        logger.debug("Setting quote of %s to %r", self.user_id, new_quote)
         async with pool.connection() as conn:
             async with conn.cursor(row_factory=dict_row) as cur:
                 await cur.execute(
@@ -104,6 +111,7 @@ class Profile:
                     (new_quote, self.user_id),
                 )
 
+    @timed
     async def set_mal_profile(self, pool: AsyncConnectionPool, mal_profile: str | None) -> None:
         async with pool.connection() as conn:
             async with conn.cursor(row_factory=dict_row) as cur:
@@ -116,6 +124,7 @@ class Profile:
                     (mal_profile, self.user_id),
                 )
 
+    @timed
     async def set_anilist_profile(self, pool: AsyncConnectionPool, anilist_profile: str | None) -> None:
         async with pool.connection() as conn:
             async with conn.cursor(row_factory=dict_row) as cur:
@@ -128,6 +137,7 @@ class Profile:
                     (anilist_profile, self.user_id),
                 )
 
+    @timed
     async def remove_attribute(self, pool: AsyncConnectionPool, attribute: str) -> None:
         async with pool.connection() as conn:
             async with conn.cursor(row_factory=dict_row) as cur:
@@ -141,6 +151,8 @@ class Profile:
                     (self.user_id,),
                 )
 
+
+@timed
 async def get_profile(pool: AsyncConnectionPool, user: hikari.User) -> Profile:
     """Gets the profile of a user from the db, creates a default one of it doesn't exist
 
@@ -167,6 +179,22 @@ async def get_profile(pool: AsyncConnectionPool, user: hikari.User) -> Profile:
         return Profile.from_row(row)
 
 
+@timed
+async def read_profile(pool: AsyncConnectionPool, user: hikari.User) -> Profile | None:
+    """Gets the profile of a user from the db without creating one, so it can be used with a read only pool
+
+    Args:
+        pool: PSQL connection pool
+        user: Discord user object
+
+    Returns:
+        Profile or None
+    """
+    async with pool.connection() as conn:
+        row = await fetch_profile_from_id(conn, int(user.id))
+    return Profile.from_row(row) if row is not None else None
+
+
 async def fetch_profile_from_id(conn: AsyncConnection, user_id: int) -> DictRow | None:
     """Given the user id, get the row in the profiles table
 
@@ -208,7 +236,36 @@ async def insert_default_profile(conn: AsyncConnection, user_id: int) -> None:
     )
     await conn.commit()
 
+
+@timed
+async def add_exp_many(pool: AsyncConnectionPool, amounts: dict[int, int]) -> int:
+    """Adds exp to many profiles in one statement, creating default profiles for users without one
+
+    Args:
+        pool: DB pool
+        amounts: Exp to add by user id
+
+    Returns:
+        How many profiles were updated or created
+    """
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO profiles (user_id, exp, term_exp, background_image, quote, mal_profile, anilist_profile)
+                SELECT user_id, amount, amount, '', 'Hello!', NULL, NULL
+                FROM unnest(%s::BIGINT[], %s::INT[]) AS amounts(user_id, amount)
+                ON CONFLICT (user_id) DO UPDATE
+                SET exp = profiles.exp + EXCLUDED.exp,
+                    term_exp = profiles.term_exp + EXCLUDED.term_exp
+                """,
+                (list(amounts), list(amounts.values())),
+            )
+            return cur.rowcount
+
+
 # Get all time exp leaderboard
+@timed
 async def get_all_time(pool: AsyncConnectionPool, term_leaderboard: bool) -> list[dict_row]:
     if term_leaderboard:
         exp_type = "term_exp"
@@ -227,7 +284,9 @@ async def get_all_time(pool: AsyncConnectionPool, term_leaderboard: bool) -> lis
             response = await cur.fetchall()
             return response
 
+
 # Reset term exp
+@timed
 async def reset_term(pool: AsyncConnectionPool):
     query = """
                 UPDATE profiles
@@ -236,9 +295,13 @@ async def reset_term(pool: AsyncConnectionPool):
     async with pool.connection() as conn:
         async with conn.cursor() as cur:
             await cur.execute(query)
+            # Term totals are rebuilt from the ledger rows after the last reset
+            await cur.execute("INSERT INTO term_resets (reset_at) VALUES (now())")
             await conn.commit()
 
+
 # Get specific user's rank and exp
+@timed
 async def get_exp_rank(pool: AsyncConnectionPool, user_id: int, term_leaderboard: bool) -> dict_row:
     if term_leaderboard:
         exp_type = "term_exp"
@@ -260,6 +323,83 @@ async def get_exp_rank(pool: AsyncConnectionPool, user_id: int, term_leaderboard
             response = await cur.fetchall()
             return response
 
+
+# Level percentiles reported by get_level_stats
+LEVEL_PERCENTILES = (0.5, 0.75, 0.9, 0.99)
+
+
+@frozen
+class LevelStats:
+    members: int
+    # Members with any exp
+    active: int
+    level_10_plus: int
+    max_level: int
+    # Level -> members at or above it and below the next bucket, lowest first
+    histogram: list[tuple[int, int]]
+    bucket_width: int
+    # Fraction -> level, in LEVEL_PERCENTILES order, of members with any exp
+    percentiles: list[tuple[float, int]]
+
+
+# Level distribution from the stored level column
+@timed
+async def get_level_stats(pool: AsyncConnectionPool, buckets: int = 20) -> LevelStats:
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT count(*),
+                       count(*) FILTER (WHERE exp > 0),
+                       count(*) FILTER (WHERE level >= 10),
+                       coalesce(max(level), 0),
+                       percentile_disc(%s::FLOAT8[]) WITHIN GROUP (ORDER BY level) FILTER (WHERE exp > 0)
+                FROM profiles
+                """,
+                (list(LEVEL_PERCENTILES),),
+            )
+            row = await cur.fetchone()
+            if row is None:
+                raise ValueError("Level stats query returned no row")
+            members, active, level_10_plus, max_level, percentiles = row
+            width = max(1, math.ceil((max_level + 1) / buckets))
+            await cur.execute(
+                """
+                SELECT level / %(width)s * %(width)s AS bucket, count(*)
+                FROM profiles
+                GROUP BY bucket
+                ORDER BY bucket
+                """,
+                {"width": width},
+            )
+            histogram = await cur.fetchall()
+    return LevelStats(
+        members=members,
+        active=active,
+        level_10_plus=level_10_plus,
+        max_level=max_level,
+        histogram=histogram,
+        bucket_width=width,
+        percentiles=list(zip(LEVEL_PERCENTILES, percentiles or [0] * len(LEVEL_PERCENTILES))),
+    )
+
+
+@timed
+async def check_level_function(pool: AsyncConnectionPool, max_level: int = 1000) -> list[tuple[int, int, int]]:
+    """
+    Compares the xp_level function behind the stored level column with get_level_info at either side of every level
+    boundary up to ``max_level``
+
+    Returns:
+        (exp, level in the database, level in python) for every exp where they differ
+    """
+    exps = [-1, 0] + [exp_for_level(level) + offset for level in range(1, max_level + 1) for offset in (-1, 0)]
+    async with pool.connection() as conn:
+        cur = await conn.execute("SELECT exp, xp_level(exp) FROM unnest(%s::BIGINT[]) AS exps(exp)", (exps,))
+        rows = await cur.fetchall()
+    return [(exp, level, get_level_info(exp)[0]) for exp, level in rows if level != get_level_info(exp)[0]]
+
+
 def get_level_info(exp) -> tuple[int, int, int]:
     """
     Calculates level info from xp
@@ -0,0 +1,266 @@
+import asyncio
+import contextlib
+import logging
+from collections.abc import AsyncIterator
+from datetime import date, datetime, timedelta, timezone
+from typing import Literal
+
+from psycopg import AsyncConnection, DataError, IntegrityError
+from psycopg_pool import AsyncConnectionPool
+
+from bot.utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+type Source = Literal["message", "event", "manual"]
+type LedgerRow = tuple[int, int, Source, str | None, datetime]
+
+# Totals per user from the ledger: everything, and everything since the last term reset
+LEDGER_TOTALS = """
+    WITH last_reset AS (
+        SELECT coalesce(max(reset_at), '-infinity') AS reset_at FROM term_resets
+    ), ledger AS (
+        SELECT user_id,
+               sum(amount) AS exp,
+               coalesce(sum(amount) FILTER (WHERE created_at > last_reset.reset_at), 0) AS term_exp
+        FROM xp_ledger, last_reset
+        GROUP BY user_id
+    )
+"""
+
+# Profiles whose totals differ from their ledger rows, only those in user_ids unless it is null
+LEDGER_DIFFERENCES = (
+    LEDGER_TOTALS
+    + """
+    , totals AS (
+        SELECT user_id,
+               coalesce(profiles.exp, 0) AS exp,
+               coalesce(ledger.exp, 0) AS ledger_exp,
+               coalesce(profiles.term_exp, 0) AS term_exp,
+               coalesce(ledger.term_exp, 0) AS ledger_term_exp
+        FROM profiles
+        FULL JOIN ledger USING (user_id)
+    )
+    SELECT *
+    FROM totals
+    WHERE (exp, term_exp) <> (ledger_exp, ledger_term_exp)
+      AND (%(user_ids)s::BIGINT[] IS NULL OR user_id = ANY(%(user_ids)s))
+"""
+)
+
+
+class LedgerWriter:
+    """
+    Buffers XP ledger rows in memory and appends them with COPY every ``interval`` seconds, or sooner once
+    ``batch_size`` are waiting, so recording a grant costs a list append.
+
+    Rows that fail to be written are kept for the next flush, except ones Postgres rejects, which are logged and
+    dropped so they can't hold up every later flush. Past ``max_buffered`` rows the oldest are dropped too. Either way
+    the totals they belonged to will no longer match the ledger until rebuilt.
+    """
+
+    def __init__(self, *, interval: float = 1.0, batch_size: int = 5000, max_buffered: int = 100_000) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+
+        self.pool: AsyncConnectionPool | None = None
+        self._rows: list[LedgerRow] = []
+        self._lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def record(self, user_id: int, amount: int, source: Source, event_code: str | None = None) -> None:
+        self._rows.append((int(user_id), amount, source, event_code, datetime.now(timezone.utc)))
+        if len(self._rows) > self.max_buffered:
+            drop = len(self._rows) - self.max_buffered
+            del self._rows[:drop]
+            self.dropped += drop
+        if len(self._rows) >= self.batch_size:
+            self._full.set()
+
+    def start(self, pool: AsyncConnectionPool) -> None:
+        self.pool = pool
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> int:
+        """Stops flushing periodically and writes what's left, returning how many rows that was"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        return await self.flush()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "buffered": len(self._rows),
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+    @timed
+    async def flush(self) -> int:
+        """Writes every buffered row, returning how many were written"""
+        if not self._rows or self.pool is None:
+            return 0
+        try:
+            # The connection is taken before the rows, so waiting for one never holds up verify_totals
+            async with self.pool.connection() as conn:
+                return await write_pending(conn, self)
+        except Exception:
+            self.failed += 1
+            logger.exception("Failed to write %d XP ledger rows, keeping them for the next flush", len(self._rows))
+            return 0
+
+    @contextlib.asynccontextmanager
+    async def pending(self) -> AsyncIterator[list[LedgerRow]]:
+        """
+        Takes every buffered row for the caller to write with ``write``, after any flush in progress. The rows are put
+        back if the block raises, so it should commit them before it ends.
+        """
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            self._full.clear()
+            try:
+                yield rows
+            except BaseException:
+                # Including cancellation, which rolls the write back
+                self._rows[:0] = rows
+                raise
+            self.written += len(rows)
+
+    async def write(self, conn: AsyncConnection, rows: list[LedgerRow]) -> None:
+        """
+        Appends rows taken with ``pending`` on ``conn``. Rows Postgres rejects, such as ones breaking a constraint, are
+        logged and removed from ``rows`` instead of failing the rest.
+        """
+        rejected = await copy_rows(conn, rows)
+        if rejected:
+            self.rejected += len(rejected)
+            logger.error("Dropped %d XP ledger rows Postgres rejected: %s", len(rejected), rejected)
+            rejected_ids = {id(row) for row in rejected}
+            rows[:] = [row for row in rows if id(row) not in rejected_ids]
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except TimeoutError:
+                pass
+            await self.flush()
+
+
+async def copy_rows(conn: AsyncConnection, rows: list[LedgerRow]) -> list[LedgerRow]:
+    """
+    Appends rows with COPY, returning the ones Postgres rejected. A batch that is rejected is split in half until the
+    bad rows are found, and each part is a savepoint of the caller's transaction.
+    """
+    if not rows:
+        return []
+    try:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                async with cur.copy(
+                    "COPY xp_ledger (user_id, amount, source, event_code, created_at) FROM STDIN"
+                ) as copy:
+                    for row in rows:
+                        await copy.write_row(row)
+    except (DataError, IntegrityError):
+        if len(rows) == 1:
+            return rows
+        middle = len(rows) // 2
+        return await copy_rows(conn, rows[:middle]) + await copy_rows(conn, rows[middle:])
+    return []
+
+
+async def write_pending(conn: AsyncConnection, writer: LedgerWriter) -> int:
+    """Writes and commits the writer's buffered rows on ``conn``, returning how many, and raising if that fails"""
+    async with writer.pending() as rows:
+        # Any rejected parts are rolled back to savepoints, so the rows that are left are committed together
+        async with conn.transaction():
+            await writer.write(conn, rows)
+        await conn.commit()
+        return len(rows)
+
+
+@timed
+async def add_partitions(pool: AsyncConnectionPool, day: date | None = None) -> None:
+    """Makes sure the ledger has partitions for this month and the next"""
+    day = day or date.today()
+    async with pool.connection() as conn:
+        await conn.execute("SELECT xp_ledger_add_partition(%s)", (day,))
+        await conn.execute("SELECT xp_ledger_add_partition(%s)", (day.replace(day=1) + timedelta(days=32),))
+
+
+@timed
+async def verify_totals(pool: AsyncConnectionPool, writer: LedgerWriter, limit: int = 20) -> tuple[int, list[tuple]]:
+    """
+    Compares every profile's exp and term_exp with the sums of its ledger rows, without locking profiles so grants
+    carry on meanwhile. A grant committing while the ledger is read can show up as a difference until its row is
+    written, so profiles that differ are checked again after another flush, and only those that differ by the same
+    amount both times are counted.
+
+    Returns:
+        (number of profiles that differ, the ``limit`` that differ most as (user_id, exp, ledger exp, term_exp,
+        ledger term_exp))
+    """
+    async with pool.connection() as conn:
+        # Rows for grants committed before now are buffered, so they are in the ledger before it is read
+        await write_pending(conn, writer)
+        cur = await conn.execute(LEDGER_DIFFERENCES, {"user_ids": None})
+        first = {row[0]: row for row in await cur.fetchall()}
+        await conn.commit()
+        drifted = []
+        if first:
+            await write_pending(conn, writer)
+            cur = await conn.execute(LEDGER_DIFFERENCES, {"user_ids": list(first)})
+            drifted = [row for row in await cur.fetchall() if difference(row) == difference(first[row[0]])]
+            await conn.commit()
+    drifted.sort(key=lambda row: sum(map(abs, difference(row))), reverse=True)
+    return len(drifted), drifted[:limit]
+
+
+def difference(row: tuple) -> tuple[int, int]:
+    """How far a LEDGER_DIFFERENCES row's exp and term_exp are from its ledger's"""
+    _, exp, ledger_exp, term_exp, ledger_term_exp = row
+    return exp - ledger_exp, term_exp - ledger_term_exp
+
+
+@timed
+async def rebuild_totals(pool: AsyncConnectionPool, writer: LedgerWriter) -> int:
+    """
+    Sets every profile's exp and term_exp to the sums of its ledger rows, returning how many changed. Profiles are
+    not created for ledger rows without one.
+
+    ``pool`` must not be the writer's pool, whose connections grants may be holding while they wait for the lock.
+    """
+    if pool is writer.pool:
+        raise ValueError("rebuild_totals needs a pool other than the ledger writer's")
+    async with pool.connection() as conn:
+        await write_pending(conn, writer)
+        # Grants wait for this and then add to the rebuilt totals, so none are lost
+        await conn.execute("LOCK TABLE profiles IN SHARE ROW EXCLUSIVE MODE")
+        async with writer.pending() as rows:
+            await writer.write(conn, rows)
+            cur = await conn.execute(
+                LEDGER_TOTALS
+                + """
+                UPDATE profiles
+                SET exp = coalesce(ledger.exp, 0),
+                    term_exp = coalesce(ledger.term_exp, 0)
+                FROM profiles AS before
+                LEFT JOIN ledger USING (user_id)
+                WHERE profiles.user_id = before.user_id
+                  AND (before.exp, before.term_exp) <> (coalesce(ledger.exp, 0), coalesce(ledger.term_exp, 0))
+                """
+            )
+            await conn.commit()
+            return cur.rowcount
@@ -1,4 +1,7 @@
+import logging
 import os
+from collections import defaultdict
+from dataclasses import dataclass
 from datetime import datetime
 from io import BytesIO
 
@@ -6,23 +9,43 @@ import hikari
 import lightbulb
 from psycopg_pool import AsyncConnectionPool
 
-from bot.extensions.profile_utils.color import get_colors, make_progress_bar
+from bot.app import BackgroundPool, ReadPool, interactions, shutdown, snapshots
+from bot.extensions.profile_utils.color import avatar_colors, get_colors, make_progress_bar
+from bot.utils.shutdown import Outcome
+from bot.utils.work_queue import WorkQueue
 
-from .profile_utils.db import cooldown, cooldowns, get_exp, get_profile, get_level_info
+from .profile_utils.db import add_exp_many, cooldown, cooldowns, get_exp, get_profile, get_level_info, read_profile
+from .profile_utils.ledger import LedgerWriter, Source, add_partitions, verify_totals
+
+logger = logging.getLogger(__name__)
 
 loader = lightbulb.Loader()
 
+# Every grant is also appended to xp_ledger, in batches so a grant only costs a list append
+xp_ledger = LedgerWriter(
+    interval=float(os.getenv("XP_LEDGER_INTERVAL", "1")),
+    batch_size=int(os.getenv("XP_LEDGER_BATCH_SIZE", "5000")),
+)
+
 
 async def add_exp(
     client: hikari.api.RESTClient,
     pool: AsyncConnectionPool,
     user: hikari.User,
     xp: int,
+    *,
+    low_priority: bool = False,
+    source: Source = "message",
+    event_code: str | None = None,
 ):
+    """Low priority level up announcements are skipped when the bot is overloaded with interactions"""
     profile = await get_profile(pool, user)
     await profile.add_exp(pool, xp)
+    xp_ledger.record(user.id, xp, source, event_code)
     new_profile = await get_profile(pool, user)
     if profile.level != new_profile.level and profile.level > 0:
+        if low_priority and interactions.should_shed():
+            return
         channel_id = int(os.getenv("XP_CHANNEL") or 0)
         for level in range(profile.level + 1, new_profile.level + 1):
             await client.create_message(
@@ -31,18 +54,116 @@ async def add_exp(
             )
 
 
+@dataclass(frozen=True)
+class ExpGrant:
+    client: hikari.api.RESTClient
+    pool: AsyncConnectionPool
+    user: hikari.User
+    xp: int
+
+    def __add__(self, other: "ExpGrant") -> "ExpGrant":
+        return ExpGrant(other.client, other.pool, other.user, self.xp + other.xp)
+
+
+async def grant_exp(_: hikari.Snowflake, grant: ExpGrant) -> None:
+    await add_exp(grant.client, grant.pool, grant.user, grant.xp, low_priority=True)
+
+
+# Keeps gateway dispatch from waiting on the DB. When the DB is slow, grants for the same user are added together
+# while they wait and grants beyond the queue size are dropped rather than piling up.
+exp_queue = WorkQueue(
+    "exp",
+    grant_exp,
+    workers=int(os.getenv("EXP_QUEUE_WORKERS", "4")),
+    maxsize=int(os.getenv("EXP_QUEUE_SIZE", "1000")),
+    overflow="drop_new",
+    merge=ExpGrant.__add__,
+    yield_to=interactions,
+)
+
+
 @loader.listener(hikari.GuildMessageCreateEvent)
-async def on_message(event: hikari.GuildMessageCreateEvent, pool: AsyncConnectionPool) -> None:
+async def on_message(event: hikari.GuildMessageCreateEvent, pool: BackgroundPool) -> None:
     user = event.author
     if user.is_bot:
         return
 
     current_time = datetime.now()
-    time_since_last_xp = current_time - cooldowns[user]
+    time_since_last_xp = current_time - cooldowns[user.id]
     if time_since_last_xp < cooldown:
         return
-    cooldowns[user] = current_time
-    await add_exp(event.app.rest, pool, user, get_exp())
+    cooldowns[user.id] = current_time
+    exp_queue.put_nowait(user.id, ExpGrant(event.app.rest, pool, user, get_exp()))
+
+
+async def flush_exp(grants: dict[hikari.Snowflake, ExpGrant]) -> int:
+    """Saves grants left over at shutdown in one statement per pool, without level up announcements"""
+    by_pool: defaultdict[AsyncConnectionPool, dict[int, int]] = defaultdict(dict)
+    for user_id, grant in grants.items():
+        by_pool[grant.pool][int(user_id)] = grant.xp
+    saved = 0
+    for pool, amounts in by_pool.items():
+        saved += await add_exp_many(pool, amounts)
+        for user_id, xp in amounts.items():
+            xp_ledger.record(user_id, xp, "message")
+    # The ledger's own shutdown flush may already have run
+    await xp_ledger.flush()
+    return saved
+
+
+# Grants still waiting at shutdown are saved without their announcements instead of being lost
+shutdown.add_queue(exp_queue, flush=flush_exp)
+
+
+@loader.listener(hikari.StartedEvent)
+async def start_xp_ledger(_: hikari.StartedEvent, pool: BackgroundPool) -> None:
+    await add_partitions(pool)
+    xp_ledger.start(pool)
+
+
+async def flush_xp_ledger(_: float) -> Outcome:
+    written = await xp_ledger.stop()
+    return Outcome(flushed=written, dropped=xp_ledger.stats()["buffered"])
+
+
+shutdown.on("flush", "xp ledger", flush_xp_ledger)
+
+
+@loader.task(lightbulb.uniformtrigger(hours=24))
+async def check_xp_ledger(pool: AsyncConnectionPool) -> None:
+    """Keeps next month's partition ready and warns if the totals have drifted from the ledger"""
+    await add_partitions(pool)
+    # Not the background pool, reading the whole ledger would keep one of its connections from grants for a while
+    drifted, worst = await verify_totals(pool, xp_ledger, limit=5)
+    if drifted:
+        logger.warning("%d profiles' XP totals don't match the ledger, for example %s", drifted, worst)
+
+
+def dump_cooldowns() -> list:
+    """Only cooldowns that haven't run out yet, the rest are the same as having none"""
+    since = datetime.now() - cooldown
+    return [[user_id, last.timestamp()] for user_id, last in cooldowns.items() if last > since]
+
+
+def load_cooldowns(entries: list) -> int:
+    for user_id, last in entries:
+        cooldowns[hikari.Snowflake(user_id)] = datetime.fromtimestamp(last)
+    return len(entries)
+
+
+def dump_avatar_colors() -> list:
+    return [[url, color] for url, color in avatar_colors.items()]
+
+
+def load_avatar_colors(entries: list) -> int:
+    for url, color in entries:
+        avatar_colors[url] = tuple(color)
+    return len(entries)
+
+
+# Restarting shouldn't hand out XP again to everyone who just got some, or download every avatar again
+snapshots.register("cooldowns", 1, dump_cooldowns, load_cooldowns)
+snapshots.register("avatar_colors", 1, dump_avatar_colors, load_avatar_colors)
 
 
 profile = lightbulb.Group("profile", "commands related to profiles")
@@ -85,10 +206,11 @@ class View(
     user = lightbulb.user("user", "the user, defaults to yourself", default=None)
 
     @lightbulb.invoke
-    async def invoke(self, ctx: lightbulb.Context, pool: AsyncConnectionPool) -> None:
+    async def invoke(self, ctx: lightbulb.Context, pool: AsyncConnectionPool, read_pool: ReadPool) -> None:
         await ctx.defer()
         user = self.user or ctx.user
-        profile = await get_profile(pool, user)
+        # Only users without a profile need the primary, to create one
+        profile = await read_profile(read_pool, user) or await get_profile(pool, user)
         # fields = translations[self.lang]["fields"]
         fields = translations["en"]["fields"]
 
@@ -1,195 +1,36 @@
-import csv
+import asyncio
+import contextlib
+import copy
+import functools
+import gzip
+import math
 import os
 import re
-from dataclasses import dataclass
-from io import StringIO
-from typing import Literal, Self
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from urllib.request import urlopen
+from zoneinfo import ZoneInfo
 
-import email_validator
 import hikari
 import jwt
 import lightbulb
 import miru
-import phonenumbers
-from mailersend import emails
-from psycopg.rows import dict_row
+from psycopg import AsyncConnection
 from psycopg.sql import SQL, Identifier
 from psycopg_pool import AsyncConnectionPool
 
-from bot import OwnerMention
-
-type SupportedLanguage = Literal["en", "cn"]
-
-type D[T] = dict[str, T | D[T]]
-
-
-@dataclass
-class UserInfo:
-    lang: SupportedLanguage
-    first_name: str
-    last_name: str
-    email: str | None = None
-    zid: str | None = None
-    phone: str | None = None
-    id: int = 0
-
-    def __post_init__(self):
-        self.first_name = self.first_name.strip()
-        self.last_name = self.last_name.strip()
-
-        if self.zid is not None:
-            self.zid = self.zid.strip()
-            if not self.zid.lower().startswith("z"):
-                self.zid = f"z{self.zid}"
-
-        if self.email is not None:
-            self.email = self.email.strip()
-
-        if self.phone is not None:
-            self.phone = self.phone.strip()
-
-    def validate(self) -> str | None:
-        """
-        Validates user info
-        :return: None if valid else error message
-        """
-        t = translations[self.lang]
-        if not self.first_name:
-            return t["validation"]["first_name"]
-        if not self.last_name:
-            return t["validation"]["last_name"]
-        if self.zid is not None and not re.match(r"z\d{7}$", self.zid):
-            return t["validation"]["zid"]
-        if self.email is not None:
-            try:
-                email_info = email_validator.validate_email(self.email, check_deliverability=False)
-                self.email = email_info.normalized
-            except email_validator.EmailNotValidError:
-                return t["validation"]["email"]
-        if self.phone is not None:
-            try:
-                phone_num = phonenumbers.parse(self.phone, "AU")
-                self.phone = phonenumbers.format_number(phone_num, phonenumbers.PhoneNumberFormat.E164)
-            except phonenumbers.NumberParseException:
-                return t["validation"]["phone"]
-
-        return None
+from bot.app import BackgroundPool, OwnerMention, ReadPool, interaction_router, miru_client, shutdown
+from bot.extensions.verification_utils.jobs import JobDrainer
+from bot.extensions.verification_utils.lookup import PAGE_SIZE, classify_query, search_members
+from bot.extensions.verification_utils.mail import EmailQueue, transport_from_env
+from bot.extensions.verification_utils.users import SupportedLanguage, UserInfo, translations
+from bot.utils.assets import AssetRegistry
+from bot.utils.caches import register_size
+from bot.utils.shutdown import Outcome
 
-    def to_dict(self) -> dict:
-        return {
-            "id": str(self.id),
-            "lang": self.lang,
-            "first_name": self.first_name,
-            "last_name": self.last_name,
-            "zid": self.zid,
-            "email": self.email,
-            "phone": self.phone,
-        }
-
-    @classmethod
-    def from_dict(cls, data: dict) -> Self:
-        return cls(
-            lang=data["lang"],
-            first_name=data["first_name"],
-            last_name=data["last_name"],
-            zid=data["zid"],
-            email=data["email"],
-            phone=data["phone"],
-            id=int(data["id"]),
-        )
-
-
-translations: dict[SupportedLanguage, D[str]] = {
-    "en": {
-        "choice": {
-            "unsw": "Verify (UNSW)",
-            "non-unsw": "Verify (Non-UNSW)",
-        },
-        "fields": {
-            "first_name": "First Name",
-            "last_name": "Last Name",
-            "zid": "zID",
-            "email": "Email",
-            "phone": "Phone Number",
-        },
-        "field_hints": {
-            "first_name": "",
-            "last_name": "",
-            "zid": "E.g. z1234567",
-            "email": "E.g. ibi@animeunsw.net",
-            "phone": "E.g. 0412345678 or +61412345678",
-        },
-        "validation": {
-            "first_name": "First name is required.",
-            "last_name": "Last name is required.",
-            "zid": "Please enter a valid zID (e.g. z1234567)",
-            "email": "Please enter a valid email. (e.g. ibi@animeunsw.net)",
-            "phone": "Please enter a valid phone number (e.g. 0412345678 or +61412345678)",
-        },
-        "confirmed": "Thanks for verifying, {user_info.first_name}! "
-        "Please check your email, {user_info.email}, for the next step.",
-        "welcome_message": "Welcome {user}! Feel free to leave an introduction in {introduction_channel}.",
-        "endpoint": {
-            "success": "Successfully verified!",
-            "fail": "Verification was not successful, please contact {owner} on Discord for support.",
-        },
-        "message": {
-            "initial": "Welcome to AUNSW! If you can see this then you're unverified, but don't worry; it's a simple process to get you verified.",
-            "steps1": '1. Accept the rules by clicking the "Complete" button at the bottom of the screen and following the instructions.\n2. Depending on whether you\'re a UNSW student or not, fill out the corresponding form by pressing on one of buttons below.\n3. If you filling out the UNSW form, you will receive a message in your student email, else if you filled out the Non-UNSW form, it will be sent to the email you provided.\n4. Click on the button in the email labeled "Verify," as shown below.',
-            "steps2": "5. Profit!",
-            "buttons": {
-                "unsw": "Verify (UNSW)",
-                "non-unsw": "Verify (Non-UNSW)",
-            },
-        },
-    },
-    "cn": {
-        "choice": {
-            "unsw": "验证 (UNSW)",
-            "non-unsw": "验证 (非UNSW)",
-        },
-        "fields": {
-            "first_name": "名",
-            "last_name": "姓",
-            "zid": "zID",
-            "email": "电子邮件",
-            "phone": "电话号码",
-        },
-        "field_hints": {
-            "first_name": "",
-            "last_name": "",
-            "zid": "例如 z1234567",
-            "email": "例如 lbi@animeunsw.net",
-            "phone": "例如 0412345678 或 +61412345678",
-        },
-        "validation": {
-            "first_name": "名是必填项。",
-            "last_name": "姓是必填项。",
-            "zid": "请输入有效的zID（例如 z1234567）",
-            "email": "请输入有效的电子邮件（例如 lbi@animeunsw.net）",
-            "phone": "请输入有效的电话号码（例如 0412345678 或 +61412345678）",
-        },
-        "confirmed": "感谢您的验证，{user_info.first_name}！请检查您的电子邮件，{user_info.email}，以获取下一步指示。",
-        "welcome_message": "欢迎 {user}！欢迎在 {introduction_channel} 留下自我介绍。",
-        "endpoint": {
-            "success": "验证成功！",
-            "fail": "验证未成功，请在Discord上联系{owner}寻求帮助。",
-        },
-        "message": {
-            "initial": "欢迎来到UNSW！如果您看到此消息，则表示您尚未通过验证，但请别担心；验证过程很简单。",
-            "steps1": "1. 点击屏幕下方的 “完成 ”按钮，按照说明接受规则。\n2. 根据您是否是UNSW学生，通过点击以下按钮之一填写相应的表格。\n3. 如果您填写的是UNSW表格，您将在您的学生邮箱中收到一条消息；如果您填写的是非UNSW表格，则会发送到您提供的电子邮件地址。\n4. 点击电子邮件中标有“验证”的按钮，如下图所示。",
-            "steps2": "5. 搞定！",
-            "buttons": {
-                "unsw": "验证 (UNSW)",
-                "non-unsw": "验证 (非UNSW)",
-            },
-        },
-    },
-}
 
-
-def verification_message_components(lang: SupportedLanguage):
+def verification_message_components(lang: SupportedLanguage, assets: AssetRegistry):
     t = translations[lang]["message"]
     return [
         hikari.impl.TextDisplayComponentBuilder(content=t["initial"]),
@@ -198,9 +39,7 @@ def verification_message_components(lang: SupportedLanguage):
                 hikari.impl.TextDisplayComponentBuilder(content=t["steps1"]),
                 hikari.impl.MediaGalleryComponentBuilder(
                     items=[
-                        hikari.impl.MediaGalleryItemBuilder(
-                            media=f"src/bot/images/verification_email_{lang}.png",
-                        ),
+                        assets.media_item(f"verification_email_{lang}.png"),
                     ]
                 ),
                 hikari.impl.TextDisplayComponentBuilder(content=t["steps2"]),
@@ -223,24 +62,49 @@ def verification_message_components(lang: SupportedLanguage):
     ]
 
 
-# public_ip = urlopen("https://ident.me").read().decode("utf8")
-
-# For testing env
-# public_ip = 'localhost'
-
 def get_public_ip() -> str:
     try:
         return urlopen("https://ident.me", timeout=5).read().decode("utf8")
     except Exception:
-        return os.getenv("PUBLIC_IP", "127.0.0.1")
+        return "127.0.0.1"
+
+
+def resolve_base_url() -> str:
+    """
+    Base URL for verification links. VERIFICATION_BASE_URL is used as is, otherwise PUBLIC_IP, otherwise
+    the public IP is looked up, which blocks so this should be run in a thread
+    """
+    if base_url := os.getenv("VERIFICATION_BASE_URL"):
+        return base_url.rstrip("/")
+    return f"http://{os.getenv('PUBLIC_IP') or get_public_ip()}:{os.getenv('SERVER_PORT', '8000')}"
+
+
+base_url_task: asyncio.Task[str] | None = None
 
-public_ip = get_public_ip()
 
-async def send_verification_email(user_info: UserInfo):
-    url = f"http://{public_ip}:8000"
-    link = f"{url}/verify/{jwt.encode(user_info.to_dict(), os.getenv('JWT_TOKEN'), algorithm='HS256')}"
-    mailer = emails.NewEmail(os.getenv("MAILERSEND_API_KEY"))
-    mail_body = {
+def get_base_url() -> asyncio.Task[str]:
+    """Resolves the base URL in the background the first time it's needed, then reuses the result"""
+    global base_url_task
+    if base_url_task is None:
+        base_url_task = asyncio.create_task(asyncio.to_thread(resolve_base_url))
+    return base_url_task
+
+
+link_ttl = timedelta(seconds=int(os.getenv("VERIFICATION_LINK_TTL", str(24 * 60 * 60))))
+
+email_queue = EmailQueue(
+    transport_from_env(),
+    workers=int(os.getenv("EMAIL_WORKERS", "4")),
+    throttle=float(os.getenv("EMAIL_THROTTLE_SECONDS", "60")),
+)
+register_size("email_queue", lambda: email_queue.stats()["depth"])
+
+
+async def verification_mail_body(user_info: UserInfo) -> dict:
+    url = await get_base_url()
+    claims = {**user_info.to_dict(), "exp": datetime.now(timezone.utc) + link_ttl}
+    link = f"{url}/verify/{jwt.encode(claims, os.getenv('JWT_TOKEN'), algorithm='HS256')}"
+    return {
         "from": {"name": "AnimeUNSW", "email": "socials@animeunsw.net"},
         "to": [{"name": user_info.first_name, "email": user_info.email}],
         "subject": "AnimeUNSW Discord Verification",
@@ -252,7 +116,6 @@ async def send_verification_email(user_info: UserInfo):
             }
         ],
     }
-    return mailer.send(mail_body)
 
 
 loader = lightbulb.Loader()
@@ -268,17 +131,87 @@ welcome_channel_id = int(os.getenv("WELCOME_CHANNEL", "0"))
 introduction_channel_id = int(os.getenv("INTRODUCTION_CHANNEL", "0"))
 
 
-async def verify_user(user_id: hikari.Snowflakeish, rest: hikari.api.RESTClient, lang: SupportedLanguage = "en"):
-    member = await rest.fetch_member(guild_id, user_id)
-    for role_id in role_ids:
-        await member.add_role(role_id, reason="verification")
+@loader.listener(hikari.StartedEvent)
+async def resolve_base_url_early(_: hikari.StartedEvent) -> None:
+    get_base_url()
+
+
+async def close_email_queue(_: float) -> None:
+    email_queue.close()
+
+
+async def drain_email_queue(timeout: float) -> Outcome:
+    sent = email_queue.sent
+    unsent = await email_queue.stop(timeout)
+    return Outcome(flushed=email_queue.sent - sent, dropped=unsent)
+
+
+shutdown.on("intake", "email queue", close_email_queue)
+shutdown.on("drain", "email queue", drain_email_queue)
+
+
+job_drainer: JobDrainer | None = None
+
 
-    # For testing, since no roles in testing
-    if not role_ids:
-        return
+@loader.listener(hikari.StartedEvent)
+async def start_job_drainer(_: hikari.StartedEvent, pool: BackgroundPool, bot: hikari.GatewayBot) -> None:
+    """Gives out roles for verifications completed on the web server"""
+    global job_drainer
 
-    # If user does not already have the member role
-    if role_ids[0] not in member.role_ids:
+    async def assign_roles(user_id: int, lang: SupportedLanguage) -> None:
+        await verify_user(user_id, bot.rest, lang, cache=member_cache(bot))
+
+    job_drainer = JobDrainer(
+        pool,
+        os.environ["DATABASE_URL"],
+        assign_roles,
+        concurrency=int(os.getenv("VERIFICATION_JOB_CONCURRENCY", "4")),
+    )
+    job_drainer.start()
+
+
+async def drain_job_drainer(timeout: float) -> Outcome | None:
+    """Jobs are in Postgres, so none are lost, interrupted ones are run again once their lease runs out"""
+    if job_drainer is None:
+        return None
+    processed = job_drainer.processed
+    await job_drainer.stop(timeout)
+    return Outcome(flushed=job_drainer.processed - processed)
+
+
+shutdown.on("drain", "verification jobs", drain_job_drainer)
+
+
+def member_cache(bot: hikari.GatewayBot) -> hikari.api.Cache | None:
+    """The bot's cache, if member updates are received so that cached role lists can be trusted"""
+    return bot.cache if hikari.Intents.GUILD_MEMBERS in bot.intents else None
+
+
+async def verify_user(
+    user_id: hikari.Snowflakeish,
+    rest: hikari.api.RESTClient,
+    lang: SupportedLanguage = "en",
+    *,
+    cache: hikari.api.Cache | None = None,
+    welcome: bool = True,
+) -> bool:
+    """
+    Gives a member all verification roles in a single member edit
+
+    Returns:
+        Whether any roles were added
+    """
+    member = cache.get_member(guild_id, user_id) if cache is not None else None
+    if member is None:
+        member = await rest.fetch_member(guild_id, user_id)
+
+    missing_role_ids = [role_id for role_id in role_ids if role_id not in member.role_ids]
+    if not missing_role_ids:
+        return False
+    await rest.edit_member(guild_id, user_id, roles=[*member.role_ids, *missing_role_ids], reason="verification")
+
+    # If user did not already have the member role
+    if welcome and role_ids[0] in missing_role_ids:
         await rest.create_message(
             welcome_channel_id,
             content=translations[lang]["welcome_message"].format(
@@ -286,33 +219,46 @@ async def verify_user(user_id: hikari.Snowflakeish, rest: hikari.api.RESTClient,
                 introduction_channel="<#" + str(introduction_channel_id) + ">",
             ),
         )
-
-
-async def add_user_to_db(db: AsyncConnectionPool, user: UserInfo):
-    if user.zid is not None:
-        user.email = None
-    async with db.connection() as conn:
-        await conn.execute(
-            """
-            INSERT INTO users (id, first_name, last_name, zid, email, phone_number)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (id) DO UPDATE SET
-                first_name = EXCLUDED.first_name,
-                last_name = EXCLUDED.last_name,
-                zid = EXCLUDED.zid,
-                email = EXCLUDED.email,
-                phone_number = EXCLUDED.phone_number
-            """,
-            (
-                user.id,
-                user.first_name,
-                user.last_name,
-                user.zid,
-                user.email,
-                user.phone,
-            ),
-        )
-        await conn.commit()
+    return True
+
+
+async def verify_users(
+    user_ids: list[int],
+    rest: hikari.api.RESTClient,
+    *,
+    cache: hikari.api.Cache | None = None,
+    concurrency: int = 3,
+    max_retries: int = 3,
+) -> dict[str, list[int]]:
+    """
+    Verifies many users at once without welcome messages, at most ``concurrency`` at a time.
+    Rate limits too long for hikari to wait out are waited for here and retried.
+
+    Returns:
+        User ids grouped by outcome
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results: dict[str, list[int]] = {"verified": [], "already verified": [], "not in server": [], "failed": []}
+
+    async def verify_one(user_id: int) -> None:
+        async with semaphore:
+            for _ in range(max_retries):
+                try:
+                    added = await verify_user(user_id, rest, cache=cache, welcome=False)
+                except hikari.RateLimitTooLongError as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except hikari.NotFoundError:
+                    results["not in server"].append(user_id)
+                except hikari.HTTPError:
+                    results["failed"].append(user_id)
+                else:
+                    results["verified" if added else "already verified"].append(user_id)
+                return
+            results["failed"].append(user_id)
+
+    await asyncio.gather(*(verify_one(user_id) for user_id in user_ids))
+    return results
 
 
 verify = lightbulb.Group("verify", "commands related to verification")
@@ -328,10 +274,16 @@ class User(
     user = lightbulb.user("user", "the user to verify")
 
     @lightbulb.invoke
-    async def invoke(self, ctx: lightbulb.Context, client: lightbulb.Client, owner_mention: OwnerMention) -> None:
+    async def invoke(
+        self,
+        ctx: lightbulb.Context,
+        client: lightbulb.Client,
+        bot: hikari.GatewayBot,
+        owner_mention: OwnerMention,
+    ) -> None:
         await ctx.defer(ephemeral=True)
         try:
-            await verify_user(self.user.id, client.rest)
+            await verify_user(self.user.id, client.rest, cache=member_cache(bot))
         except Exception:
             await ctx.respond(
                 f"There was an error in verifying {self.user.mention}. Please contact {owner_mention} for support!"
@@ -339,6 +291,43 @@ class User(
         await ctx.respond(f"{self.user.mention} is verified!", ephemeral=True)
 
 
+@verify.register
+class Bulk(
+    lightbulb.SlashCommand,
+    name="bulk",
+    description="verify many users at once from a list or csv of ids",
+    hooks=[lightbulb.prefab.has_permissions(hikari.Permissions.MANAGE_ROLES)],
+):
+    ids = lightbulb.string("ids", "user ids separated by spaces or commas", default=None)
+    file = lightbulb.attachment("file", "a text or csv file containing user ids", default=None)
+
+    @lightbulb.invoke
+    async def invoke(self, ctx: lightbulb.Context, client: lightbulb.Client, bot: hikari.GatewayBot) -> None:
+        await ctx.defer(ephemeral=True)
+        text = self.ids or ""
+        if self.file is not None:
+            text += "\n" + (await self.file.read()).decode(errors="ignore")
+        # Anything that looks like a snowflake, so a csv from /verify log works as is
+        user_ids = list(dict.fromkeys(int(match) for match in re.findall(r"\b\d{17,20}\b", text)))
+        if not user_ids:
+            await ctx.respond("I couldn't find any user ids to verify!", ephemeral=True)
+            return
+
+        results = await verify_users(
+            user_ids,
+            client.rest,
+            cache=member_cache(bot),
+            concurrency=int(os.getenv("VERIFY_BULK_CONCURRENCY", "3")),
+        )
+        summary = "\n".join(f"{outcome.capitalize()}: {len(ids)}" for outcome, ids in results.items())
+        failed = results["failed"] + results["not in server"]
+        if failed:
+            summary += "\n\nNot verified: " + ", ".join(str(user_id) for user_id in failed[:50])
+            if len(failed) > 50:
+                summary += f" and {len(failed) - 50} more"
+        await ctx.respond(summary, ephemeral=True)
+
+
 @verify.register
 class Message(
     lightbulb.SlashCommand,
@@ -353,8 +342,11 @@ class Message(
     )
 
     @lightbulb.invoke
-    async def invoke(self, ctx: lightbulb.Context, client: lightbulb.Client) -> None:
-        await client.rest.create_message(ctx.channel_id, components=verification_message_components(self.lang))
+    async def invoke(self, ctx: lightbulb.Context, client: lightbulb.Client, assets: AssetRegistry) -> None:
+        message = await client.rest.create_message(
+            ctx.channel_id, components=verification_message_components(self.lang, assets)
+        )
+        assets.remember_message(message)
         await ctx.respond(
             "The verification message has been sent in the current channel!",
             flags=hikari.MessageFlag.EPHEMERAL,
@@ -362,26 +354,11 @@ class Message(
 
 
 # We do this manually as neither lightbulb nor miru support Components V2 just yet
-@loader.listener(hikari.ComponentInteractionCreateEvent)
-async def verify_button_listener(event: hikari.ComponentInteractionCreateEvent, miru_client: miru.Client):
-    match event.interaction.custom_id:
-        case "verify:button:en:unsw":
-            modal = VerifyModal("en", True)
-            builder = modal.build_response(miru_client)
-            await builder.create_modal_response(event.interaction)
-            miru_client.start_modal(modal)
-        case "verify:button:en:non-unsw":
-            modal = VerifyModal("en", False)
-            builder = modal.build_response(miru_client)
-            await builder.create_modal_response(event.interaction)
-            miru_client.start_modal(modal)
-        case "verify:button:cn:unsw":
-            modal = VerifyModal("cn", True)
-            builder = modal.build_response(miru_client)
-            await builder.create_modal_response(event.interaction)
-            miru_client.start_modal(modal)
-        case "verify:button:cn:non-unsw":
-            modal = VerifyModal("cn", False)
+@interaction_router.register("verify:button")
+async def verify_button_listener(event: hikari.ComponentInteractionCreateEvent, args: list[str]) -> None:
+    match args:
+        case [("en" | "cn") as lang, ("unsw" | "non-unsw") as form]:
+            modal = VerifyModal(lang, form == "unsw")
             builder = modal.build_response(miru_client)
             await builder.create_modal_response(event.interaction)
             miru_client.start_modal(modal)
@@ -405,55 +382,52 @@ async def verify_button_listener(event: hikari.ComponentInteractionCreateEvent,
 #         await ctx.respond("owo")
 
 
+# (min length, max length) of each input
+input_lengths = {
+    "first_name": (1, 64),
+    "last_name": (1, 64),
+    "zid": (8, 8),
+    "email": (4, 254),
+    "phone": (8, 15),
+}
+
+
+@functools.cache
+def modal_template(lang: SupportedLanguage, is_unsw: bool) -> tuple[str, dict[str, miru.TextInput]]:
+    """Title and unattached inputs of a VerifyModal, built once per form and copied for every click"""
+    t = translations[lang]
+    names = ["first_name", "last_name", *(["zid"] if is_unsw else ["email", "phone"])]
+    inputs = {
+        name: miru.TextInput(
+            label=t["fields"][name],
+            placeholder=t["field_hints"][name],
+            required=True,
+            min_length=input_lengths[name][0],
+            max_length=input_lengths[name][1],
+        )
+        for name in names
+    }
+    return t["choice"]["unsw" if is_unsw else "non-unsw"], inputs
+
+
 class VerifyModal(miru.Modal):
+    first_name: miru.TextInput
+    last_name: miru.TextInput
+    zid: miru.TextInput
+    email: miru.TextInput
+    phone: miru.TextInput
+
     def __init__(self, lang: SupportedLanguage, is_unsw: bool) -> None:
         self.t = translations[lang]
         self.lang = lang
         self.is_unsw = is_unsw
-        super().__init__(title=self.t["choice"]["unsw" if is_unsw else "non-unsw"])
+        title, inputs = modal_template(lang, is_unsw)
+        super().__init__(title=title)
 
-        self.first_name = miru.TextInput(
-            label=self.t["fields"]["first_name"],
-            placeholder=self.t["field_hints"]["first_name"],
-            required=True,
-            min_length=1,
-            max_length=64,
-        )
-        self.last_name = miru.TextInput(
-            label=self.t["fields"]["last_name"],
-            placeholder=self.t["field_hints"]["last_name"],
-            required=True,
-            min_length=1,
-            max_length=64,
-        )
-        self.zid = miru.TextInput(
-            label=self.t["fields"]["zid"],
-            placeholder=self.t["field_hints"]["zid"],
-            required=True,
-            min_length=8,
-            max_length=8,
-        )
-        self.email = miru.TextInput(
-            label=self.t["fields"]["email"],
-            placeholder=self.t["field_hints"]["email"],
-            required=True,
-            min_length=4,
-            max_length=254,
-        )
-        self.phone = miru.TextInput(
-            label=self.t["fields"]["phone"],
-            placeholder=self.t["field_hints"]["phone"],
-            required=True,
-            min_length=8,
-            max_length=15,
-        )
-        self.add_item(self.first_name)
-        self.add_item(self.last_name)
-        if is_unsw:
-            self.add_item(self.zid)
-        else:
-            self.add_item(self.email)
-            self.add_item(self.phone)
+        for name, template in inputs.items():
+            text_input = copy.copy(template)
+            setattr(self, name, text_input)
+            self.add_item(text_input)
 
     async def callback(self, ctx: miru.ModalContext) -> None:
         await ctx.defer(flags=hikari.MessageFlag.EPHEMERAL)
@@ -476,102 +450,231 @@ class VerifyModal(miru.Modal):
         if self.is_unsw:
             user_info.email = self.zid.value + "@unsw.edu.au"
 
-        await send_verification_email(user_info)
-        await ctx.respond(
-            self.t["confirmed"].format(user_info=user_info),
-            flags=hikari.messages.MessageFlag.EPHEMERAL,
-        )
+        assert user_info.email is not None
+        match email_queue.enqueue(user_info.email, await verification_mail_body(user_info)):
+            case "throttled":
+                response = self.t["email_throttled"].format(user_info=user_info)
+            case "full":
+                response = self.t["email_busy"]
+            case _:
+                response = self.t["confirmed"].format(user_info=user_info)
+        await ctx.respond(response, flags=hikari.messages.MessageFlag.EPHEMERAL)
+
+
+# Discord's upload limit for bots in servers without boosts
+upload_limit = int(os.getenv("DISCORD_UPLOAD_LIMIT", str(10 * 1024 * 1024)))
+tz = ZoneInfo("Australia/Sydney")
 
 
 @verify.register
 class Log(
     lightbulb.SlashCommand,
     name="log",
-    description="get verification logs as csvs",
+    description="get verification logs as compressed csvs",
     hooks=[lightbulb.prefab.has_permissions(hikari.Permissions.MODERATE_MEMBERS)],
 ):
+    table = lightbulb.string(
+        "table",
+        "which verification table to export",
+        default="both",
+        choices=[
+            lightbulb.Choice("Both", "both"),
+            lightbulb.Choice("New system", "users"),
+            lightbulb.Choice("Old system", "old_users"),
+        ],
+    )
+    columns = lightbulb.string("columns", "comma separated columns to export, defaults to all", default=None)
+    since = lightbulb.string("since", "only users verified on or after DD/MM/YYYY (new system only)", default=None)
+    until = lightbulb.string("until", "only users verified before DD/MM/YYYY (new system only)", default=None)
+
     @lightbulb.invoke
-    async def invoke(self, ctx: lightbulb.Context, pool: AsyncConnectionPool) -> None:
+    async def invoke(self, ctx: lightbulb.Context, pool: ReadPool) -> None:
         await ctx.defer(ephemeral=True)
-        old_users = await get_csv(pool, "old_users")
-        new_users = await get_csv(pool, "users")
-        await ctx.respond(
-            attachments=[
-                hikari.Bytes(old_users, "old_users.csv"),
-                hikari.Bytes(new_users, "new_users.csv"),
-            ]
-        )
-
+        try:
+            since = datetime.strptime(self.since, "%d/%m/%Y").replace(tzinfo=tz) if self.since else None
+            until = datetime.strptime(self.until, "%d/%m/%Y").replace(tzinfo=tz) if self.until else None
+        except ValueError:
+            await ctx.respond("Give dates in DD/MM/YYYY format.", ephemeral=True)
+            return
+        columns = [column.strip() for column in self.columns.split(",") if column.strip()] if self.columns else None
 
-async def get_csv(pool: AsyncConnectionPool, table_name: str) -> StringIO:
-    buffer = StringIO()
-    writer = csv.writer(buffer)
+        tables = {"old_users": "old_users", "users": "new_users"}
+        both = self.table == "both"
+        if not both:
+            tables = {self.table: tables[self.table]}
+        for table_name, file_name in tables.items():
+            try:
+                # Closed as soon as a response fails, rather than holding the COPY and its connection until collected
+                async with contextlib.aclosing(
+                    get_csv(pool, table_name, file_name, columns, since, until, skip_missing=both)
+                ) as attachments:
+                    async for attachment in attachments:
+                        await ctx.respond(attachment=attachment, ephemeral=True)
+            except ValueError as e:
+                # With both tables, one that can't be exported as asked doesn't stop the other
+                await ctx.respond(f"Skipped {table_name}: {e}" if both else str(e), ephemeral=True)
+                if not both:
+                    return
+
+
+async def table_columns(conn: AsyncConnection, table_name: str) -> list[str]:
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+            ORDER BY ordinal_position
+            """,
+            (table_name,),
+        )
+        return [row[0] for row in await cur.fetchall()]
+
+
+async def get_csv(
+    pool: AsyncConnectionPool,
+    table_name: str,
+    file_name: str,
+    columns: list[str] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    *,
+    skip_missing: bool = False,
+) -> AsyncIterator[hikari.Bytes]:
+    """
+    Streams a table out of Postgres with COPY into gzipped csvs, starting a new part (with the header repeated)
+    whenever one gets close to the upload limit. Only one part is held in memory at a time.
+
+    With ``skip_missing``, requested columns the table doesn't have are left out instead of being an error.
+
+    Raises:
+        ValueError: If the table or a requested column doesn't exist (or none of them do with ``skip_missing``),
+            or a date range is given for a table without verification dates
+    """
     async with pool.connection() as conn:
+        existing_columns = await table_columns(conn, table_name)
+        if not existing_columns:
+            raise ValueError(f"{table_name} table does not exist")
+        if columns is None:
+            columns = existing_columns
+        elif unknown := [column for column in columns if column not in existing_columns]:
+            if not skip_missing or len(unknown) == len(columns):
+                raise ValueError(f"{table_name} has no column(s) {', '.join(unknown)}")
+            columns = [column for column in columns if column in existing_columns]
+
+        conditions: list[SQL] = []
+        params: list[datetime] = []
+        if since is not None or until is not None:
+            if "verified_at" not in existing_columns:
+                raise ValueError(f"{table_name} has no verification dates to filter by")
+            if since is not None:
+                conditions.append(SQL("verified_at >= %s"))
+                params.append(since)
+            if until is not None:
+                conditions.append(SQL("verified_at < %s"))
+                params.append(until)
+        query = SQL("COPY (SELECT {columns} FROM {table} {where}) TO STDOUT WITH (FORMAT csv, HEADER)").format(
+            columns=SQL(", ").join(map(Identifier, columns)),
+            table=Identifier(table_name),
+            where=SQL("WHERE ") + SQL(" AND ").join(conditions) if conditions else SQL(""),
+        )
+
+        part = 1
+        buffer = BytesIO()
+        archive = gzip.GzipFile(fileobj=buffer, mode="wb")
+        header = None
         async with conn.cursor() as cur:
-            query = SQL("SELECT * FROM {}").format(Identifier(table_name))
-            await cur.execute(query)
-            if cur.description is None:
-                raise ValueError(f"{table_name} table does not exist")
-            col_names = [desc.name for desc in cur.description]
-            writer.writerow(col_names)
-            async for row in cur:
-                writer.writerow(row)
-    buffer.seek(0)
-    return buffer
+            async with cur.copy(query, params or None) as copy:
+                # Server side COPY sends one row per chunk so parts are always split between rows
+                async for row in copy:
+                    if header is None:
+                        header = bytes(row)
+                    elif buffer.tell() > upload_limit - 1024 * 1024:
+                        archive.close()
+                        yield hikari.Bytes(buffer.getvalue(), part_file_name(file_name, part))
+                        part += 1
+                        buffer = BytesIO()
+                        archive = gzip.GzipFile(fileobj=buffer, mode="wb")
+                        archive.write(header)
+                    archive.write(row)
+        archive.close()
+        yield hikari.Bytes(buffer.getvalue(), part_file_name(file_name, part))
+
+
+def part_file_name(file_name: str, part: int) -> str:
+    return f"{file_name}.csv.gz" if part == 1 else f"{file_name}.part{part}.csv.gz"
 
 
 @verify.register
 class Lookup(
     lightbulb.SlashCommand,
     name="lookup",
-    description="lookup a user from id",
+    description="lookup a user in the new and old systems by id, zid, email, phone or name",
     hooks=[lightbulb.prefab.has_permissions(hikari.Permissions.MODERATE_MEMBERS)],
 ):
     # Can't be int, blame js
-    user_id = lightbulb.string("id", "the id of the user to lookup")
+    query = lightbulb.string("query", "a discord id or mention, zid, email, phone number or part of a name")
+    page = lightbulb.integer("page", "which page of results to show", default=1, min_value=1)
 
     @lightbulb.invoke
-    async def invoke(self, ctx: lightbulb.Context, client: lightbulb.Client, pool: AsyncConnectionPool) -> None:
-        try:
-            user_id = int(self.user_id)
-        except ValueError:
-            await ctx.respond("User ID must be an integer!", ephemeral=True)
-
-        async with pool.connection() as conn:
-            async with conn.cursor(row_factory=dict_row) as cur:
-                await cur.execute("SELECT * FROM users WHERE id = %s", (self.user_id,))
-                user_info = await cur.fetchone()
-        if user_info is None:
-            await ctx.respond("User is not in the new system! Check the old system with `/verify log`.")
+    async def invoke(self, ctx: lightbulb.Context, client: lightbulb.Client, pool: ReadPool) -> None:
+        key, term = classify_query(self.query)
+        rows, total = await search_members(pool, key, term, self.page)
+        if not rows:
+            if total == 0 and self.page > 1:
+                await ctx.respond(f"There are no results on page {self.page}.")
+            else:
+                await ctx.respond(f"No users found with {key} `{term}`.")
             return
 
-        try:
-            user = await client.rest.fetch_user(user_id)
-        except hikari.UnauthorizedError:
-            await ctx.respond("Unauthorized to make a request.")
-            return
-        except hikari.NotFoundError:
-            await ctx.respond("ID does not correspond to a valid discord user.")
-            return
-        except hikari.RateLimitTooLongError:
-            await ctx.respond("Rate limited, please try again after a small wait.")
-            return
-        except hikari.InternalServerError:
-            await ctx.respond("Internal server error.")
+        if key == "id" and total == 1:
+            user_info = rows[0]
+            try:
+                user = await client.rest.fetch_user(user_info["id"])
+            except hikari.UnauthorizedError:
+                await ctx.respond("Unauthorized to make a request.")
+                return
+            except hikari.NotFoundError:
+                await ctx.respond("ID does not correspond to a valid discord user.")
+                return
+            except hikari.RateLimitTooLongError:
+                await ctx.respond("Rate limited, please try again after a small wait.")
+                return
+            except hikari.InternalServerError:
+                await ctx.respond("Internal server error.")
+                return
+
+            embed = hikari.Embed(
+                title=f"{user.username}",
+                description=f"{user.mention}",
+            ).set_thumbnail(user.display_avatar_url)
+            embed.add_field("System", "New" if user_info["source"] == "new" else "Old")
+            embed.add_field("First Name", user_info["first_name"])
+            embed.add_field("Last Name", user_info["last_name"])
+            if user_info["zid"] is not None:
+                embed.add_field("zid", user_info["zid"])
+            if user_info["email"] is not None:
+                embed.add_field("Email", user_info["email"])
+            if user_info["phone_number"] is not None:
+                embed.add_field("Phone Number", user_info["phone_number"])
+            await ctx.respond(embed=embed)
             return
 
+        pages = math.ceil(total / PAGE_SIZE)
         embed = hikari.Embed(
-            title=f"{user.username}",
-            description=f"{user.mention}",
-        ).set_thumbnail(user.display_avatar_url)
-        embed.add_field("First Name", user_info["first_name"])
-        embed.add_field("Last Name", user_info["last_name"])
-        if user_info["zid"] is not None:
-            embed.add_field("zid", user_info["zid"])
-        if user_info["email"] is not None:
-            embed.add_field("Email", user_info["email"])
-        if user_info["phone_number"] is not None:
-            embed.add_field("Phone Number", user_info["phone_number"])
+            title=f"Users matching {key} `{term}`",
+            description=f"{total} result{'s' if total != 1 else ''}",
+        ).set_footer(f"Page {self.page} of {pages}")
+        for user_info in rows:
+            details = [f"<@{user_info['id']}> ({user_info['id']})"]
+            for column, label in (("zid", "zid"), ("email", "Email"), ("phone_number", "Phone Number")):
+                if user_info[column] is not None:
+                    details.append(f"{label}: {user_info[column]}")
+            embed.add_field(
+                f"{user_info['first_name']} {user_info['last_name']} ({user_info['source']} system)",
+                "\n".join(details),
+                inline=False,
+            )
         await ctx.respond(embed=embed)
 
 
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import hikari
+import psycopg
+from psycopg.rows import DictRow, dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from bot.utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "verification_jobs"
+
+type JobHandler = Callable[[int, Any], Awaitable[object]]
+
+
+@timed
+async def enqueue_verification(pool: AsyncConnectionPool, user_id: int, lang: str) -> None:
+    """Queues role assignment for the bot and wakes it up. The notification is only sent once committed."""
+    async with pool.connection() as conn:
+        await conn.execute("INSERT INTO verification_jobs (user_id, lang) VALUES (%s, %s)", (user_id, lang))
+        await conn.execute(f"NOTIFY {CHANNEL}")
+        await conn.commit()
+
+
+class JobDrainer:
+    """
+    Drains verification_jobs, at most ``concurrency`` jobs at a time.
+
+    Jobs are claimed by pushing their run_after forward by ``lease`` seconds, so a job claimed by a process that
+    dies is picked up again once the lease runs out. Failed jobs are retried with exponential backoff and are marked
+    as failed after ``max_attempts``. The queue is checked whenever a NOTIFY arrives and every ``poll_interval``
+    seconds in case one was missed.
+    """
+
+    def __init__(
+        self,
+        pool: AsyncConnectionPool,
+        dsn: str,
+        handler: JobHandler,
+        *,
+        concurrency: int = 4,
+        poll_interval: float = 30.0,
+        max_attempts: int = 5,
+        lease: int = 300,
+    ) -> None:
+        self.pool = pool
+        self.dsn = dsn
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        # Set while waiting for jobs, when stopping won't interrupt any
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 0.0) -> None:
+        """
+        Waits up to ``timeout`` seconds for the jobs being run to finish, then stops. Jobs that are interrupted are
+        run again once their lease runs out.
+        """
+        if self._task is not None:
+            self._stopping = True
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except TimeoutError:
+                logger.warning("Stopping the verification job drainer with jobs in progress")
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict[str, int]:
+        return {"processed": self.processed, "retried": self.retried, "failed": self.failed}
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.dsn, autocommit=True) as listen_conn:
+                    await listen_conn.execute(f"LISTEN {CHANNEL}")
+                    while True:
+                        self._idle.clear()
+                        while not self._stopping and await self._drain_batch():
+                            pass
+                        self._idle.set()
+                        async for _ in listen_conn.notifies(timeout=self.poll_interval, stop_after=1):
+                            pass
+            except psycopg.Error as e:
+                self._idle.set()
+                logger.warning("Verification job drainer lost its connection, retrying: %s", e)
+                await asyncio.sleep(5)
+
+    async def _drain_batch(self) -> int:
+        async with self.pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute(
+                    """
+                    UPDATE verification_jobs
+                    SET run_after = now() + make_interval(secs => %s),
+                        attempts = attempts + 1
+                    WHERE id IN (
+                        SELECT id
+                        FROM verification_jobs
+                        WHERE NOT failed AND run_after <= now()
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, user_id, lang, attempts
+                    """,
+                    (self.lease, self.concurrency),
+                )
+                jobs = await cur.fetchall()
+        await asyncio.gather(*(self._process(job) for job in jobs))
+        return len(jobs)
+
+    async def _process(self, job: DictRow) -> None:
+        try:
+            await self.handler(job["user_id"], job["lang"])
+        except Exception as e:
+            # Members that left the server won't come back by retrying
+            permanent = isinstance(e, hikari.NotFoundError) or job["attempts"] >= self.max_attempts
+            logger.warning("Verification job %s for user %s failed: %s", job["id"], job["user_id"], e)
+            async with self.pool.connection() as conn:
+                await conn.execute(
+                    """
+                    UPDATE verification_jobs
+                    SET failed = %s,
+                        last_error = %s,
+                        run_after = now() + make_interval(secs => %s)
+                    WHERE id = %s
+                    """,
+                    (permanent, repr(e), 2 ** job["attempts"], job["id"]),
+                )
+            if permanent:
+                self.failed += 1
+            else:
+                self.retried += 1
+            return
+
+        async with self.pool.connection() as conn:
+            await conn.execute("DELETE FROM verification_jobs WHERE id = %s", (job["id"],))
+        self.processed += 1
@@ -0,0 +1,87 @@
+import re
+from typing import Literal
+
+import phonenumbers
+from psycopg.rows import DictRow, dict_row
+from psycopg.sql import SQL, Composable
+from psycopg_pool import AsyncConnectionPool
+
+from bot.utils.metrics import timed
+
+type LookupKey = Literal["id", "zid", "email", "phone", "name"]
+
+PAGE_SIZE = 5
+
+# Each condition matches an index from migrations/0002_lookup_indexes.sql on both tables
+conditions: dict[LookupKey, Composable] = {
+    "id": SQL("id = %(term)s"),
+    "zid": SQL("lower(zid) = %(term)s"),
+    "email": SQL("lower(email) = %(term)s"),
+    "phone": SQL("phone_number = %(term)s"),
+    "name": SQL("(first_name || ' ' || last_name) ILIKE %(pattern)s"),
+}
+
+orderings: dict[LookupKey, Composable] = {
+    "name": SQL("similarity(first_name || ' ' || last_name, %(term)s) DESC, source, id"),
+}
+
+
+def classify_query(query: str) -> tuple[LookupKey, str]:
+    """
+    Works out what a moderator is searching by
+
+    Returns:
+        (key to search by, normalised search term)
+    """
+    query = query.strip()
+    if match := re.fullmatch(r"<@!?(\d{17,20})>|(\d{17,20})", query):
+        return "id", match[1] or match[2]
+    if re.fullmatch(r"[zZ]?\d{7}", query):
+        return "zid", "z" + query[-7:]
+    if "@" in query:
+        return "email", query.lower()
+    if re.fullmatch(r"\+?[\d\s()-]{8,}", query):
+        try:
+            phone_num = phonenumbers.parse(query, "AU")
+            return "phone", phonenumbers.format_number(phone_num, phonenumbers.PhoneNumberFormat.E164)
+        except phonenumbers.NumberParseException:
+            pass
+    return "name", query
+
+
+@timed
+async def search_members(
+    pool: AsyncConnectionPool, key: LookupKey, term: str, page: int = 1
+) -> tuple[list[DictRow], int]:
+    """
+    Searches both the new and old verification tables in one query
+
+    Returns:
+        (rows on the given page, total number of matches)
+    """
+    condition = conditions[key]
+    query = SQL("""
+        SELECT *, count(*) OVER () AS total
+        FROM (
+            SELECT 'new' AS source, id, first_name, last_name, zid, email, phone_number
+            FROM users
+            WHERE {condition}
+            UNION ALL
+            SELECT 'old' AS source, id, first_name, last_name, zid, email, phone_number
+            FROM old_users
+            WHERE {condition}
+        ) matches
+        ORDER BY {ordering}
+        LIMIT %(limit)s OFFSET %(offset)s
+    """).format(condition=condition, ordering=orderings.get(key, SQL("source, id")))
+    params = {
+        "term": int(term) if key == "id" else term,
+        "pattern": "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%",
+        "limit": PAGE_SIZE,
+        "offset": (page - 1) * PAGE_SIZE,
+    }
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+    return rows, rows[0]["total"] if rows else 0
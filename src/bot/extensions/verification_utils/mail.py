@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import smtplib
+import time
+from collections import OrderedDict
+from email.message import EmailMessage
+from typing import Literal, Protocol
+from urllib.request import Request, urlopen
+
+from mailersend import emails
+
+logger = logging.getLogger(__name__)
+
+type EnqueueResult = Literal["queued", "deduplicated", "throttled", "full"]
+
+
+class TransportError(Exception):
+    """Raised by a transport when the provider rejected a send"""
+
+    def __init__(self, message: str, retryable: bool = True) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class MailTransport(Protocol):
+    async def send(self, mail_body: dict) -> None: ...
+
+
+class MailerSendTransport:
+    """Sends through the MailerSend API. The SDK is synchronous so it runs in a worker thread."""
+
+    def __init__(self, api_key: str | None) -> None:
+        self.mailer = emails.NewEmail(api_key)
+
+    async def send(self, mail_body: dict) -> None:
+        response = await asyncio.to_thread(self.mailer.send, mail_body)
+        status, _, text = str(response).partition("\n")
+        if not status.startswith("2"):
+            raise TransportError(
+                f"MailerSend returned {status}: {text}",
+                retryable=status == "429" or status.startswith("5"),
+            )
+
+
+class SMTPTransport:
+    """Sends a plain text rendering of the mail body to an SMTP server, e.g. a local sink for testing"""
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+
+    def _send_sync(self, mail_body: dict) -> None:
+        for recipient in mail_body["to"]:
+            message = EmailMessage()
+            message["From"] = mail_body["from"]["email"]
+            message["To"] = recipient["email"]
+            message["Subject"] = mail_body["subject"]
+            data = next(
+                (p["data"] for p in mail_body.get("personalization", []) if p["email"] == recipient["email"]),
+                {},
+            )
+            message.set_content("\n".join(f"{key}: {value}" for key, value in data.items()))
+            with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+                smtp.send_message(message)
+
+    async def send(self, mail_body: dict) -> None:
+        await asyncio.to_thread(self._send_sync, mail_body)
+
+
+class HTTPSinkTransport:
+    """POSTs the raw mail body as JSON to a URL, e.g. a local request bin for testing"""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+
+    def _send_sync(self, mail_body: dict) -> None:
+        request = Request(
+            self.url,
+            data=json.dumps(mail_body).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urlopen(request, timeout=10) as response:
+            if response.status >= 300:
+                raise TransportError(f"Sink returned {response.status}")
+
+    async def send(self, mail_body: dict) -> None:
+        await asyncio.to_thread(self._send_sync, mail_body)
+
+
+def transport_from_env() -> MailTransport:
+    match os.getenv("MAIL_TRANSPORT", "mailersend"):
+        case "smtp":
+            return SMTPTransport(os.getenv("SMTP_HOST", "localhost"), int(os.getenv("SMTP_PORT", "1025")))
+        case "http":
+            return HTTPSinkTransport(os.getenv("MAIL_SINK_URL", "http://localhost:8025"))
+        case _:
+            return MailerSendTransport(os.getenv("MAILERSEND_API_KEY"))
+
+
+class EmailQueue:
+    """
+    Background dispatch queue for outgoing mail.
+
+    Mail is keyed by recipient: enqueueing for a recipient that is still waiting replaces the pending mail
+    instead of sending twice, and a recipient that was sent to within ``throttle`` seconds is rejected.
+    Failed sends are retried with exponential backoff up to ``max_attempts`` times.
+    """
+
+    def __init__(
+        self,
+        transport: MailTransport,
+        *,
+        workers: int = 4,
+        maxsize: int = 1000,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        throttle: float = 60.0,
+    ) -> None:
+        self.transport = transport
+        self.num_workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.throttle = throttle
+
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize)
+        self._pending: dict[str, dict] = {}
+        # Recipient -> monotonic time of last successful send, oldest first
+        self._last_sent: OrderedDict[str, float] = OrderedDict()
+        self._workers: list[asyncio.Task] = []
+        self.closed = False
+
+        self.sent = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.throttled = 0
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    def close(self) -> None:
+        """Reject mail enqueued from now on as if the queue were full"""
+        self.closed = True
+
+    async def stop(self, timeout: float = 10.0) -> int:
+        """
+        Wait up to ``timeout`` seconds for queued mail to be sent, then stop the workers. Returns how many weren't sent.
+        """
+        unsent = 0
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except TimeoutError:
+                unsent = self._queue.qsize()
+                logger.warning("Stopping email queue with %d unsent emails", unsent)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        return unsent
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "depth": self._queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "deduplicated": self.deduplicated,
+            "throttled": self.throttled,
+        }
+
+    def _recently_sent(self, recipient: str) -> bool:
+        now = time.monotonic()
+        while self._last_sent and next(iter(self._last_sent.values())) < now - self.throttle:
+            self._last_sent.popitem(last=False)
+        return recipient in self._last_sent
+
+    def enqueue(self, recipient: str, mail_body: dict) -> EnqueueResult:
+        if self.closed:
+            return "full"
+        self.start()
+        if recipient in self._pending:
+            self._pending[recipient] = mail_body
+            self.deduplicated += 1
+            return "deduplicated"
+        if self._recently_sent(recipient):
+            self.throttled += 1
+            return "throttled"
+        try:
+            self._queue.put_nowait(recipient)
+        except asyncio.QueueFull:
+            logger.warning("Email queue is full, rejecting mail to %s", recipient)
+            return "full"
+        self._pending[recipient] = mail_body
+        return "queued"
+
+    async def _worker(self) -> None:
+        while True:
+            recipient = await self._queue.get()
+            try:
+                mail_body = self._pending.pop(recipient, None)
+                if mail_body is not None:
+                    await self._send(recipient, mail_body)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, recipient: str, mail_body: dict) -> None:
+        for attempt in range(self.max_attempts):
+            try:
+                await self.transport.send(mail_body)
+            except TransportError as e:
+                if not e.retryable:
+                    logger.error("Email to %s was rejected: %s", recipient, e)
+                    break
+                logger.warning("Email to %s failed (attempt %d): %s", recipient, attempt + 1, e)
+            except Exception as e:
+                logger.warning("Email to %s failed (attempt %d): %s", recipient, attempt + 1, e)
+            else:
+                self._last_sent[recipient] = time.monotonic()
+                self._last_sent.move_to_end(recipient)
+                self.sent += 1
+                return
+            if attempt + 1 < self.max_attempts:
+                await asyncio.sleep(self.base_delay * 2**attempt * random.uniform(0.5, 1.5))
+        self.failed += 1
@@ -0,0 +1,215 @@
+import re
+from dataclasses import dataclass
+from typing import Literal, Self
+
+import email_validator
+import phonenumbers
+from psycopg_pool import AsyncConnectionPool
+
+from bot.utils.metrics import timed
+
+type SupportedLanguage = Literal["en", "cn"]
+
+type D[T] = dict[str, T | D[T]]
+
+
+@dataclass
+class UserInfo:
+    lang: SupportedLanguage
+    first_name: str
+    last_name: str
+    email: str | None = None
+    zid: str | None = None
+    phone: str | None = None
+    id: int = 0
+
+    def __post_init__(self):
+        self.first_name = self.first_name.strip()
+        self.last_name = self.last_name.strip()
+
+        if self.zid is not None:
+            self.zid = self.zid.strip()
+            if not self.zid.lower().startswith("z"):
+                self.zid = f"z{self.zid}"
+
+        if self.email is not None:
+            self.email = self.email.strip()
+
+        if self.phone is not None:
+            self.phone = self.phone.strip()
+
+    def validate(self) -> str | None:
+        """
+        Validates user info
+        :return: None if valid else error message
+        """
+        t = translations[self.lang]
+        if not self.first_name:
+            return t["validation"]["first_name"]
+        if not self.last_name:
+            return t["validation"]["last_name"]
+        if self.zid is not None and not re.match(r"z\d{7}$", self.zid):
+            return t["validation"]["zid"]
+        if self.email is not None:
+            try:
+                email_info = email_validator.validate_email(self.email, check_deliverability=False)
+                self.email = email_info.normalized
+            except email_validator.EmailNotValidError:
+                return t["validation"]["email"]
+        if self.phone is not None:
+            try:
+                phone_num = phonenumbers.parse(self.phone, "AU")
+                self.phone = phonenumbers.format_number(phone_num, phonenumbers.PhoneNumberFormat.E164)
+            except phonenumbers.NumberParseException:
+                return t["validation"]["phone"]
+
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": str(self.id),
+            "lang": self.lang,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "zid": self.zid,
+            "email": self.email,
+            "phone": self.phone,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Self:
+        return cls(
+            lang=data["lang"],
+            first_name=data["first_name"],
+            last_name=data["last_name"],
+            zid=data["zid"],
+            email=data["email"],
+            phone=data["phone"],
+            id=int(data["id"]),
+        )
+
+
+translations: dict[SupportedLanguage, D[str]] = {
+    "en": {
+        "choice": {
+            "unsw": "Verify (UNSW)",
+            "non-unsw": "Verify (Non-UNSW)",
+        },
+        "fields": {
+            "first_name": "First Name",
+            "last_name": "Last Name",
+            "zid": "zID",
+            "email": "Email",
+            "phone": "Phone Number",
+        },
+        "field_hints": {
+            "first_name": "",
+            "last_name": "",
+            "zid": "E.g. z1234567",
+            "email": "E.g. ibi@animeunsw.net",
+            "phone": "E.g. 0412345678 or +61412345678",
+        },
+        "validation": {
+            "first_name": "First name is required.",
+            "last_name": "Last name is required.",
+            "zid": "Please enter a valid zID (e.g. z1234567)",
+            "email": "Please enter a valid email. (e.g. ibi@animeunsw.net)",
+            "phone": "Please enter a valid phone number (e.g. 0412345678 or +61412345678)",
+        },
+        "confirmed": "Thanks for verifying, {user_info.first_name}! "
+        "Please check your email, {user_info.email}, for the next step.",
+        "email_throttled": "We just sent an email to {user_info.email}. Please check your inbox (and spam folder) "
+        "before requesting another one.",
+        "email_busy": "We're handling a lot of verifications right now, please try again in a few minutes.",
+        "welcome_message": "Welcome {user}! Feel free to leave an introduction in {introduction_channel}.",
+        "endpoint": {
+            "success": "Successfully verified!",
+            "fail": "Verification was not successful, please contact {owner} on Discord for support.",
+            "expired": "This verification link has expired, please fill out the verification form again.",
+        },
+        "message": {
+            "initial": "Welcome to AUNSW! If you can see this then you're unverified, but don't worry; it's a simple process to get you verified.",
+            "steps1": '1. Accept the rules by clicking the "Complete" button at the bottom of the screen and following the instructions.\n2. Depending on whether you\'re a UNSW student or not, fill out the corresponding form by pressing on one of buttons below.\n3. If you filling out the UNSW form, you will receive a message in your student email, else if you filled out the Non-UNSW form, it will be sent to the email you provided.\n4. Click on the button in the email labeled "Verify," as shown below.',
+            "steps2": "5. Profit!",
+            "buttons": {
+                "unsw": "Verify (UNSW)",
+                "non-unsw": "Verify (Non-UNSW)",
+            },
+        },
+    },
+    "cn": {
+        "choice": {
+            "unsw": "验证 (UNSW)",
+            "non-unsw": "验证 (非UNSW)",
+        },
+        "fields": {
+            "first_name": "名",
+            "last_name": "姓",
+            "zid": "zID",
+            "email": "电子邮件",
+            "phone": "电话号码",
+        },
+        "field_hints": {
+            "first_name": "",
+            "last_name": "",
+            "zid": "例如 z1234567",
+            "email": "例如 lbi@animeunsw.net",
+            "phone": "例如 0412345678 或 +61412345678",
+        },
+        "validation": {
+            "first_name": "名是必填项。",
+            "last_name": "姓是必填项。",
+            "zid": "请输入有效的zID（例如 z1234567）",
+            "email": "请输入有效的电子邮件（例如 lbi@animeunsw.net）",
+            "phone": "请输入有效的电话号码（例如 0412345678 或 +61412345678）",
+        },
+        "confirmed": "感谢您的验证，{user_info.first_name}！请检查您的电子邮件，{user_info.email}，以获取下一步指示。",
+        "email_throttled": "我们刚刚向{user_info.email}发送了一封电子邮件。"
+        "请先检查您的收件箱（以及垃圾邮件文件夹），再请求新的邮件。",
+        "email_busy": "我们目前正在处理大量验证请求，请几分钟后再试。",
+        "welcome_message": "欢迎 {user}！欢迎在 {introduction_channel} 留下自我介绍。",
+        "endpoint": {
+            "success": "验证成功！",
+            "fail": "验证未成功，请在Discord上联系{owner}寻求帮助。",
+            "expired": "此验证链接已过期，请重新填写验证表格。",
+        },
+        "message": {
+            "initial": "欢迎来到UNSW！如果您看到此消息，则表示您尚未通过验证，但请别担心；验证过程很简单。",
+            "steps1": "1. 点击屏幕下方的 “完成 ”按钮，按照说明接受规则。\n2. 根据您是否是UNSW学生，通过点击以下按钮之一填写相应的表格。\n3. 如果您填写的是UNSW表格，您将在您的学生邮箱中收到一条消息；如果您填写的是非UNSW表格，则会发送到您提供的电子邮件地址。\n4. 点击电子邮件中标有“验证”的按钮，如下图所示。",
+            "steps2": "5. 搞定！",
+            "buttons": {
+                "unsw": "验证 (UNSW)",
+                "non-unsw": "验证 (非UNSW)",
+            },
+        },
+    },
+}
+
+
+@timed
+async def add_user_to_db(db: AsyncConnectionPool, user: UserInfo):
+    if user.zid is not None:
+        user.email = None
+    async with db.connection() as conn:
+        await conn.execute(
+            """
+            INSERT INTO users (id, first_name, last_name, zid, email, phone_number)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (id) DO UPDATE SET
+                first_name = EXCLUDED.first_name,
+                last_name = EXCLUDED.last_name,
+                zid = EXCLUDED.zid,
+                email = EXCLUDED.email,
+                phone_number = EXCLUDED.phone_number,
+                verified_at = now()
+            """,
+            (
+                user.id,
+                user.first_name,
+                user.last_name,
+                user.zid,
+                user.email,
+                user.phone,
+            ),
+        )
+        await conn.commit()
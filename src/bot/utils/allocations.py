@@ -0,0 +1,77 @@
+import time
+import tracemalloc
+
+from bot.utils.caches import current_sizes
+from bot.utils.gateway_cache import format_bytes
+
+# Allocations made by tracemalloc itself and by imports are noise when looking for leaks
+ignored = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class AllocationTracer:
+    """
+    Turns tracemalloc on and off at runtime and reports the largest allocation sites.
+
+    Each report is compared with the previous one, so growth between reports shows up in the diff. Tracing costs
+    memory and CPU for every allocation, so it should be stopped once done.
+    """
+
+    def __init__(self) -> None:
+        self.previous: tracemalloc.Snapshot | None = None
+        self.previous_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> None:
+        """Starts tracing, recording ``frames`` frames of each allocation's stack"""
+        if self.running:
+            tracemalloc.stop()
+        tracemalloc.start(frames)
+        self.previous = None
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.previous = None
+
+    def report(self, top: int = 10, group_by: str = "lineno") -> str:
+        """
+        Sizes of the registered caches and queues, then if tracing, the ``top`` allocation sites and how they changed
+        since the last report. Taking a snapshot blocks, so this should be run in a thread.
+        """
+        lines = ["In-process caches and queues:"]
+        lines.extend(f"  {name:<24} {size:>8}" for name, size in current_sizes().items())
+        if not self.running:
+            lines.append("\ntracemalloc is not running, start it to see allocation sites")
+            return "\n".join(lines)
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignored)
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(
+            f"\nTraced {format_bytes(current)}, peak {format_bytes(peak)},"
+            f" tracemalloc itself {format_bytes(tracemalloc.get_tracemalloc_memory())}"
+        )
+        lines.append(f"\nTop {top} allocation sites:")
+        for stat in snapshot.statistics(group_by)[:top]:
+            lines.append(f"  {format_bytes(stat.size):>10} {stat.count:>8} blocks  {stat.traceback}")
+
+        if self.previous is not None:
+            lines.append(f"\nChange over the last {time.monotonic() - self.previous_at:.0f}s:")
+            for diff in snapshot.compare_to(self.previous, group_by)[:top]:
+                lines.append(
+                    f"  {('+' if diff.size_diff >= 0 else '-') + format_bytes(abs(diff.size_diff)):>10}"
+                    f" {diff.count_diff:>+8} blocks  {diff.traceback}"
+                )
+        self.previous = snapshot
+        self.previous_at = time.monotonic()
+        return "\n".join(lines)
+
+
+# tracemalloc is per process, so there is one tracer
+allocation_tracer = AllocationTracer()
@@ -0,0 +1,125 @@
+import logging
+import time
+import typing
+from importlib import resources
+from urllib.parse import parse_qs, urlsplit
+
+import hikari
+
+logger = logging.getLogger(__name__)
+
+
+class LinkedMediaGalleryItemBuilder(hikari.impl.MediaGalleryItemBuilder):
+    """
+    Media gallery item that links to already uploaded media. The standard builder uploads every resource it is given,
+    downloading URLs first, which is exactly what reusing a CDN URL is meant to avoid.
+    """
+
+    def build(
+        self,
+    ) -> tuple[
+        typing.MutableMapping[str, typing.Any], typing.Sequence[hikari.files.Resource[hikari.files.AsyncReader]]
+    ]:
+        payload, _ = super().build()
+        return payload, ()
+
+
+def url_expiry(url: str) -> float:
+    """Unix time a signed Discord CDN URL expires at, or infinity for URLs that aren't signed"""
+    try:
+        return int(parse_qs(urlsplit(url).query)["ex"][0], 16)
+    except (KeyError, ValueError):
+        return float("inf")
+
+
+class AssetRegistry:
+    """
+    Images kept in memory by file name, along with the CDN URL each was last uploaded to.
+
+    Bundled images are loaded from the package so they don't depend on the working directory, and other features can
+    add images they generate. A remembered URL is reused until ``margin`` seconds before Discord's signature on it
+    expires, after which the image is uploaded again.
+    """
+
+    def __init__(self, *, margin: float = 3600.0) -> None:
+        self.margin = margin
+        self._data: dict[str, bytes] = {}
+        self._urls: dict[str, str] = {}
+
+        self.uploads = 0
+        self.reuses = 0
+
+    def load(self, package: str, directory: str = "") -> None:
+        """Loads every file in a directory of a package"""
+        root = resources.files(package)
+        if directory:
+            root = root.joinpath(directory)
+        for entry in root.iterdir():
+            if entry.is_file():
+                self._data[entry.name] = entry.read_bytes()
+        logger.debug("Loaded assets from %s/%s", package, directory)
+
+    def add(self, name: str, data: bytes) -> None:
+        self._data[name] = data
+        self._urls.pop(name, None)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._data
+
+    def data(self, name: str) -> bytes:
+        return self._data[name]
+
+    def url(self, name: str) -> str | None:
+        """The remembered CDN URL of an image, if it is still valid"""
+        url = self._urls.get(name)
+        if url is not None and url_expiry(url) - self.margin <= time.time():
+            del self._urls[name]
+            return None
+        return url
+
+    def resource(self, name: str) -> hikari.URL | hikari.Bytes:
+        """The image to send, for embeds and attachments. Embeds only upload resources that aren't URLs."""
+        if url := self.url(name):
+            self.reuses += 1
+            return hikari.URL(url)
+        self.uploads += 1
+        return hikari.Bytes(self._data[name], name)
+
+    def media_item(self, name: str, **kwargs: typing.Any) -> hikari.impl.MediaGalleryItemBuilder:
+        """A media gallery item for the image, linking the remembered URL instead of uploading where possible"""
+        if url := self.url(name):
+            self.reuses += 1
+            return LinkedMediaGalleryItemBuilder(media=url, **kwargs)
+        self.uploads += 1
+        return hikari.impl.MediaGalleryItemBuilder(media=hikari.Bytes(self._data[name], name), **kwargs)
+
+    def remember(self, name: str, url: str) -> None:
+        if name in self._data:
+            self._urls[name] = url
+
+    def remember_message(self, message: hikari.Message) -> None:
+        """Remembers the URLs of any of our images that were uploaded with a message"""
+        for attachment in message.attachments:
+            self.remember(attachment.filename, attachment.url)
+        for embed in message.embeds:
+            if embed.image is not None:
+                self.remember(embed.image.filename, embed.image.url)
+
+        components: list[typing.Any] = list(message.components)
+        while components:
+            component = components.pop()
+            if isinstance(component, hikari.MediaGalleryComponent):
+                for item in component.items:
+                    self.remember(item.media.filename, item.media.url)
+            elif isinstance(component, hikari.ThumbnailComponent):
+                self.remember(component.media.filename, component.media.url)
+            components.extend(getattr(component, "components", ()))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "assets": len(self._data),
+            "bytes": sum(len(data) for data in self._data.values()),
+            "urls": len(self._urls),
+            "uploads": self.uploads,
+            "reuses": self.reuses,
+        }
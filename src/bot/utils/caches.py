@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from collections.abc import Callable, Sized
+
+
+class LRUCache[K, V]:
+    """Dict-like cache holding at most ``maxsize`` entries, evicting the least recently used"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def items(self) -> list[tuple[K, V]]:
+        """Entries from least to most recently used, without changing their order"""
+        return list(self._data.items())
+
+
+# Long lived in-process caches and queues by name, so their sizes can be reported
+sizes: dict[str, Callable[[], int]] = {}
+
+
+def register_size(name: str, size: Callable[[], int]) -> None:
+    sizes[name] = size
+
+
+def register_cache[C: Sized](name: str, cache: C) -> C:
+    """Registers a cache to be reported by its length, returning it so it can be registered where it's created"""
+    register_size(name, cache.__len__)
+    return cache
+
+
+def current_sizes() -> dict[str, int]:
+    return {name: size() for name, size in sorted(sizes.items())}
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import logging
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+# Sent by the triggers in migrations/0004_change_feed.sql
+CHANNEL = "table_changes"
+
+
+@dataclass(frozen=True)
+class Change:
+    table: str
+    # INSERT, UPDATE, DELETE or TRUNCATE, or RESET when notifications may have been missed
+    op: str
+    # Key of the changed row as text, None when anything in the table may have changed
+    key: str | None
+
+
+type Subscriber = Callable[[Change], object]
+
+
+class ChangeFeed:
+    """
+    Passes notifications of changed rows to the subscribers of their table, so cached copies can be dropped no matter
+    which process or person made the change.
+
+    Notifications sent while the connection is down are lost, so whenever it connects every subscriber gets a change
+    with no key and has to assume everything changed. Subscribers are called on the event loop and must not block.
+
+    A row read from the database should only be cached if the feed is ``connected`` and the table's ``version`` is
+    the same as before the read, otherwise a change made during the read could have been missed.
+    """
+
+    def __init__(self) -> None:
+        self.subscribers: defaultdict[str, list[Subscriber]] = defaultdict(list)
+        self._task: asyncio.Task | None = None
+        self.connected = False
+        # Changes seen per table
+        self.versions: Counter[str] = Counter()
+
+        self.received = 0
+        self.resets = 0
+
+    def subscribe(self, table: str, subscriber: Subscriber) -> None:
+        self.subscribers[table].append(subscriber)
+
+    def start(self, dsn: str) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(dsn))
+
+    async def stop(self) -> None:
+        self.connected = False
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict[str, int]:
+        return {"received": self.received, "resets": self.resets}
+
+    def version(self, table: str) -> int:
+        return self.versions[table]
+
+    def publish(self, change: Change) -> None:
+        self.versions[change.table] += 1
+        for subscriber in self.subscribers.get(change.table, ()):
+            try:
+                subscriber(change)
+            except Exception:
+                logger.exception("Change feed subscriber failed on %s", change)
+
+    def _reset(self) -> None:
+        self.resets += 1
+        for table in self.subscribers:
+            self.publish(Change(table, "RESET", None))
+
+    async def _run(self, dsn: str) -> None:
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as listen_conn:
+                    await listen_conn.execute(f"LISTEN {CHANNEL}")
+                    # Anything could have changed while there was no connection
+                    self._reset()
+                    self.connected = True
+                    async for notify in listen_conn.notifies():
+                        self.received += 1
+                        try:
+                            payload = json.loads(notify.payload)
+                            change = Change(payload["table"], payload["op"], payload["key"])
+                        except (ValueError, KeyError) as e:
+                            logger.warning("Ignoring malformed change notification %r: %s", notify.payload, e)
+                            continue
+                        self.publish(change)
+            except psycopg.Error as e:
+                self.connected = False
+                logger.warning("Change feed lost its connection, retrying: %s", e)
+                await asyncio.sleep(5)
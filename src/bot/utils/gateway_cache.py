@@ -0,0 +1,109 @@
+import itertools
+import os
+import sys
+from collections.abc import Iterable, Mapping
+from types import ModuleType
+
+import hikari
+from hikari.impl import CacheSettings
+
+Components = hikari.api.CacheComponents
+
+# Intents and cache components for each CACHE_PROFILE. The extensions only read members, and users through them, to
+# resolve names and check roles, so only those are cached and only the events keeping them current are received.
+cache_profiles: dict[str, tuple[hikari.Intents, hikari.api.CacheComponents]] = {
+    # GUILD_MEMBERS is privileged, so the Server Members intent must be enabled for the application
+    "minimal": (
+        hikari.Intents.GUILDS | hikari.Intents.GUILD_MESSAGES | hikari.Intents.GUILD_MEMBERS,
+        Components.GUILDS | Components.MEMBERS | Components.ME,
+    ),
+    # Without the members intent, names and roles are fetched when needed
+    "none": (hikari.Intents.GUILDS | hikari.Intents.GUILD_MESSAGES, Components.NONE),
+    # hikari's defaults
+    "full": (hikari.Intents.ALL_UNPRIVILEGED, Components.ALL),
+}
+
+
+def gateway_config_from_env() -> tuple[hikari.Intents, CacheSettings]:
+    """Intents and cache settings for the CACHE_PROFILE environment variable, minimal by default"""
+    profile = os.getenv("CACHE_PROFILE", "minimal")
+    if profile not in cache_profiles:
+        raise ValueError(f"CACHE_PROFILE must be one of {', '.join(cache_profiles)}, got {profile!r}")
+    intents, components = cache_profiles[profile]
+    return intents, CacheSettings(components=components)
+
+
+def deep_size(obj: object, seen: set[int] | None = None) -> int:
+    """Bytes used by an object and everything it references, except the app that entities all reference"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, (type, ModuleType, hikari.RESTAware)):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float)):
+        return size
+    if isinstance(obj, Mapping):
+        return size + sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(deep_size(item, seen) for item in obj)
+    # hikari's entities are attrs classes with slots
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            size += deep_size(getattr(obj, name, None), seen)
+    if hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def estimate(entries: Iterable[object], count: int, sample: int) -> int:
+    """Estimates the size of ``count`` entries from the first ``sample`` of them"""
+    sizes = [deep_size(entry) for entry in itertools.islice(entries, sample)]
+    return sum(sizes) * count // len(sizes) if sizes else 0
+
+
+def cache_report(cache: hikari.api.Cache, sample: int = 100) -> list[tuple[str, int, int]]:
+    """(component, entries, estimated bytes) for each part of the gateway cache, largest first"""
+    flat = {
+        "guilds": cache.get_guilds_view(),
+        "channels": cache.get_guild_channels_view(),
+        "threads": cache.get_threads_view(),
+        "roles": cache.get_roles_view(),
+        "users": cache.get_users_view(),
+        "messages": cache.get_messages_view(),
+        "emojis": cache.get_emojis_view(),
+        "stickers": cache.get_stickers_view(),
+        "invites": cache.get_invites_view(),
+        "dm_channel_ids": cache.get_dm_channel_ids_view(),
+    }
+    # Views of views, by guild
+    nested = {
+        "members": cache.get_members_view(),
+        "presences": cache.get_presences_view(),
+        "voice_states": cache.get_voice_states_view(),
+    }
+
+    report = []
+    for name, view in flat.items():
+        report.append((name, len(view), estimate(view.values(), len(view), sample)))
+    for name, view in nested.items():
+        count = sum(len(guild_view) for guild_view in view.values())
+        entries = itertools.chain.from_iterable(guild_view.values() for guild_view in view.values())
+        report.append((name, count, estimate(entries, count, sample)))
+    return sorted(report, key=lambda row: row[2], reverse=True)
+
+
+def resident_memory() -> int | None:
+    """Resident set size of the process in bytes, on Linux"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} GiB"
@@ -0,0 +1,39 @@
+from collections.abc import Awaitable, Callable
+
+import hikari
+
+type ComponentHandler = Callable[[hikari.ComponentInteractionCreateEvent, list[str]], Awaitable[None]]
+
+
+class InteractionRouter:
+    """
+    Routes component interactions to the extension that owns them.
+
+    Custom ids are written as ``"<extension>:<action>:<arg>:<arg>..."`` and handlers are registered for
+    ``"<extension>:<action>"``, so dispatching is a single dict lookup however many handlers there are.
+    Handlers are called with the event and the remaining args. Registering a prefix again from the module that
+    registered it replaces the handler, so extensions can be reloaded.
+    """
+
+    def __init__(self) -> None:
+        self.handlers: dict[str, ComponentHandler] = {}
+
+    def register(self, prefix: str) -> Callable[[ComponentHandler], ComponentHandler]:
+        if prefix.count(":") != 1:
+            raise ValueError(f"Expected a prefix of the form 'extension:action', got {prefix!r}")
+
+        def decorator(handler: ComponentHandler) -> ComponentHandler:
+            existing = self.handlers.get(prefix)
+            if existing is not None and existing.__module__ != handler.__module__:
+                raise ValueError(f"A handler is already registered for {prefix!r}")
+            self.handlers[prefix] = handler
+            return handler
+
+        return decorator
+
+    async def dispatch(self, event: hikari.ComponentInteractionCreateEvent) -> None:
+        extension, _, rest = event.interaction.custom_id.partition(":")
+        action, _, args = rest.partition(":")
+        handler = self.handlers.get(f"{extension}:{action}")
+        if handler is not None:
+            await handler(event, args.split(":") if args else [])
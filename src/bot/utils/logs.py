@@ -0,0 +1,104 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has, anything else was passed with extra= and is included in JSON output
+standard_attributes = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in standard_attributes:
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of debug records from the given loggers and their children"""
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        name = record.name
+        while True:
+            if name in self.rates:
+                return random.random() < self.rates[name]
+            if "." not in name:
+                return True
+            name = name.rpartition(".")[0]
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records as they are, so formatting happens on the listener's thread too. The standard QueueHandler
+    formats in the caller so records can be pickled, which only matters for queues between processes.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_pairs(value: str) -> dict[str, str]:
+    """Parses "a=1,b=2" into {"a": "1", "b": "2"}"""
+    pairs = (pair.partition("=") for pair in value.split(",") if pair.strip())
+    return {key.strip(): setting.strip() for key, _, setting in pairs}
+
+
+listener: QueueListener | None = None
+
+
+def configure_logging() -> None:
+    """
+    Sets up logging from the environment. Records are put on a queue and formatted and written to stderr by a
+    background thread, so logging never blocks the event loop on I/O.
+
+    - LOG_LEVEL: level of the root logger, defaults to INFO
+    - LOG_LEVELS: per logger levels, e.g. hikari.gateway=WARNING,bot.utils=DEBUG
+    - LOG_FORMAT: text (default) or json
+    - LOG_SAMPLE: fraction of debug records to keep per logger, e.g. hikari.gateway=0.01
+    """
+    global listener
+    if listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stderr)
+    if os.getenv("LOG_FORMAT", "text") == "json":
+        stream.setFormatter(JSONFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(levelname)-1.1s %(asctime)s %(name)s: %(message)s"))
+
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(
+        SamplingFilter({name: float(rate) for name, rate in parse_pairs(os.getenv("LOG_SAMPLE", "")).items()})
+    )
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in parse_pairs(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    listener = QueueListener(records, stream, respect_handler_level=True)
+    listener.start()
+    # Flushes what is still queued on exit
+    atexit.register(listener.stop)
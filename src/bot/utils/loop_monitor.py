@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from bot.utils.metrics import Counter as MetricCounter
+from bot.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+loop_lag_seconds = Histogram(
+    "bot_loop_lag_seconds",
+    "How late the event loop ran a callback scheduled to run immediately after a sleep",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+loop_stalls = MetricCounter("bot_loop_stalls_total", "Times the event loop was blocked for longer than the threshold")
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs a ticker that sleeps for ``interval`` seconds.
+
+    A watchdog thread checks that the ticker keeps running. Once it has been stuck for ``threshold`` seconds the loop
+    is blocked, so the watchdog captures the stack of the loop's thread, which is the code doing the blocking.
+    Stacks are counted by their innermost ``depth`` frames so repeat offenders add up.
+    """
+
+    def __init__(self, *, interval: float = 0.1, threshold: float = 0.25, depth: int = 8) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.depth = depth
+
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.worst: dict[tuple[str, ...], float] = {}
+        self.max_lag = 0.0
+        self.stalls = 0
+
+        self._beat = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._stopped.clear()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(
+            target=self._watch, args=(threading.get_ident(),), name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _tick(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._beat = time.monotonic()
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - before - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, lag)
+            loop_lag_seconds.observe(lag)
+
+    def _watch(self, loop_thread_id: int) -> None:
+        captured_beat = None
+        stack: tuple[str, ...] = ()
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            blocked_for = time.monotonic() - beat - self.interval
+            if blocked_for < self.threshold:
+                continue
+            if beat == captured_beat:
+                # Still the same stall, only keep track of how long it is
+                self.worst[stack] = max(self.worst[stack], blocked_for)
+                continue
+
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                return
+            stack = tuple(
+                f"{entry.filename}:{entry.lineno} in {entry.name}"
+                for entry in traceback.extract_stack(frame)[-self.depth :]
+            )
+            captured_beat = beat
+            # worst first, report only looks up stacks it has seen counted
+            self.worst[stack] = max(self.worst.get(stack, 0.0), blocked_for)
+            self.stacks[stack] += 1
+            self.stalls += 1
+            loop_stalls.inc()
+            logger.warning("Event loop blocked for over %.2fs in %s", self.threshold, stack[-1])
+
+    def report(self, top: int = 5) -> str:
+        """The most common blocking stacks, innermost frame last"""
+        lines = [f"{self.stalls} stalls over {self.threshold}s, worst lag between ticks {self.max_lag:.3f}s"]
+        # Copied first as the watchdog thread may be adding to it
+        stacks = sorted(dict(self.stacks).items(), key=lambda item: item[1], reverse=True)
+        for stack, count in stacks[:top]:
+            lines.append(f"\n{count}x, up to {self.worst.get(stack, 0.0):.2f}s:")
+            lines.extend(f"  {frame}" for frame in stack)
+        return "\n".join(lines)
+
+    def stats(self) -> dict[str, int]:
+        return {"stalls": self.stalls, "stacks": len(self.stacks), "max_lag_ms": int(self.max_lag * 1000)}
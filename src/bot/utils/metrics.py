@@ -0,0 +1,220 @@
+import functools
+import inspect
+import logging
+import math
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+import hikari
+import lightbulb
+from psycopg_pool import AsyncConnectionPool
+
+from bot.utils.work_queue import queues
+
+logger = logging.getLogger(__name__)
+
+type Labels = tuple[tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels: Labels, **extra: str) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        metrics.append(self)
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        super().__init__(name, description)
+        self._values: defaultdict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        self._values[tuple(labels.items())] += amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{format_labels(labels)} {format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, description)
+        self.buckets = (*buckets, math.inf)
+        # Labels -> (non-cumulative bucket counts, sum)
+        self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels.items())
+        if key not in self._values:
+            self._values[key] = ([0] * len(self.buckets), [0.0])
+        counts, total = self._values[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        total[0] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(labels, le=format_value(bound))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(labels)} {format_value(total[0])}"
+            yield f"{self.name}_count{format_labels(labels)} {cumulative}"
+
+
+class CallbackGauge(Metric):
+    """Gauge whose samples are read when rendering, for state that is already tracked elsewhere"""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, description: str, callback: Callable[[], Iterable[tuple[dict[str, str], float]]]
+    ) -> None:
+        super().__init__(name, description)
+        self.callback = callback
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.callback():
+            yield f"{self.name}{format_labels(tuple(labels.items()))} {format_value(value)}"
+
+
+# Every metric in the process, in the order they are rendered in
+metrics: list[Metric] = []
+
+
+def render() -> str:
+    """All metrics in the Prometheus text format"""
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+command_seconds = Histogram("bot_command_seconds", "Time from a command being received to it finishing")
+db_query_seconds = Histogram("bot_db_query_seconds", "Time spent in each DB helper, including waiting for a connection")
+rest_requests = Counter("bot_rest_requests_total", "Requests made to the Discord REST API")
+gateway_events = Counter("bot_gateway_events_total", "Events received from the Discord gateway")
+
+pools: dict[str, AsyncConnectionPool] = {}
+
+
+def pool_stats() -> Iterable[tuple[dict[str, str], float]]:
+    for name, pool in pools.items():
+        for stat, value in pool.get_stats().items():
+            yield {"pool": name, "stat": stat}, value
+
+
+CallbackGauge("bot_db_pool", "psycopg pool stats, see psycopg_pool's get_stats for what each is", pool_stats)
+
+
+def queue_stats() -> Iterable[tuple[dict[str, str], float]]:
+    for name, queue in queues.items():
+        for stat, value in queue.stats().items():
+            yield {"queue": name, "stat": stat}, value
+
+
+CallbackGauge("bot_work_queue", "Work queue depth and counts, see WorkQueue.stats", queue_stats)
+
+
+def track_pool(name: str, pool: AsyncConnectionPool) -> None:
+    pools[name] = pool
+
+
+def timed[**P, R](func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    """Records how long calls to a DB helper take in bot_db_query_seconds"""
+
+    @functools.wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            db_query_seconds.observe(time.perf_counter() - start, helper=func.__qualname__)
+
+    return wrapper
+
+
+def command_hooks() -> list[lightbulb.ExecutionHook]:
+    """Client hooks recording every command's latency. Both run even if the command or another hook fails."""
+    started: dict[int, float] = {}
+
+    @lightbulb.hook(lightbulb.ExecutionSteps.MAX_CONCURRENCY, skip_when_failed=False)
+    def start_timer(_: lightbulb.ExecutionPipeline, ctx: lightbulb.Context) -> None:
+        started[id(ctx)] = time.perf_counter()
+
+    @lightbulb.hook(lightbulb.ExecutionSteps.POST_INVOKE, skip_when_failed=False)
+    def stop_timer(pipeline: lightbulb.ExecutionPipeline, ctx: lightbulb.Context) -> None:
+        start = started.pop(id(ctx), None)
+        if start is not None:
+            command_seconds.observe(
+                time.perf_counter() - start,
+                command=ctx.command_data.qualified_name,
+                outcome="failed" if pipeline.failed else "ok",
+            )
+
+    return [start_timer, stop_timer]
+
+
+def instrument_bot(bot: hikari.GatewayBot) -> None:
+    """Counts REST requests by route and gateway events by type"""
+
+    async def count_event(event: hikari.ShardPayloadEvent) -> None:
+        gateway_events.inc(event=event.name)
+
+    bot.subscribe(hikari.ShardPayloadEvent, count_event)
+
+    # The REST client has slots, so the method is wrapped on the class. Every REST client in the process is counted.
+    rest_class: Any = type(bot.rest)
+    request = getattr(rest_class, "_request", None)
+    if getattr(request, "counted", False):
+        request = request.__wrapped__
+    # _request is private to hikari, so REST requests go uncounted rather than broken if it changes
+    if not callable(request) or list(inspect.signature(request).parameters)[:2] != ["self", "compiled_route"]:
+        logger.warning("%s._request isn't the method this was written for, REST requests won't be counted", rest_class)
+        return
+
+    @functools.wraps(request)
+    async def counted_request(self: Any, compiled_route: Any, **kwargs: Any) -> Any:
+        route = compiled_route.route
+        try:
+            response = await request(self, compiled_route, **kwargs)
+        except hikari.HTTPResponseError as e:
+            rest_requests.inc(method=route.method, route=route.path_template, status=str(int(e.status)))
+            raise
+        except Exception:
+            rest_requests.inc(method=route.method, route=route.path_template, status="error")
+            raise
+        rest_requests.inc(method=route.method, route=route.path_template, status="ok")
+        return response
+
+    counted_request.counted = True  # type: ignore[attr-defined]
+    rest_class._request = counted_request
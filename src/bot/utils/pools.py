@@ -0,0 +1,48 @@
+import os
+from typing import Any
+
+from psycopg.conninfo import conninfo_to_dict
+from psycopg_pool import AsyncConnectionPool
+
+
+def pool_from_env(
+    conninfo: str,
+    prefix: str,
+    *,
+    min_size: int = 4,
+    max_size: int | None = None,
+    read_only: bool = False,
+    **kwargs: Any,
+) -> AsyncConnectionPool:
+    """
+    Unopened pool configured from environment variables starting with ``prefix``, falling back to the given defaults:
+
+    - ``{prefix}_MIN_SIZE``, ``{prefix}_MAX_SIZE``: connections kept open, and the most that can be open
+    - ``{prefix}_TIMEOUT``: seconds to wait for a free connection before failing
+    - ``{prefix}_MAX_IDLE``: seconds an unused connection above the minimum is kept
+
+    Sessions of a ``read_only`` pool can't write, so a read pool pointed at the primary can't be misused.
+    """
+    min_size = int(os.getenv(f"{prefix}_MIN_SIZE", min_size))
+    max_size = int(os.getenv(f"{prefix}_MAX_SIZE", max_size or min_size))
+    if read_only:
+        connect_kwargs = dict(kwargs.get("kwargs") or {})
+        # An options parameter replaces the ones in the conninfo or PGOPTIONS, so it is added to rather than set
+        options = connect_kwargs.get("options") or conninfo_to_dict(conninfo).get("options") or os.getenv("PGOPTIONS")
+        connect_kwargs["options"] = f"{options or ''} -c default_transaction_read_only=on".lstrip()
+        kwargs["kwargs"] = connect_kwargs
+    return AsyncConnectionPool(
+        conninfo,
+        min_size=min(min_size, max_size),
+        max_size=max_size,
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT", "30")),
+        max_idle=float(os.getenv(f"{prefix}_MAX_IDLE", "600")),
+        open=False,
+        **kwargs,
+    )
+
+
+async def open_pool(pool: AsyncConnectionPool) -> None:
+    """Opens a pool, waiting for its minimum connections to be ready if DB_POOL_WARM_UP is set"""
+    warm_up = os.getenv("DB_POOL_WARM_UP", "1") not in ("0", "false", "")
+    await pool.open(wait=warm_up, timeout=pool.timeout)
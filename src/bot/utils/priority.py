@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator
+
+import lightbulb
+
+
+class InteractionTracker:
+    """
+    Counts interactions that are being handled so background work can stay out of their way.
+
+    Background work waits until no interaction is in flight before running. Once interactions have been in flight for
+    ``max_delay`` seconds without a break it stops waiting until they all finish, so steady command traffic can't
+    hold it back for more than ``max_delay`` in total. Low priority work that can be skipped entirely, like
+    announcements, should check ``overloaded``, which is set once ``shed_threshold`` interactions are in flight at the
+    same time.
+    """
+
+    def __init__(self, *, max_delay: float = 5.0, shed_threshold: int = 10) -> None:
+        self.max_delay = max_delay
+        self.shed_threshold = shed_threshold
+        self.active = 0
+        # When interactions were last all finished, as loop time
+        self._busy_since = 0.0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self.handled = 0
+        self.delayed = 0
+        self.shed = 0
+
+    @property
+    def overloaded(self) -> bool:
+        return self.active >= self.shed_threshold
+
+    def begin(self) -> None:
+        if self.active == 0:
+            self._busy_since = asyncio.get_running_loop().time()
+        self.active += 1
+        self._idle.clear()
+
+    def end(self) -> None:
+        self.active -= 1
+        self.handled += 1
+        if self.active == 0:
+            self._idle.set()
+
+    @contextlib.asynccontextmanager
+    async def track(self) -> AsyncIterator[None]:
+        self.begin()
+        try:
+            yield
+        finally:
+            self.end()
+
+    async def wait_idle(self) -> None:
+        """Wait for interactions in flight to finish, until they have been in flight for ``max_delay`` seconds"""
+        if self._idle.is_set():
+            return
+        remaining = self._busy_since + self.max_delay - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return
+        self.delayed += 1
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._idle.wait(), remaining)
+
+    def should_shed(self) -> bool:
+        """Whether low priority work should be skipped right now, counting it if so"""
+        if self.overloaded:
+            self.shed += 1
+            return True
+        return False
+
+    def hooks(self) -> list[lightbulb.ExecutionHook]:
+        """Client hooks tracking every command. Both run even if the command or another hook fails."""
+        started: set[int] = set()
+
+        @lightbulb.hook(lightbulb.ExecutionSteps.MAX_CONCURRENCY, skip_when_failed=False)
+        def begin_interaction(_: lightbulb.ExecutionPipeline, ctx: lightbulb.Context) -> None:
+            started.add(id(ctx))
+            self.begin()
+
+        @lightbulb.hook(lightbulb.ExecutionSteps.POST_INVOKE, skip_when_failed=False)
+        def end_interaction(_: lightbulb.ExecutionPipeline, ctx: lightbulb.Context) -> None:
+            if id(ctx) in started:
+                started.remove(id(ctx))
+                self.end()
+
+        return [begin_interaction, end_interaction]
+
+    def stats(self) -> dict[str, int]:
+        return {"active": self.active, "handled": self.handled, "delayed": self.delayed, "shed": self.shed}
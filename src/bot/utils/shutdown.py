@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Literal
+
+from bot.utils.work_queue import WorkQueue
+
+logger = logging.getLogger(__name__)
+
+type Phase = Literal["intake", "drain", "flush", "close"]
+phases: tuple[Phase, ...] = ("intake", "drain", "flush", "close")
+
+
+@dataclass
+class Outcome:
+    # Work that was finished or saved while stopping, and work that was lost
+    flushed: int = 0
+    dropped: int = 0
+
+
+@dataclass
+class StepReport:
+    phase: Phase
+    name: str
+    seconds: float
+    outcome: Outcome
+    error: str | None = None
+
+
+# Steps are given the seconds left before the deadline
+type Step = Callable[[float], Awaitable[Outcome | None]]
+
+
+class ShutdownCoordinator:
+    """
+    Stops the bot's background work in order, so a restart loses as little as possible.
+
+    Steps are registered under a phase and the phases run one after another, the steps of each concurrently:
+
+    - intake: stop taking new work, which queues then drop
+    - drain: finish the work already waiting, until the deadline
+    - flush: save whatever the drain left behind in a cheaper way
+    - close: close servers and pools, once nothing needs them
+
+    Flush and close steps run even if the deadline has passed, with at least ``grace`` seconds.
+    """
+
+    def __init__(self, deadline: float = 20.0, grace: float = 5.0) -> None:
+        self.deadline = deadline
+        self.grace = grace
+        self.stopping = False
+        self.reports: list[StepReport] = []
+        self._steps: dict[Phase, list[tuple[str, Step]]] = {phase: [] for phase in phases}
+
+    def on(self, phase: Phase, name: str, step: Step) -> None:
+        self._steps[phase].append((name, step))
+
+    def add_queue[K, T](
+        self, queue: WorkQueue[K, T], flush: Callable[[dict[K, T]], Awaitable[int]] | None = None
+    ) -> None:
+        """
+        Closes the queue, drains it and passes the work it didn't get to to ``flush``, which returns how much of it
+        was saved. Without ``flush`` that work is dropped.
+        """
+        left: dict[K, T] = {}
+
+        async def close(_: float) -> None:
+            queue.close()
+
+        async def drain(timeout: float) -> Outcome:
+            processed = queue.processed
+            left.update(await queue.stop(timeout))
+            return Outcome(flushed=queue.processed - processed, dropped=0 if flush else len(left))
+
+        async def save(_: float) -> Outcome:
+            saved = await flush(left) if flush and left else 0
+            return Outcome(flushed=saved, dropped=len(left) - saved)
+
+        self.on("intake", f"{queue.name} queue", close)
+        self.on("drain", f"{queue.name} queue", drain)
+        if flush is not None:
+            self.on("flush", f"{queue.name} queue", save)
+
+    async def run(self) -> list[StepReport]:
+        """Runs every step once, later calls return the first run's report"""
+        if self.stopping:
+            return self.reports
+        self.stopping = True
+        end = time.monotonic() + self.deadline
+        for phase in phases:
+            timeout = end - time.monotonic()
+            if phase in ("flush", "close"):
+                timeout = max(timeout, self.grace)
+            reports = await asyncio.gather(
+                *(self._run_step(phase, name, step, max(timeout, 0)) for name, step in self._steps[phase])
+            )
+            self.reports.extend(reports)
+        self._log()
+        return self.reports
+
+    async def _run_step(self, phase: Phase, name: str, step: Step, timeout: float) -> StepReport:
+        start = time.monotonic()
+        try:
+            # Steps should keep to their timeout, this is for the ones that hang anyway
+            outcome = await asyncio.wait_for(step(timeout), timeout + self.grace) or Outcome()
+            error = None
+        except Exception as e:
+            logger.exception("Shutdown step %s %s failed", phase, name)
+            outcome, error = Outcome(), repr(e)
+        return StepReport(phase, name, time.monotonic() - start, outcome, error)
+
+    def _log(self) -> None:
+        for report in self.reports:
+            if report.outcome.flushed or report.outcome.dropped or report.error:
+                logger.info(
+                    "Shutdown %s %s: %d flushed, %d dropped in %.2fs%s",
+                    report.phase,
+                    report.name,
+                    report.outcome.flushed,
+                    report.outcome.dropped,
+                    report.seconds,
+                    f", failed with {report.error}" if report.error else "",
+                )
+        dropped = sum(report.outcome.dropped for report in self.reports)
+        failed = [f"{report.phase} {report.name}" for report in self.reports if report.error]
+        if dropped or failed:
+            logger.warning("Shutdown dropped %d items, failed steps: %s", dropped, ", ".join(failed) or "none")
+        else:
+            logger.info("Shutdown finished in %.2fs without dropping anything", sum(r.seconds for r in self.reports))
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"IBIS"
+# Bumped when the layout of the file changes, each cache versions its own entries
+FORMAT_VERSION = 1
+# Magic, format version, unix time written, CRC32 of the payload, payload length
+header = struct.Struct("<4sHdII")
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file can't be used"""
+
+
+@dataclass
+class Entry:
+    version: int
+    dump: Callable[[], list[Any]]
+    load: Callable[[list[Any]], int]
+
+
+def pack(caches: dict[str, tuple[int, list[Any]]], written_at: float) -> bytes:
+    """Header followed by the zlib compressed JSON of each cache's version and entries"""
+    payload = zlib.compress(json.dumps(caches, separators=(",", ":")).encode(), 6)
+    return header.pack(MAGIC, FORMAT_VERSION, written_at, zlib.crc32(payload), len(payload)) + payload
+
+
+def unpack(data: bytes) -> tuple[float, dict[str, tuple[int, list[Any]]]]:
+    """
+    Returns:
+        (unix time written, version and entries by cache name)
+    """
+    if len(data) < header.size:
+        raise SnapshotError("file is shorter than its header")
+    magic, version, written_at, crc, length = header.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("not a snapshot file")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"format version {version}, expected {FORMAT_VERSION}")
+    payload = data[header.size :]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise SnapshotError("payload is truncated or corrupt")
+    return written_at, json.loads(zlib.decompress(payload))
+
+
+class Snapshots:
+    """
+    Saves registered in-process caches to ``path`` every ``interval`` seconds and when stopping, and loads them back
+    on start, so a restart doesn't refetch everything from Postgres and Discord at once.
+
+    Each cache gives a version, a function returning its entries as JSON-compatible lists and one loading them back.
+    A cache whose version changed since the snapshot was written starts empty, as does everything if the snapshot is
+    older than ``max_age`` seconds. Entries that expire on their own should be left out of ``dump`` once stale.
+    Without a ``path`` nothing is saved or loaded.
+    """
+
+    def __init__(self, path: Path | None, *, interval: float = 300.0, max_age: float = 3600.0) -> None:
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.entries: dict[str, Entry] = {}
+        self._task: asyncio.Task | None = None
+
+        self.saved = 0
+        self.loaded: dict[str, int] = {}
+
+    def register(
+        self, name: str, version: int, dump: Callable[[], list[Any]], load: Callable[[list[Any]], int]
+    ) -> None:
+        self.entries[name] = Entry(version, dump, load)
+
+    def restore(self) -> dict[str, int]:
+        """
+        Loads each registered cache from the snapshot, returning how many entries each got. Run it before the bot
+        takes traffic, so the first requests find the caches warm.
+        """
+        if self.path is None or not self.path.exists():
+            return {}
+        try:
+            written_at, caches = unpack(self.path.read_bytes())
+        except (OSError, ValueError, zlib.error, SnapshotError) as e:
+            logger.warning("Ignoring snapshot %s: %s", self.path, e)
+            return {}
+        age = time.time() - written_at
+        if age > self.max_age:
+            logger.info("Ignoring snapshot %s, it is %.0fs old", self.path, age)
+            return {}
+
+        self.loaded = {}
+        for name, entry in self.entries.items():
+            if name not in caches:
+                continue
+            version, items = caches[name]
+            if version != entry.version:
+                logger.info("Not loading %s from the snapshot, it has version %d not %d", name, version, entry.version)
+                continue
+            try:
+                self.loaded[name] = entry.load(items)
+            except Exception:
+                logger.exception("Failed to load %s from the snapshot", name)
+        logger.info("Loaded snapshot from %.0fs ago: %s", age, self.loaded)
+        return self.loaded
+
+    async def save(self) -> int:
+        """Writes every registered cache, replacing the previous snapshot. Returns how many entries were written."""
+        if self.path is None:
+            return 0
+        # Dumped on the loop so nothing changes underneath, compressed and written in a thread
+        caches = {name: (entry.version, entry.dump()) for name, entry in self.entries.items()}
+        await asyncio.to_thread(self._write, caches)
+        self.saved += 1
+        return sum(len(items) for _, items in caches.values())
+
+    def _write(self, caches: dict[str, tuple[int, list[Any]]]) -> None:
+        assert self.path is not None
+        data = pack(caches, time.time())
+        temporary = self.path.with_suffix(self.path.suffix + ".tmp")
+        temporary.write_bytes(data)
+        # Readers see the old snapshot or the new one, never half of one
+        os.replace(temporary, self.path)
+
+    def start(self) -> None:
+        if self._task is None and self.path is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict[str, int]:
+        return {"saved": self.saved, **{f"loaded_{name}": count for name, count in self.loaded.items()}}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception:
+                logger.exception("Failed to save snapshot to %s", self.path)
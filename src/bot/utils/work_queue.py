@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Literal
+
+from bot.utils.caches import register_size
+from bot.utils.priority import InteractionTracker
+
+logger = logging.getLogger(__name__)
+
+type OverflowPolicy = Literal["drop_new", "drop_oldest", "block"]
+type PutResult = Literal["queued", "coalesced", "dropped"]
+
+# Every WorkQueue by name, for reporting
+queues: dict[str, "WorkQueue"] = {}
+
+
+class WorkQueue[K, T]:
+    """
+    Bounded queue between gateway listeners and their side effects, processed by a fixed number of workers.
+
+    Work is keyed: putting work for a key that is still waiting merges the two with ``merge`` instead of taking another
+    slot, or replaces the waiting work if there is no ``merge``. When the queue is full, ``overflow`` decides whether
+    the new work is dropped, the oldest waiting work is dropped to make room, or ``put`` waits for a slot.
+    Work for a key is handled by one worker at a time, in the order it was put. With ``yield_to``, workers hold off
+    while interactions are being handled.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[K, T], Awaitable[object]],
+        *,
+        workers: int = 4,
+        maxsize: int = 1000,
+        overflow: OverflowPolicy = "drop_new",
+        merge: Callable[[T, T], T] | None = None,
+        yield_to: InteractionTracker | None = None,
+    ) -> None:
+        self.name = name
+        self.handler = handler
+        self.num_workers = workers
+        self.overflow = overflow
+        self.merge = merge
+        self.yield_to = yield_to
+
+        self._queue: asyncio.Queue[K] = asyncio.Queue(maxsize)
+        self._pending: dict[K, T] = {}
+        # Keys being handled, work for a key is never handled by two workers at once
+        self._active: set[K] = set()
+        self._workers: list[asyncio.Task] = []
+        self._overflowing = False
+        self.closed = False
+
+        self.processed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.high_water = 0
+        queues[name] = self
+        register_size(f"{name}_queue", self._queue.qsize)
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    def close(self) -> None:
+        """Drop any work put from now on, so that stopping only has to finish what is already waiting"""
+        self.closed = True
+
+    async def stop(self, timeout: float = 10.0, grace: float = 2.0) -> dict[K, T]:
+        """
+        Wait up to ``timeout`` seconds for waiting work to be done, then stop the workers.
+
+        Work still waiting after ``timeout`` is not started and is returned instead, so the caller can save it some
+        other way. Work already being handled gets ``grace`` more seconds to finish before it is cancelled.
+        """
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except TimeoutError:
+                logger.warning("Stopping %s queue with %d jobs left", self.name, self._queue.qsize())
+        # Workers skip keys that are no longer pending, leaving only the work in progress
+        left, self._pending = self._pending, {}
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), grace)
+            except TimeoutError:
+                pass
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        return left
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "depth": self._queue.qsize(),
+            "high_water": self.high_water,
+            "processed": self.processed,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+    def _coalesce(self, key: K, item: T) -> bool:
+        if key not in self._pending:
+            return False
+        self._pending[key] = self.merge(self._pending[key], item) if self.merge else item
+        self.coalesced += 1
+        return True
+
+    def _queued(self, key: K, item: T) -> PutResult:
+        self._pending[key] = item
+        self.high_water = max(self.high_water, self._queue.qsize())
+        self._overflowing = False
+        return "queued"
+
+    def _drop(self) -> PutResult:
+        self.dropped += 1
+        if not self._overflowing:
+            logger.warning("%s queue is full, dropping work", self.name)
+            self._overflowing = True
+        return "dropped"
+
+    def put_nowait(self, key: K, item: T) -> PutResult:
+        """Queue work without waiting, so a full ``block`` queue drops the new work"""
+        if self.closed:
+            self.dropped += 1
+            return "dropped"
+        self.start()
+        if self._coalesce(key, item):
+            return "coalesced"
+        if self._queue.full() and self.overflow == "drop_oldest":
+            self._pending.pop(self._queue.get_nowait(), None)
+            self._queue.task_done()
+            self._drop()
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            return self._drop()
+        return self._queued(key, item)
+
+    async def put(self, key: K, item: T) -> PutResult:
+        if self.overflow != "block" or self.closed:
+            return self.put_nowait(key, item)
+        self.start()
+        if self._coalesce(key, item):
+            return "coalesced"
+        await self._queue.put(key)
+        # Work for the key may have been queued while waiting, whichever slot comes first does both
+        if self._coalesce(key, item):
+            return "coalesced"
+        return self._queued(key, item)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                # The worker handling the key also handles work put for it in the meantime, once it is done
+                if key in self._active or key not in self._pending:
+                    continue
+                self._active.add(key)
+                try:
+                    if self.yield_to is not None:
+                        await self.yield_to.wait_idle()
+                    while key in self._pending:
+                        await self._handle(key, self._pending.pop(key))
+                finally:
+                    self._active.discard(key)
+            finally:
+                self._queue.task_done()
+
+    async def _handle(self, key: K, item: T) -> None:
+        try:
+            await self.handler(key, item)
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("%s queue failed to process %s", self.name, key)
@@ -1,19 +1,53 @@
 import asyncio
+import hashlib
+import logging
 import os
+from contextlib import asynccontextmanager
 
+import hikari
 import jwt
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from lightbulb import Client
 from psycopg_pool import AsyncConnectionPool
 from starlette.responses import HTMLResponse
 
-from bot.extensions.verification import UserInfo, add_user_to_db, translations, verify_user
+from bot.extensions.verification_utils.jobs import enqueue_verification
+from bot.extensions.verification_utils.users import UserInfo, add_user_to_db, translations
+from bot.utils import metrics
+from bot.utils.allocations import allocation_tracer
+from bot.utils.caches import LRUCache, register_cache
+from bot.utils.logs import configure_logging
+from bot.utils.pools import open_pool, pool_from_env
+from bot.utils.shutdown import ShutdownCoordinator
+from server.ratelimit import RateLimiter
 
-app = FastAPI()
-client: Client
-db: AsyncConnectionPool
-owner: str
+logger = logging.getLogger(__name__)
+
+db: AsyncConnectionPool | None = None
+owner = os.getenv("OWNER_NAME") or f"the user with Discord ID {os.getenv('OWNER_ID', '0')}"
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """When run by the bot the pool is shared, when run on its own (see __main__.py) each worker opens its own"""
+    global db
+    if db is not None:
+        yield
+        return
+    configure_logging()
+    db = pool_from_env(os.environ["DATABASE_URL"], "SERVER_POOL", min_size=1, max_size=4)
+    metrics.track_pool("server", db)
+    await open_pool(db)
+    try:
+        yield
+    finally:
+        await db.close()
+        db = None
+
+
+app = FastAPI(lifespan=lifespan)
 
 html_template = """
 <html>
@@ -24,30 +58,144 @@ html_template = """
 """
 
 
+# Digest of each token -> the task verifying it, so repeat hits (reloads, link scanners, email previews)
+# share one verification instead of redoing the DB and Discord work. Failures are dropped so they can be retried.
+consumed_tokens: LRUCache[bytes, asyncio.Task[tuple[str, bool]]] = register_cache(
+    "verify_tokens", LRUCache(int(os.getenv("VERIFY_TOKEN_CACHE_SIZE", "10000")))
+)
+rate_limiter = RateLimiter(
+    burst=int(os.getenv("VERIFY_RATE_LIMIT_BURST", "10")),
+    per_minute=float(os.getenv("VERIFY_RATE_LIMIT_PER_MINUTE", "10")),
+)
+register_cache("verify_rate_limits", rate_limiter.buckets)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """Metrics of this process in the Prometheus text format, only with METRICS_TOKEN as a bearer token"""
+    token = os.getenv("METRICS_TOKEN")
+    if not token:
+        return PlainTextResponse("Not Found", status_code=404)
+    if request.headers.get("Authorization") != f"Bearer {token}":
+        return PlainTextResponse("Unauthorized", status_code=401)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def is_admin(request: Request) -> PlainTextResponse | None:
+    """An error response unless the request has ADMIN_TOKEN as a bearer token, admin endpoints don't exist without it"""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        return PlainTextResponse("Not Found", status_code=404)
+    if request.headers.get("Authorization") != f"Bearer {token}":
+        return PlainTextResponse("Unauthorized", status_code=401)
+    return None
+
+
+@app.get("/admin/allocations", response_class=PlainTextResponse)
+async def get_allocations(request: Request, top: int = 10):
+    """Cache sizes and, while tracing, the largest allocation sites and their growth since the last report"""
+    if error := is_admin(request):
+        return error
+    return PlainTextResponse(await asyncio.to_thread(allocation_tracer.report, min(max(top, 1), 100)))
+
+
+@app.post("/admin/allocations/start", response_class=PlainTextResponse)
+async def start_allocations(request: Request, frames: int = 1):
+    if error := is_admin(request):
+        return error
+    allocation_tracer.start(min(max(frames, 1), 50))
+    return PlainTextResponse("Tracing allocations")
+
+
+@app.post("/admin/allocations/stop", response_class=PlainTextResponse)
+async def stop_allocations(request: Request):
+    if error := is_admin(request):
+        return error
+    allocation_tracer.stop()
+    return PlainTextResponse("Stopped tracing allocations")
+
+
 @app.get("/verify/{token}", response_class=HTMLResponse)
-async def verify(token: str):
+async def verify(token: str, request: Request):
+    digest = hashlib.sha256(token.encode()).digest()
+    task = consumed_tokens.get(digest)
+    if task is None:
+        ip = request.client.host if request.client else "unknown"
+        if not rate_limiter.allow(ip):
+            return HTMLResponse(
+                html_template.format("Too many requests, please try again in a minute."),
+                status_code=429,
+            )
+        task = asyncio.create_task(verify_token(token))
+        consumed_tokens[digest] = task
+
+    # Shielded so one client disconnecting doesn't cancel the verification for everyone waiting on it
+    html, ok = await asyncio.shield(task)
+    if not ok:
+        consumed_tokens.pop(digest)
+    return html
+
+
+async def verify_token(token: str) -> tuple[str, bool]:
+    """
+    Returns:
+        (response page, whether verification succeeded)
+    """
+    t = translations["en"]
     try:
-        user_info = UserInfo.from_dict(jwt.decode(token, os.getenv("JWT_TOKEN"), algorithms=["HS256"]))
+        unverified_lang = jwt.decode(token, options={"verify_signature": False}).get("lang")
+        t = translations.get(unverified_lang, t)
+        claims = jwt.decode(token, os.getenv("JWT_TOKEN"), algorithms=["HS256"], options={"require": ["exp"]})
+        user_info = UserInfo.from_dict(claims)
         err = user_info.validate()
         if err is not None:
             raise Exception(f"Malformed user_info: {err}")
-        t = translations[user_info.lang]
+        assert db is not None
         await add_user_to_db(db, user_info)
-        await verify_user(user_info.id, client.rest, user_info.lang)
+        # The bot gives out the roles, so this process never has to talk to Discord
+        await enqueue_verification(db, user_info.id, user_info.lang)
+    except jwt.ExpiredSignatureError:
+        return html_template.format(t["endpoint"]["expired"]), False
     except Exception as e:
-        print(e)
-        return html_template.format(t["endpoint"]["fail"].format(owner=owner))
+        logger.warning("Verification failed: %s", e)
+        return html_template.format(t["endpoint"]["fail"].format(owner=owner)), False
 
-    return html_template.format(t["endpoint"]["success"])
+    return html_template.format(t["endpoint"]["success"]), True
 
 
-async def run_server(local_client: Client, global_db: AsyncConnectionPool):
-    global client
+async def run_server(client: Client, global_db: AsyncConnectionPool, shutdown: ShutdownCoordinator | None = None):
+    """Runs the server inside the bot's event loop, sharing its pool, and stops it before the pool is closed"""
     global db
     global owner
-    client = local_client
     db = global_db
-    owner = "@" + (await client.rest.fetch_user(int(os.getenv("OWNER_ID", "0")))).username
-    config = uvicorn.Config(app, host="0.0.0.0", port=8000)
+    config = uvicorn.Config(
+        app,
+        host=os.getenv("SERVER_HOST", "0.0.0.0"),
+        port=int(os.getenv("SERVER_PORT", "8000")),
+        # Log through the bot's logging setup
+        log_config=None,
+    )
     server = uvicorn.Server(config)
-    asyncio.create_task(server.serve())
+    serving = asyncio.create_task(server.serve())
+
+    if shutdown is not None:
+
+        async def stop_accepting(_: float) -> None:
+            server.should_exit = True
+
+        async def finish_requests(timeout: float) -> None:
+            """Verifications in progress are finished, they write to the pool"""
+            try:
+                await asyncio.wait_for(asyncio.shield(serving), timeout)
+            except TimeoutError:
+                logger.warning("Closing the server with requests in progress")
+                server.force_exit = True
+                await serving
+
+        shutdown.on("intake", "server", stop_accepting)
+        shutdown.on("drain", "server", finish_requests)
+
+    try:
+        owner = "@" + (await client.rest.fetch_user(int(os.getenv("OWNER_ID", "0")))).username
+    except hikari.HTTPError:
+        pass
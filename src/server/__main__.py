@@ -0,0 +1,25 @@
+import os
+from pathlib import Path
+
+import uvicorn
+from dotenv import load_dotenv
+
+from bot.utils.logs import configure_logging
+
+
+def main() -> None:
+    """Runs the verification server on its own, with SERVER_MODE=standalone set for the bot"""
+    load_dotenv(Path(__file__).parent.parent / "bot" / ".env")
+    # Workers are separate processes and set up their own logging when they start, see lifespan in __init__.py
+    configure_logging()
+    uvicorn.run(
+        "server:app",
+        host=os.getenv("SERVER_HOST", "0.0.0.0"),
+        port=int(os.getenv("SERVER_PORT", "8000")),
+        workers=int(os.getenv("SERVER_WORKERS", "2")),
+        log_config=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
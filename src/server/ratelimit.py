@@ -0,0 +1,43 @@
+import time
+from dataclasses import dataclass, field
+
+from bot.utils.caches import LRUCache
+
+
+@dataclass
+class TokenBucket:
+    capacity: float
+    refill_rate: float
+    tokens: float = field(init=False)
+    updated: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter:
+    """
+    Token bucket per key, allowing bursts of ``burst`` requests refilled at ``per_minute`` a minute.
+    Only the most recently seen ``max_keys`` keys are tracked, so memory stays bounded under a flood of IPs.
+    """
+
+    def __init__(self, burst: int, per_minute: float, max_keys: int = 10_000) -> None:
+        self.burst = burst
+        self.refill_rate = per_minute / 60
+        self.buckets: LRUCache[str, TokenBucket] = LRUCache(max_keys)
+
+    def allow(self, key: str) -> bool:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, self.refill_rate)
+            self.buckets[key] = bucket
+        return bucket.take()